@@ -0,0 +1,14 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" fast-start entry point of myshowsru.py
+
+python compiles a script run directly on every start, but imports modules from
+cached bytecode, so this launcher skips compiling myshowsru.py for each command
+"""
+
+from myshowsru import main
+
+if __name__ == "__main__":
+    main()
+
+# vim: ts=4 sw=4
@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+""" myshows.ru api session: login, requests, json data through disk and search caches """
+
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+from myshows_cache import DiskCache
+from myshows_json import load_compact
+from myshows_profile import CountingReader, Profiler
+from myshows_search import DEFAULT_SEARCH, SearchCache
+
+# networking (urllib, http transport) and thread pool modules are imported on first
+# use: commands answered from the cache or the local store should not pay for them
+# pylint: disable=import-outside-toplevel
+
+DEFAULT_WORKERS = 8
+# api data which is the same for all accounts, shared by batch runs
+PUBLIC_KINDS = ('episodes',)
+
+
+def read_config(config_name):
+    """ read json config file """
+    with open(config_name, mode='r', encoding='utf8') as cfg_file:
+        config = json.load(cfg_file)
+        logging.debug('Parsed config file %s result: %s', config_name, config)
+    return config
+
+
+def config_relative(config_name, path):
+    """ return path relative to config file directory """
+    return os.path.join(
+        os.path.dirname(os.path.abspath(config_name)), os.path.expanduser(path)
+    )
+
+
+def read_json(handle, kind, record):
+    """ read and close json response of kind, record its sizes and decoding time """
+    from myshows_http import response_reader
+    start = time.perf_counter()
+    reader = CountingReader(handle)
+    decoded = response_reader(handle, reader)
+    data = load_compact(decoded, kind)
+    handle.close()
+    record['wire_bytes'] = reader.bytes_read
+    record['bytes'] = decoded.bytes_read
+    # decompression is counted as decoding
+    record['decode'] = time.perf_counter() - start - reader.read_time
+    return data
+
+
+class ApiClient:
+    """ api session of config: login, requests with retries, json data loaded
+        through disk cache and coalesced with the same requests in flight
+    """
+    def __init__(self, config_name, workers=None, use_cache=True, offline=False):
+        self.config = read_config(config_name)
+        self.session_path = None
+        if 'session' in self.config:
+            self.session_path = config_relative(config_name, self.config['session'])
+        self.profiler = Profiler()
+        self.workers = max(1, workers or self.config.get('workers', DEFAULT_WORKERS))
+        self.offline = offline
+        self.cache = None
+        if use_cache and 'cache' in self.config:
+            self.cache = DiskCache(
+                config_relative(
+                    config_name, self.config['cache'].get('dir', 'myshows.cache')
+                ),
+                self.config['cache'].get('ttl')
+            )
+        self.search_cache = SearchCache(
+            self.cache, **dict(DEFAULT_SEARCH, **self.config.get('search', {}))
+        )
+        # guards http session creation and login
+        self.lock = threading.RLock()
+        self.http = None
+        # number of logins done
+        self.login_gen_ = 0
+
+    @property
+    def api_url(self):
+        """ api url without path """
+        return '{0}://{1}'.format(
+            self.config.get('api_scheme', 'https'), self.config['api_domain']
+        )
+
+    def init_http(self):
+        """ build http session before the first api request """
+        with self.lock:
+            if self.http is None:
+                from myshows_http import HttpSession
+                self.http = HttpSession(self.config, self.session_path)
+
+    def share_public(self, other):
+        """ use in-flight requests, connection pool and rate limit of other session,
+            for batch runs; return False if it is a session of other api
+        """
+        if self.api_url != other.api_url:
+            logging.debug('%s and %s are different apis', self.api_url, other.api_url)
+            return False
+        other.init_http()
+        from myshows_http import HttpSession
+        with self.lock:
+            self.http = HttpSession(self.config, self.session_path, other.http)
+        return True
+
+    def request(self, url, form=None):
+        """ return request of api url, POST request if form fields are given """
+        import urllib.parse
+        import urllib.request
+        self.init_http()
+        data = None
+        if form is not None:
+            data = urllib.parse.urlencode(form).encode('utf-8')
+        return urllib.request.Request(self.api_url + url, data)
+
+    def do_login(self, stale_gen=None):
+        """ authorization, stale_gen forces re-login if session was not renewed since """
+        with self.lock:
+            if not self.logged() or stale_gen == self.login_gen_:
+                with self.profiler.phase('login'):
+                    self.do_login_locked()
+
+    def logged(self):
+        """ is session logged in or resumed from session file """
+        return self.login_gen_ > 0 or self.http.resumed
+
+    def do_login_locked(self):
+        """ authorization, lock must be held """
+        import urllib.error
+        import urllib.parse
+        from myshows_http import response_reader
+        try:
+            request = self.request(self.config['url']['login'], {
+                'login': self.config['login']['name'],
+                'password': self.config['login']['md5pass']
+            })
+            logging.debug('Login, url: %s, data: %s', request.full_url, request.data)
+            handle = self.http.open(request, self.profiler.request('login'))
+            logging.debug(
+                'Login result: %s/%s', handle.headers,
+                response_reader(handle).read().decode('utf-8')
+            )
+            # do not keep credentials in the cookie jar (and in session file)
+            api_host = urllib.parse.urlsplit(self.api_url).hostname
+            for name in ('SiteUser[login]', 'SiteUser[password]'):
+                try:
+                    self.http.cookie_jar.clear(api_host, '/', name)
+                except KeyError:
+                    pass
+        except urllib.error.HTTPError as ex:
+            if ex.code == 403:
+                sys.stderr.write('Bad login name or password!\n')
+            else:
+                sys.stderr.write('Login error!\n')
+            logging.debug('HTTP error #%s: %s\n', ex.code, ex.read())
+            sys.exit(1)
+        except urllib.error.URLError as ex:
+            sys.stderr.write('Login error!\n')
+            logging.debug('URLError - %s\n', ex.reason)
+            sys.exit(1)
+
+        self.login_gen_ += 1
+        self.http.save()
+
+    def open(self, request, record):
+        """ open api request, login first and once again if session is expired """
+        if self.offline:
+            print('Command needs network, run it without --offline')
+            sys.exit(1)
+        import urllib.error
+        self.init_http()
+        if not self.logged():
+            self.do_login()
+        login_gen = self.login_gen_
+        try:
+            return self.http.open(request, record)
+        except urllib.error.HTTPError as ex:
+            if ex.code not in (401, 403):
+                raise
+            ex.close()
+            logging.debug('Session expired (HTTP error #%s), login again', ex.code)
+
+        self.do_login(stale_gen=login_gen)
+        # drop cookies of the expired session, cookie processor won't replace them
+        request.remove_header('Cookie')
+        return self.http.open(request, record)
+
+    def send(self, url_name, url):
+        """ send api write request of url named url_name """
+        logging.debug('Send %s: %s%s', url_name, self.api_url, url)
+        self.open(self.request(url), self.profiler.request(url_name)).close()
+
+    def sync_stamp(self, kind, show_id, shows_data):
+        """ return show counters of shows data which watched/episodes data of kind
+            depends on, None unless cache is incremental
+        """
+        next_show = shows_data.get(str(show_id))
+        if not (self.cache and self.config['cache'].get('incremental')) or not next_show:
+            return None
+        if kind == 'watched':
+            return [next_show['watchedEpisodes'], next_show['totalEpisodes']]
+        return next_show['totalEpisodes']
+
+    def load_json(self, kind, key, url, revalidate=False, stamp=None):
+        """ load api url as json, through the cache if configured """
+        entry = self.cache.get(kind, key) if self.cache else None
+        if entry and self.cache.fresh(kind, entry, stamp, revalidate):
+            logging.debug('Cache hit %s/%s', kind, key)
+            self.profiler.request(kind, cache='hit')
+            return entry['data']
+
+        self.init_http()
+        # in-flight requests may be shared by sessions of several accounts
+        flight = url if kind in PUBLIC_KINDS else (self.config['login']['name'], url)
+        data, waited = self.http.inflight.run(
+            flight, lambda: self.fetch_json(kind, key, url, entry, stamp)
+        )
+        if waited:
+            logging.debug('Waited for in-flight %s/%s', kind, key)
+            self.profiler.request(kind, cache='coalesced')
+        return data
+
+    def fetch_json(self, kind, key, url, entry, stamp):
+        """ load api url as json, revalidate cache entry """
+        import urllib.error
+        logging.debug('Load %s: %s%s', kind, self.api_url, url)
+        request = self.request(url)
+        if entry:
+            if entry['etag']:
+                request.add_header('If-None-Match', entry['etag'])
+            if entry['modified']:
+                request.add_header('If-Modified-Since', entry['modified'])
+        record = self.profiler.request(kind, cache='miss' if self.cache else 'none')
+        try:
+            handle = self.open(request, record)
+        except urllib.error.HTTPError as ex:
+            if ex.code != 304 or not entry:
+                raise
+            ex.close()
+            logging.debug('Not modified %s/%s', kind, key)
+            record['cache'] = 'revalidated'
+            return self.cache.put(
+                kind, key, entry['data'], (entry['etag'], entry['modified']), stamp
+            )
+
+        data = read_json(handle, kind, record)
+        if kind == 'shows':
+            # every downloaded profile listing goes to the search catalog
+            self.search_cache.add_profile(data)
+        if self.cache:
+            self.cache.put(
+                kind, key, data,
+                (handle.headers.get('ETag'), handle.headers.get('Last-Modified')), stamp
+            )
+        return data
+
+    def search(self, query):
+        """ search show, repeated queries are answered by search cache """
+        if not (self.cache and self.cache.revalidate_all):
+            search_result = self.search_cache.get(query)
+            if search_result is not None:
+                logging.debug('Search cache hit: %s shows', len(search_result))
+                self.profiler.request('search', cache='hit')
+                return search_result
+
+        from myshows_http import response_reader
+        request = self.request(self.config['url']['search'], {'q': query})
+        logging.debug('Search url/data: %s %s', request.full_url, request.data)
+        with self.profiler.phase('search'):
+            record = self.profiler.request('search', cache='miss')
+            handle = self.open(request, record)
+            reader = CountingReader(handle)
+            body = response_reader(handle, reader).read()
+            record['wire_bytes'] = reader.bytes_read
+            record['bytes'] = len(body)
+            # api returns empty list instead of empty object
+            search_result = json.loads(body.decode('utf-8')) or {}
+        logging.debug('Search result: %s shows', len(search_result))
+        self.search_cache.put(query, search_result)
+        return search_result
+
+    def run_parallel(self, items, func):
+        """ run func(item) for all items in parallel, return results in order """
+        items = list(items)
+        if self.workers == 1 or len(items) < 2:
+            return [func(item) for item in items]
+
+        import concurrent.futures
+        logging.debug('Run %s requests with %s workers', len(items), self.workers)
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=min(self.workers, len(items))
+        ) as executor:
+            return list(executor.map(func, items))
+
+    def run_streaming(self, items, func, ordered=True):
+        """ run func(item) for all items in parallel, yield (item, result) as soon as
+            result is ready, in items order if ordered
+        """
+        items = list(items)
+        if self.workers == 1 or len(items) < 2:
+            for item in items:
+                yield item, func(item)
+            return
+
+        import concurrent.futures
+        logging.debug('Stream %s requests with %s workers', len(items), self.workers)
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=min(self.workers, len(items))
+        ) as executor:
+            futures = {executor.submit(func, item): item for item in items}
+            done = futures if ordered else concurrent.futures.as_completed(futures)
+            for future in done:
+                yield futures[future], future.result()
+
+# vim: ts=4 sw=4
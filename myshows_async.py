@@ -0,0 +1,457 @@
+# -*- coding: utf-8 -*-
+""" asyncio client of myshows.ru api for bots and web services """
+
+import asyncio
+import http.client
+import http.cookiejar
+import io
+import json
+import logging
+import os
+import ssl
+import time
+import urllib.parse
+import urllib.request
+
+from myshows_api import PUBLIC_KINDS, config_relative, read_config
+from myshows_http import (
+    ACCEPT_ENCODING, DEFAULT_IDLE_TIMEOUT, DEFAULT_POOL_SIZE, DEFAULT_RATE, DEFAULT_RETRY,
+    IDEMPOTENT_METHODS, RETRY_CODES, DeadlineExceeded, TokenBucket, WrittenRequestFailed,
+    content_decoder, retry_delay
+)
+from myshows_json import load_compact
+
+# body bytes read from connection per decompression step
+READ_CHUNK = 64 * 1024
+
+
+class ApiError(Exception):
+    """ failed api request, status is http status code or None on network error """
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class LoginError(ApiError):
+    """ login name or password is rejected """
+
+
+class Response:
+    """ http response with decompressed body """
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def info(self):
+        """ return headers, for cookie jar """
+        return self.headers
+
+
+async def body_chunks(reader, headers):
+    """ yield body chunks of chunked or Content-Length response, up to eof otherwise """
+    if headers.get('Transfer-Encoding', '').lower() == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';', 1)[0], 16)
+            if size == 0:
+                # skip trailer
+                while (await reader.readline()).strip():
+                    pass
+                return
+            yield await reader.readexactly(size)
+            await reader.readexactly(2)
+    elif headers.get('Content-Length') is not None:
+        left = int(headers['Content-Length'])
+        while left > 0:
+            chunk = await reader.read(min(left, READ_CHUNK))
+            if not chunk:
+                raise asyncio.IncompleteReadError(b'', left)
+            left -= len(chunk)
+            yield chunk
+    else:
+        while True:
+            chunk = await reader.read(READ_CHUNK)
+            if not chunk:
+                return
+            yield chunk
+
+
+async def read_head(reader):
+    """ read status line and headers, return (http version, status, headers) """
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('connection closed')
+    version, status = status_line.decode('latin-1').split(None, 2)[:2]
+    lines = []
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        lines.append(line)
+    return version, int(status), http.client.parse_headers(
+        io.BytesIO(b''.join(lines) + b'\r\n')
+    )
+
+
+async def read_response(reader, method):
+    """ read response, return (response, True if connection can be reused) """
+    version, status, headers = await read_head(reader)
+    while status < 200:
+        # interim response (100 Continue etc.) has no body, final one follows
+        logging.debug('Interim response %s', status)
+        version, status, headers = await read_head(reader)
+    keep_alive = version == 'HTTP/1.1' and headers.get('Connection', '').lower() != 'close'
+
+    body = bytearray()
+    if method != 'HEAD' and status not in (204, 304):
+        if headers.get('Content-Length') is None and \
+                headers.get('Transfer-Encoding', '').lower() != 'chunked':
+            keep_alive = False
+        decoder = content_decoder(headers.get('Content-Encoding'))
+        async for chunk in body_chunks(reader, headers):
+            body += decoder.decompress(chunk) if decoder else chunk
+        if decoder:
+            body += decoder.flush()
+    return Response(status, headers, bytes(body)), keep_alive
+
+
+class AsyncConnectionPool:
+    """ keep-alive connections per (scheme, host), at most size open to a host """
+    def __init__(self, size=DEFAULT_POOL_SIZE, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.ssl_context = ssl.create_default_context()
+        self.idle = {}
+        self.slots = {}
+
+    def slot(self, scheme, host):
+        """ return semaphore of connections to host, held while connection is used """
+        return self.slots.setdefault((scheme, host), asyncio.Semaphore(self.size))
+
+    async def acquire(self, scheme, host):
+        """ return (reader, writer, reused) """
+        now = time.monotonic()
+        idle = self.idle.get((scheme, host), [])
+        while idle:
+            reader, writer, last_used = idle.pop()
+            if now - last_used < self.idle_timeout and not reader.at_eof():
+                logging.debug('Reuse connection to %s://%s', scheme, host)
+                return reader, writer, True
+            writer.close()
+
+        logging.debug('New connection to %s://%s', scheme, host)
+        address = urllib.parse.urlsplit(f'{scheme}://{host}')
+        reader, writer = await asyncio.open_connection(
+            address.hostname, address.port or (443 if scheme == 'https' else 80),
+            ssl=self.ssl_context if scheme == 'https' else None
+        )
+        return reader, writer, False
+
+    def release(self, scheme, host, reader, writer):
+        """ return connection to the pool """
+        self.idle.setdefault((scheme, host), []).append((reader, writer, time.monotonic()))
+
+    def close(self):
+        """ close all idle connections """
+        for idle in self.idle.values():
+            for _, writer, _ in idle:
+                writer.close()
+        self.idle.clear()
+
+
+class AsyncMyShowsRu:
+    """ asyncio client of api.myshows.ru: loading and writing methods of MyShowsRu
+        as coroutines sharing one cookie session, failures raise ApiError;
+        clients of many users may share connections and rate limit (share_public)
+    """
+    def __init__(self, config_name, config=None):
+        self.config_name = config_name
+        self.config = read_config(config_name) if config is None else config
+
+        self.api_url = '{0}://{1}'.format(
+            self.config.get('api_scheme', 'https'), self.config['api_domain']
+        )
+        if 'session' in self.config:
+            self.cookie_jar = http.cookiejar.LWPCookieJar(
+                config_relative(config_name, self.config['session'])
+            )
+            try:
+                self.cookie_jar.load(ignore_discard=True)
+            except (OSError, http.cookiejar.LoadError) as ex:
+                logging.debug('Cannot load session: %s', ex)
+        else:
+            self.cookie_jar = http.cookiejar.CookieJar()
+        self.logged_ = len(self.cookie_jar) > 0
+        self.login_lock_ = asyncio.Lock()
+        self.login_gen_ = 0
+        pool_config = self.config.get('pool', {})
+        self.pool = AsyncConnectionPool(**{
+            name: pool_config[name] for name in ('size', 'idle_timeout') if name in pool_config
+        })
+        self.rate_limit = TokenBucket(**dict(DEFAULT_RATE, **self.config.get('rate', {})))
+        self.retry = dict(DEFAULT_RETRY, **self.config.get('retry', {}))
+        self.inflight_ = {}
+        self.list_loaded_ = False
+        self.shows_data = {}
+        self.episodes_data = {}
+        self.watched_data = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """ close idle connections """
+        self.pool.close()
+
+    def share_public(self, other):
+        """ use public episode data, its in-flight requests, connection pool
+            and rate limit of other client of the same api
+        """
+        if self.api_url != other.api_url:
+            logging.debug('%s and %s use different api', self.config_name, other.config_name)
+            return
+        self.pool = other.pool
+        self.rate_limit = other.rate_limit
+        self.episodes_data = other.episodes_data
+        self.inflight_ = other.inflight_
+
+    def api_request(self, url, form=None):
+        """ return request of api url, POST request if form fields are given """
+        data = None
+        if form is not None:
+            data = urllib.parse.urlencode(form).encode('utf-8')
+        return urllib.request.Request(self.api_url + url, data)
+
+    async def send(self, request, timeout):
+        """ send request over pooled connection, resend it if reused one was closed
+            before the request was written or if the request is idempotent
+        """
+        scheme, host = request.type, request.host
+        self.cookie_jar.add_cookie_header(request)
+        headers = {name.title(): value for name, value in request.header_items()}
+        headers.update({
+            'Host': host, 'Connection': 'keep-alive', 'Accept-Encoding': ACCEPT_ENCODING,
+        })
+        if request.data is not None:
+            headers.setdefault('Content-Type', 'application/x-www-form-urlencoded')
+            headers['Content-Length'] = str(len(request.data))
+        method = request.get_method()
+        message = ''.join(
+            [f'{method} {request.selector} HTTP/1.1\r\n']
+            + [f'{name}: {value}\r\n' for name, value in headers.items()]
+            + ['\r\n']
+        ).encode('latin-1') + (request.data or b'')
+
+        async with self.pool.slot(scheme, host):
+            while True:
+                reader, writer, reused = await asyncio.wait_for(
+                    self.pool.acquire(scheme, host), timeout
+                )
+                written = False
+                try:
+                    writer.write(message)
+                    await asyncio.wait_for(writer.drain(), timeout)
+                    written = True
+                    response, keep_alive = await asyncio.wait_for(
+                        read_response(reader, method), timeout
+                    )
+                    break
+                except (ConnectionError, asyncio.IncompleteReadError) as ex:
+                    writer.close()
+                    if written and method not in IDEMPOTENT_METHODS:
+                        raise WrittenRequestFailed(ex) from ex
+                    if not reused:
+                        raise
+                    logging.debug('Reused connection to %s failed: %s', host, ex)
+                except BaseException:
+                    writer.close()
+                    raise
+            if keep_alive:
+                self.pool.release(scheme, host, reader, writer)
+            else:
+                writer.close()
+
+        self.cookie_jar.extract_cookies(response, request)
+        return response
+
+    async def timed_open(self, request):
+        """ send request within rate limit and deadline, retry transient errors,
+            return response with status < 400
+        """
+        deadline = time.monotonic() + self.retry['deadline']
+        attempt = 0
+        while True:
+            try:
+                wait = self.rate_limit.take(deadline)
+                while wait:
+                    await asyncio.sleep(wait)
+                    wait = self.rate_limit.take(deadline)
+            except DeadlineExceeded as ex:
+                raise ApiError(f'{request.full_url}: {ex.reason}') from ex
+            retry_after = None
+            try:
+                response = await self.send(request, max(0.1, deadline - time.monotonic()))
+            except WrittenRequestFailed as ex:
+                # server may have got the request already, it is not sent again
+                raise ApiError(f'{request.full_url}: {ex.reason!r}') from ex
+            except (OSError, EOFError, ValueError) as ex:
+                # timeouts, connection errors, bad responses
+                if attempt >= self.retry['count']:
+                    raise ApiError(f'{request.full_url}: {ex!r}') from ex
+                logging.debug('Request error - %r, retry %s', ex, request.full_url)
+            else:
+                if response.status < 400:
+                    return response
+                if response.status not in RETRY_CODES or attempt >= self.retry['count']:
+                    raise ApiError(
+                        f'{request.full_url}: HTTP error #{response.status}', response.status
+                    )
+                retry_after = response.headers.get('Retry-After')
+                logging.debug('HTTP error #%s, retry %s', response.status, request.full_url)
+
+            delay = retry_delay(
+                attempt, retry_after, self.retry['backoff'], self.retry['max_backoff']
+            )
+            if time.monotonic() + delay > deadline:
+                raise ApiError(f'Request deadline exceeded: {request.full_url}')
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def do_login(self, stale_gen=None):
+        """ authorization, stale_gen forces re-login if session was not renewed since """
+        async with self.login_lock_:
+            if self.logged_ and stale_gen != self.login_gen_:
+                return
+            request = self.api_request(self.config['url']['login'], {
+                'login': self.config['login']['name'],
+                'password': self.config['login']['md5pass']
+            })
+            try:
+                await self.timed_open(request)
+            except ApiError as ex:
+                if ex.status == 403:
+                    raise LoginError('Bad login name or password', ex.status) from ex
+                raise
+            # do not keep credentials in the cookie jar (and in session file)
+            api_host = urllib.parse.urlsplit(self.api_url).hostname
+            for name in ('SiteUser[login]', 'SiteUser[password]'):
+                try:
+                    self.cookie_jar.clear(api_host, '/', name)
+                except KeyError:
+                    pass
+
+            self.logged_ = True
+            self.login_gen_ += 1
+            if 'session' in self.config:
+                self.cookie_jar.save(ignore_discard=True)
+                os.chmod(self.cookie_jar.filename, 0o600)
+
+    async def api_open(self, request):
+        """ send api request, login first and once again if session is expired """
+        if not self.logged_:
+            await self.do_login()
+        login_gen = self.login_gen_
+        try:
+            return await self.timed_open(request)
+        except ApiError as ex:
+            if ex.status not in (401, 403):
+                raise
+            logging.debug('Session expired (HTTP error #%s), login again', ex.status)
+
+        await self.do_login(stale_gen=login_gen)
+        # drop cookies of the expired session, cookie jar won't replace them
+        request.remove_header('Cookie')
+        return await self.timed_open(request)
+
+    async def load_json(self, kind, url):
+        """ load api url as json, concurrent loads of the same url share one request """
+        # clients of several users may be made from one config file
+        flight = url if kind in PUBLIC_KINDS else (self.config['login']['name'], url)
+        future = self.inflight_.get(flight)
+        if future is not None:
+            logging.debug('Wait for in-flight %s', url)
+            return await asyncio.shield(future)
+
+        future = self.inflight_[flight] = asyncio.get_running_loop().create_future()
+        try:
+            logging.debug('Load %s: %s%s', kind, self.api_url, url)
+            response = await self.api_open(self.api_request(url))
+            data = load_compact(io.BytesIO(response.body), kind)
+            future.set_result(data)
+            return data
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as ex:
+            future.set_exception(ex)
+            # exception is raised here, there may be no waiters to retrieve it
+            future.exception()
+            raise
+        finally:
+            del self.inflight_[flight]
+
+    async def load_shows(self):
+        """ load user shows """
+        if not self.list_loaded_:
+            self.shows_data = await self.load_json('shows', self.config['url']['list_shows'])
+            self.list_loaded_ = True
+        return self.shows_data
+
+    async def load_episodes(self, show_id):
+        """ load episode data by show id """
+        show_id = str(show_id)
+        if show_id not in self.episodes_data:
+            self.episodes_data[show_id] = await self.load_json(
+                'episodes', self.config['url']['list_episodes'].format(show_id)
+            )
+        return self.episodes_data[show_id]
+
+    async def load_watched(self, show_id):
+        """ load watched data by show id """
+        show_id = str(show_id)
+        if show_id not in self.watched_data:
+            self.watched_data[show_id] = await self.load_json(
+                'watched', self.config['url']['list_watched'].format(show_id)
+            )
+        return self.watched_data[show_id]
+
+    async def search_show(self, query):
+        """ search show """
+        request = self.api_request(self.config['url']['search'], {'q': query})
+        response = await self.api_open(request)
+        # api returns empty list instead of empty object
+        return json.loads(response.body.decode('utf-8')) or {}
+
+    async def set_episode_check(self, show_id, epi_ids, check):
+        """ check or uncheck episodes of show id as watched concurrently,
+            return {episode id: True or ApiError}
+        """
+        url_name = 'check_episode' if check else 'uncheck_episode'
+
+        async def set_check(epi_id):
+            url = self.config['url'][url_name].format(epi_id)
+            logging.debug('Set %s: %s%s', url_name, self.api_url, url)
+            await self.api_open(self.api_request(url))
+            return True
+
+        results = await asyncio.gather(
+            *(set_check(epi_id) for epi_id in epi_ids), return_exceptions=True
+        )
+        self.watched_data.pop(str(show_id), None)
+        self.list_loaded_ = False
+        for result in results:
+            if isinstance(result, BaseException) and not isinstance(result, ApiError):
+                raise result
+        return dict(zip(epi_ids, results))
+
+    async def set_status(self, show_id, status):
+        """ set status of show by id """
+        url = self.config['url']['status'].format(show_id, status)
+        logging.debug('Set show status: %s%s', self.api_url, url)
+        await self.api_open(self.api_request(url))
+        self.list_loaded_ = False
+
+# vim: ts=4 sw=4
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+""" one command run for accounts of several configs concurrently in one process """
+
+import concurrent.futures
+import io
+import json
+import sys
+
+from myshows_output import ThreadStdout
+
+
+def share_sessions(sessions):
+    """ let sessions use public episode data, in-flight requests, connection pool
+        and rate limit of the first session of the same api
+    """
+    for myshows in sessions[1:]:
+        if myshows.api.share_public(sessions[0].api):
+            myshows.episodes_data = sessions[0].episodes_data
+
+
+def run_batch(cmd_args, sessions, run_command):
+    """ run command by run_command(session, cmd_args, account) for sessions concurrently;
+        print output of each account in sessions order, return exit code
+    """
+    share_sessions(sessions)
+    stdout = ThreadStdout(sys.stdout)
+
+    def run_account(myshows):
+        output = io.StringIO()
+        stdout.redirect(output)
+        code = 0
+        try:
+            with myshows.api.profiler.phase('command'):
+                run_command(myshows, cmd_args, myshows.config_name)
+        except SystemExit as ex:
+            # exit of one account (login error etc.) ends its command only
+            if ex.code is None or isinstance(ex.code, int):
+                code, message = ex.code or 0, ''
+            else:
+                code, message = 1, f': {ex.code}'
+            if code:
+                sys.stderr.write(f'[{myshows.config_name}] exit code {code}{message}\n')
+        finally:
+            stdout.redirect(None)
+        return code, output.getvalue()
+
+    code = 0
+    csv_header = False
+    sys.stdout = stdout
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(sessions)) as executor:
+            for myshows, (account_code, output) in zip(
+                sessions, executor.map(run_account, sessions)
+            ):
+                code = max(code, account_code)
+                if cmd_args.format == 'text':
+                    output = f'[{myshows.config_name}]\n{output}\n'
+                elif cmd_args.format == 'csv' and output:
+                    # the same command gives the same columns, keep the first header
+                    if csv_header:
+                        output = output.split('\n', 1)[1]
+                    csv_header = True
+                stdout.default.write(output)
+                stdout.default.flush()
+                if cmd_args.profile:
+                    print(f'\n[{myshows.config_name}]', file=sys.stderr)
+                    myshows.api.profiler.print_table(sys.stderr)
+    finally:
+        sys.stdout = stdout.default
+        if cmd_args.profile_json:
+            write_profiles(cmd_args.profile_json, sessions)
+    return code
+
+
+def write_profiles(file_name, sessions):
+    """ write profiler reports of sessions as json object keyed by config """
+    with open(file_name, mode='w', encoding='utf8') as out:
+        json.dump({
+            myshows.config_name: myshows.api.profiler.summary() for myshows in sessions
+        }, out, indent=2)
+
+# vim: ts=4 sw=4
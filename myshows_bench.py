@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" myshowsru.py benchmark against a local stand-in of the myshows.ru api """
+
+import argparse
+import contextlib
+import datetime
+import hashlib
+import http.server
+import json
+import logging
+import os
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPT = os.path.join(SCRIPT_DIR, 'myshowsru.py')
+LAUNCHER = os.path.join(SCRIPT_DIR, 'myshows.py')
+DIST_CONFIG = os.path.join(SCRIPT_DIR, 'myshows.cfg.dist')
+SESSION_COOKIE = 'PHPSESSID'
+
+DEFAULT_COMMANDS = [
+    'list all', 'list {alias}', 'last month', 'last {alias}', 'next {alias}',
+    'search show', 'check {alias} s01e01', 'uncheck {alias} s01e01',
+]
+# commands answered from fresh cache, measured by --startup
+STARTUP_COMMANDS = ['next {alias}', 'last {alias}', 'list {alias}']
+DEFAULT_STARTUP_BUDGET = 50
+RE_IMPORT_TIME = re.compile(r'^import time:\s+(\d+) \|\s+\d+ \| +(\S+)$')
+
+
+def generate_library(shows, episodes, watched_ratio, history_days, seed):
+    """ return (profile shows, {show id: episodes}, {show id: watched}) """
+    rnd = random.Random(seed)
+    today = datetime.date.today()
+    profile, all_episodes, all_watched = {}, {}, {}
+    epi_id = 1000000
+    for show_num in range(1, shows + 1):
+        show_id = str(show_num)
+        title = f'Show {show_num:05d}'
+        start = today - datetime.timedelta(days=rnd.randint(0, history_days) + 7 * episodes)
+        epis = {}
+        for seq in range(1, episodes + 1):
+            epi_id += 1
+            season, number = divmod(seq - 1, 20)
+            epis[str(epi_id)] = {
+                'id': epi_id, 'title': f'Episode {seq}',
+                'shortName': f's{season + 1:02d}e{number + 1:02d}',
+                'seasonNumber': season + 1, 'episodeNumber': number + 1, 'sequenceNumber': seq,
+                'airDate': (start + datetime.timedelta(days=7 * seq)).strftime('%d.%m.%Y'),
+                'airDateUTC': '', 'image': f'https://media.example/{epi_id}.jpg',
+                'productionNumber': '', 'commentsCount': rnd.randint(0, 500),
+            }
+        watched_count = 0
+        if watched_ratio:
+            watched_count = min(episodes, int(episodes * watched_ratio * rnd.random() * 2))
+        watched = {}
+        for key in list(epis)[:watched_count]:
+            watch_date = today - datetime.timedelta(days=rnd.randint(0, history_days))
+            watched[key] = {
+                'id': int(key), 'watchDate': watch_date.strftime('%d.%m.%Y'), 'rating': None
+            }
+        all_episodes[show_id] = {
+            'id': show_num, 'title': title, 'ruTitle': title, 'status': 'Returning Series',
+            'started': 'Jan/01/2010', 'ended': None, 'year': 2010, 'episodes': epis,
+        }
+        # api returns empty list instead of empty object
+        all_watched[show_id] = watched or []
+        profile[show_id] = {
+            'showId': show_num, 'title': title, 'ruTitle': title, 'runtime': 45,
+            'showStatus': 'Returning Series',
+            'watchStatus': rnd.choice(['watching', 'later', 'finished', 'cancelled']),
+            'watchedEpisodes': watched_count, 'totalEpisodes': episodes,
+            'rating': rnd.randint(0, 5), 'image': f'https://media.example/s{show_num}.jpg',
+        }
+    return profile, all_episodes, all_watched
+
+
+class MockApi(http.server.ThreadingHTTPServer):
+    """ api stand-in serving a synthetic library on localhost """
+    daemon_threads = True
+
+    def __init__(self, urls, library, latency):
+        super().__init__(('127.0.0.1', 0), MockApiHandler)
+        self.profile, self.episodes, self.watched = library
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.bytes_sent = 0
+        self.routes = [
+            (
+                re.compile('^' + re.escape(url).replace(r'\{0\}', '([^/]+)')
+                           .replace(r'\{1\}', '([^/]+)') + '$'),
+                name
+            )
+            for name, url in urls.items()
+        ]
+
+    def route(self, path):
+        """ return (url name, args) for path """
+        for url_re, name in self.routes:
+            re_m = url_re.match(path)
+            if re_m:
+                return name, re_m.groups()
+        return None, ()
+
+    def count(self, sent):
+        """ count served request """
+        with self.lock:
+            self.requests += 1
+            self.bytes_sent += sent
+
+
+class MockApiHandler(http.server.BaseHTTPRequestHandler):
+    """ request handler of MockApi """
+    protocol_version = 'HTTP/1.1'
+    # send headers and body at once
+    wbufsize = -1
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        logging.debug('Mock api: ' + format, *args)
+
+    def send_body(self, code, body=b'', headers=()):
+        """ send response """
+        self.send_response(code)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.count(len(body))
+
+    def send_json(self, data):
+        """ send json response with etag, 304 if client has it """
+        body = json.dumps(data).encode('utf-8')
+        etag = '"' + hashlib.md5(body).hexdigest() + '"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_body(304, headers=[('ETag', etag)])
+        else:
+            self.send_body(
+                200, body, [('Content-Type', 'application/json'), ('ETag', etag)]
+            )
+
+    def handle_api(self, body):
+        """ serve api request """
+        time.sleep(self.server.latency)
+        name, args = self.server.route(urllib.parse.urlsplit(self.path).path)
+        if name == 'login':
+            self.send_body(200, b'', [
+                ('Set-Cookie', f'{SESSION_COOKIE}=mock{random.random()}; Path=/'),
+                ('Set-Cookie', 'SiteUser[login]=demo; Path=/'),
+                ('Set-Cookie', 'SiteUser[password]=demo; Path=/'),
+            ])
+            return
+        if name == 'search':
+            query = urllib.parse.parse_qs(body.decode('utf-8')).get('q', [''])[0].lower()
+            self.send_json({
+                show_id: {'id': int(show_id), 'title': show['title'], 'started': 'Jan/01/2010'}
+                for show_id, show in self.server.profile.items()
+                if query in show['title'].lower()
+            })
+            return
+        if name is None:
+            self.send_body(404)
+        elif self.path.startswith('/profile') and \
+                SESSION_COOKIE not in self.headers.get('Cookie', ''):
+            self.send_body(401)
+        elif name == 'list_shows':
+            self.send_json(self.server.profile)
+        elif name == 'list_episodes' and args[0] in self.server.episodes:
+            self.send_json(self.server.episodes[args[0]])
+        elif name == 'list_watched' and args[0] in self.server.watched:
+            self.send_json(self.server.watched[args[0]])
+        elif name in ('check_episode', 'uncheck_episode', 'status'):
+            self.send_json({})
+        else:
+            self.send_body(404)
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """ GET request """
+        self.handle_api(b'')
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """ POST request """
+        self.handle_api(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+
+
+def run_command(config_name, command, extra_args, script=SCRIPT, python_args=()):
+    """ run myshowsru.py command, return (wall time, peak rss in KiB, exit code, stderr) """
+    argv = [sys.executable, *python_args, script, '--config', config_name] + \
+        extra_args + command.split()
+    start = time.perf_counter()
+    # pylint: disable=consider-using-with
+    proc = subprocess.Popen(argv, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    stderr = proc.stderr.read()
+    _, status, rusage = os.wait4(proc.pid, 0)
+    wall = time.perf_counter() - start
+    proc.stderr.close()
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return wall, rusage.ru_maxrss, proc.returncode, stderr.decode('utf-8', 'replace')
+
+
+def import_times(stderr):
+    """ return total import time and [(self time, module)] slowest first, s """
+    modules = []
+    for line in stderr.splitlines():
+        re_m = RE_IMPORT_TIME.match(line)
+        if re_m:
+            modules.append((int(re_m.group(1)) / 1e6, re_m.group(2)))
+    return sum(self_time for self_time, _ in modules), sorted(modules, reverse=True)
+
+
+@contextlib.contextmanager
+def bench_config(cmd_args, config_keys):
+    """ start mock api, yield (server, config file name) of config using it """
+    with open(DIST_CONFIG, mode='r', encoding='utf8') as cfg_file:
+        dist = json.load(cfg_file)
+    library = generate_library(
+        cmd_args.shows, cmd_args.episodes, cmd_args.watched, cmd_args.history, cmd_args.seed
+    )
+    server = MockApi(dist['url'], library, cmd_args.latency / 1000)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        config = {
+            'api_scheme': 'http',
+            'api_domain': '{0}:{1}'.format(*server.server_address),
+            'login': dist['login'],
+            'url': dist['url'],
+            'alias': {'bench': library[0]['1']['title']},
+        }
+        for name in config_keys:
+            if name in dist:
+                config[name] = dist[name]
+        config_name = os.path.join(work_dir, 'myshows.cfg')
+        with open(config_name, mode='w', encoding='utf8') as cfg_file:
+            json.dump(config, cfg_file)
+        try:
+            yield server, config_name
+        finally:
+            server.shutdown()
+
+
+def benchmark(cmd_args):
+    """ run benchmark, return result rows """
+    rows = []
+    with bench_config(cmd_args, cmd_args.config_keys) as (server, config_name):
+        for command in cmd_args.command or DEFAULT_COMMANDS:
+            command = command.format(alias='bench')
+            walls, rss, requests, sent = [], [], [], []
+            for _ in range(cmd_args.repeat):
+                requests_before, sent_before = server.requests, server.bytes_sent
+                wall, max_rss, code, _ = run_command(
+                    config_name, command, cmd_args.args.split()
+                )
+                if code != 0:
+                    logging.warning('"%s" exited with code %s', command, code)
+                walls.append(wall)
+                rss.append(max_rss)
+                requests.append(server.requests - requests_before)
+                sent.append(server.bytes_sent - sent_before)
+            rows.append({
+                'command': command,
+                'wall_min': min(walls), 'wall_median': statistics.median(walls),
+                'requests': requests, 'bytes': sent, 'peak_rss_kib': max(rss),
+            })
+    return rows
+
+
+def startup(cmd_args):
+    """ run startup benchmark of commands answered from fresh cache,
+        return (bare interpreter start time, result rows)
+    """
+    python_walls = []
+    for _ in range(cmd_args.repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', 'pass'], check=True)
+        python_walls.append(time.perf_counter() - start)
+
+    rows = []
+    with bench_config(cmd_args, cmd_args.config_keys + ['cache']) as (server, config_name):
+        for command in cmd_args.command or STARTUP_COMMANDS:
+            command = command.format(alias='bench')
+            extra_args = cmd_args.args.split()
+            # warm up the cache and bytecode of modules
+            run_command(config_name, command, extra_args, LAUNCHER)
+            requests_before = server.requests
+            walls = []
+            for _ in range(cmd_args.repeat):
+                wall, _, code, _ = run_command(config_name, command, extra_args, LAUNCHER)
+                if code != 0:
+                    logging.warning('"%s" exited with code %s', command, code)
+                walls.append(wall)
+            requests = server.requests - requests_before
+            _, _, _, stderr = run_command(
+                config_name, command, extra_args, LAUNCHER, ['-X', 'importtime']
+            )
+            imports, top = import_times(stderr)
+            rows.append({
+                'command': command,
+                'wall_min': min(walls), 'wall_median': statistics.median(walls),
+                'requests': requests, 'imports': imports, 'top_imports': top[:5],
+            })
+    return min(python_walls), rows
+
+
+def print_startup(cmd_args, python_wall, rows):
+    """ print startup benchmark result, exit with code 1 if budget is exceeded """
+    slow = [row['command'] for row in rows if row['wall_min'] * 1000 > cmd_args.budget]
+    if cmd_args.json:
+        print(json.dumps({'python': python_wall, 'commands': rows}, indent=2))
+    else:
+        print(f'python -c pass: {python_wall * 1000:.1f} ms, budget: {cmd_args.budget:g} ms\n')
+        print(f'{"command":<20} {"min, ms":>8} {"median, ms":>11} {"imports, ms":>12} '
+              f'{"requests":>9}  slowest imports, ms')
+        for row in rows:
+            top = ', '.join(
+                f'{name} {self_time * 1000:.1f}' for self_time, name in row['top_imports']
+            )
+            print(f'{row["command"]:<20} {row["wall_min"] * 1000:8.1f} '
+                  f'{row["wall_median"] * 1000:11.1f} {row["imports"] * 1000:12.1f} '
+                  f'{row["requests"]:9d}  {top}')
+    if slow:
+        logging.error('Start time over budget: %s', ', '.join(slow))
+        sys.exit(1)
+
+
+def main():
+    """ main subroutine """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--shows', type=int, default=200, help='shows in library')
+    parser.add_argument('--episodes', type=int, default=100, help='episodes per show')
+    parser.add_argument(
+        '--watched', type=float, default=0.5, help='mean watched part of episodes'
+    )
+    parser.add_argument('--history', type=int, default=365, help='watch history days')
+    parser.add_argument('--latency', type=float, default=50, help='api latency, ms')
+    parser.add_argument('--seed', type=int, default=1, help='library random seed')
+    parser.add_argument('--repeat', type=int, default=3, help='runs of each command')
+    parser.add_argument(
+        '--command', action='append',
+        help='command to run, {alias} is a show alias (default: all commands)'
+    )
+    parser.add_argument(
+        '--args', default='', help='extra myshowsru.py arguments, "--workers 1" for example'
+    )
+    parser.add_argument(
+        '--config-key', action='append', dest='config_keys', default=[],
+        help='copy key from myshows.cfg.dist to bench config ("cache", "pool" etc.)'
+    )
+    parser.add_argument(
+        '--startup', action='store_true',
+        help='measure start time and imports of commands answered from fresh cache'
+    )
+    parser.add_argument(
+        '--budget', type=float, default=DEFAULT_STARTUP_BUDGET,
+        help='--startup fails if a command starts slower, ms (default: %(default)s)'
+    )
+    parser.add_argument('--json', action='store_true', help='print results as json')
+    parser.add_argument(
+        '--debug', action='store_const', const=logging.DEBUG, default=logging.WARNING,
+        help='debug output'
+    )
+    cmd_args = parser.parse_args()
+    logging.basicConfig(level=cmd_args.debug, format='%(levelname)s: %(message)s')
+
+    if cmd_args.startup:
+        print_startup(cmd_args, *startup(cmd_args))
+        return
+
+    rows = benchmark(cmd_args)
+    if cmd_args.json:
+        print(json.dumps(rows, indent=2))
+        return
+
+    print(f'{"command":<28} {"min, s":>8} {"median, s":>10} {"requests":>9} '
+          f'{"KiB sent":>9} {"peak RSS, KiB":>14}')
+    for row in rows:
+        print(f'{row["command"]:<28} {row["wall_min"]:8.3f} {row["wall_median"]:10.3f} '
+              f'{max(row["requests"]):9d} {max(row["bytes"]) // 1024:9d} '
+              f'{row["peak_rss_kib"]:14d}')
+
+
+if __name__ == "__main__":
+    main()
+
+# vim: ts=4 sw=4
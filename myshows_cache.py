@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+""" persistent on-disk cache for myshows.ru api data """
+
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+DEFAULT_TTL = {
+    'shows': 300,
+    'watched': 300,
+    'episodes': 24 * 3600,
+    # episode lists of finished shows never change
+    'ended': 30 * 24 * 3600,
+}
+ENDED_STATUSES = ('Canceled/Ended', 'Ended', 'Canceled')
+
+
+class DiskCache:
+    """ json files cache: <dir>/<kind>/<key>.json with per-kind ttl """
+    def __init__(self, cache_dir, ttl=None):
+        self.cache_dir = cache_dir
+        self.ttl = dict(DEFAULT_TTL)
+        self.ttl.update(ttl or {})
+        self.revalidate_all = False
+
+    def _path(self, kind, key):
+        """ return path of cache file of key of kind """
+        return os.path.join(self.cache_dir, kind, f'{key}.json')
+
+    def get(self, kind, key):
+        """ return cache entry or None """
+        try:
+            with open(self._path(kind, key), mode='r', encoding='utf8') as cache_file:
+                return json.load(cache_file)
+        except (OSError, ValueError):
+            return None
+
+    def fresh(self, kind, entry, stamp=None, revalidate=False):
+        """ is entry still fresh by stamp of source data or by kind ttl """
+        if self.revalidate_all:
+            return False
+        if stamp is not None and entry.get('stamp') == stamp:
+            return True
+        if revalidate:
+            return False
+        ttl = self.ttl.get(kind, 0)
+        if kind == 'episodes' and entry['data'].get('status') in ENDED_STATUSES:
+            ttl = max(ttl, self.ttl['ended'])
+        return time.time() - entry['stored'] < ttl
+
+    def put(self, kind, key, data, validators=(None, None), stamp=None):
+        """ store data with validators - (ETag, Last-Modified) of response
+            and stamp of source data, return data
+        """
+        etag, modified = validators
+        entry = {
+            'stored': time.time(),
+            'etag': etag,
+            'modified': modified,
+            'stamp': stamp,
+            'data': data,
+        }
+        path = self._path(kind, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write to temp file and rename, parallel fetches may store same key
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, mode='w', encoding='utf8') as tmp_file:
+            json.dump(entry, tmp_file)
+        os.replace(tmp_path, path)
+        logging.debug('Cached %s/%s', kind, key)
+        return data
+
+    def invalidate(self, kind=None, key=None):
+        """ drop key of kind, whole kind or whole cache """
+        logging.debug('Invalidate cache %s/%s', kind, key)
+        if kind is None:
+            shutil.rmtree(self.cache_dir, ignore_errors=True)
+        elif key is None:
+            shutil.rmtree(os.path.join(self.cache_dir, kind), ignore_errors=True)
+        else:
+            try:
+                os.remove(self._path(kind, key))
+            except FileNotFoundError:
+                pass
+
+# vim: ts=4 sw=4
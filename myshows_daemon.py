@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+""" myshows.ru daemon: warm MyShowsRu instance behind a unix domain socket """
+
+import contextlib
+import io
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import sys
+import threading
+
+# journal (sqlite) is imported by refresh only, forwarding clients should not load it
+# pylint: disable=import-outside-toplevel
+
+
+def send_message(sock, message):
+    """ send one json message line """
+    sock.sendall(json.dumps(message).encode('utf-8') + b'\n')
+
+
+def recv_message(sock_file):
+    """ receive one json message line """
+    line = sock_file.readline()
+    if not line:
+        raise ConnectionError('connection closed')
+    return json.loads(line.decode('utf-8'))
+
+
+def fetch_fresh(myshows):
+    """ load current shows and watched lists of session, bypassing cache freshness """
+    api = myshows.api
+    url = myshows.config['url']
+    shows_data = api.load_json('shows', 'all', url['list_shows'], revalidate=True)
+    show_ids = [
+        show_id for show_id in shows_data if shows_data[show_id]['watchedEpisodes'] > 0
+    ]
+    watched = api.run_parallel(
+        show_ids,
+        lambda show_id: api.load_json(
+            'watched', show_id, url['list_watched'].format(show_id), revalidate=True,
+            stamp=api.sync_stamp('watched', show_id, shows_data)
+        )
+    )
+    return shows_data, dict(zip(show_ids, watched))
+
+
+def replace_data(myshows, shows_data, watched_data):
+    """ replace loaded data of session by fetch_fresh() result, pending journal
+        checks are applied over the fresh watched lists
+    """
+    for show_id, next_show in shows_data.items():
+        old_show = myshows.shows_data.get(show_id)
+        if old_show and old_show['totalEpisodes'] != next_show['totalEpisodes']:
+            myshows.episodes_data.pop(show_id, None)
+    myshows.shows_data = shows_data
+    myshows.list_loaded_ = True
+    myshows.watched_data = {
+        show_id: myshows.local.pending_watched(show_id, watched)
+        for show_id, watched in watched_data.items()
+    }
+
+
+def forward(socket_path, argv):
+    """ run command on daemon, return (exit code, output) or None if no daemon;
+        argv None asks daemon to reload its data
+    """
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(socket_path)
+            send_message(sock, {'argv': argv} if argv is not None else {'reload': True})
+            with sock.makefile('rb') as sock_file:
+                reply = recv_message(sock_file)
+    except (OSError, ValueError) as ex:
+        logging.debug('Cannot forward to daemon %s: %s', socket_path, ex)
+        return None
+
+    return reply['code'], reply['output']
+
+
+class CommandHandler(socketserver.StreamRequestHandler):
+    """ run one forwarded command """
+    def handle(self):
+        try:
+            request = recv_message(self.rfile)
+        except (ConnectionError, ValueError) as ex:
+            logging.debug('Bad daemon request: %s', ex)
+            return
+        if request.get('reload'):
+            code, output = self.server.reload()
+        else:
+            code, output = self.server.run(request['argv'])
+        send_message(self.connection, {'code': code, 'output': output})
+
+
+class Daemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """ serve commands of a warm MyShowsRu instance, refresh its data periodically """
+    daemon_threads = True
+
+    def __init__(self, socket_path, myshows, run_argv, refresh_interval):
+        self.myshows = myshows
+        self.run_argv = run_argv
+        self.refresh_interval = refresh_interval
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        remove_stale_socket(socket_path)
+        old_umask = os.umask(0o077)
+        try:
+            super().__init__(socket_path, CommandHandler)
+        finally:
+            os.umask(old_umask)
+
+    def run(self, argv):
+        """ run command line, return (exit code, captured output) """
+        logging.info('Daemon command: %s', argv)
+        output = io.StringIO()
+        code = 0
+        with self.lock, contextlib.redirect_stdout(output), \
+                contextlib.redirect_stderr(output):
+            try:
+                self.run_argv(self.myshows, argv)
+            except SystemExit as ex:
+                code = ex.code if isinstance(ex.code, int) else 1
+            except Exception:  # pylint: disable=broad-except
+                logging.exception('Daemon command %s failed', argv)
+                code = 1
+        return code, output.getvalue()
+
+    def reload(self):
+        """ drop loaded shows and watched data written by a command run outside
+            of daemon, return (exit code, output)
+        """
+        logging.info('Daemon reload')
+        with self.lock:
+            self.myshows.invalidate('shows')
+            self.myshows.invalidate('watched')
+        return 0, ''
+
+    def refresh_loop(self):
+        """ flush journal and reload data every refresh_interval seconds """
+        while not self.stopped.wait(self.refresh_interval):
+            if self.myshows.local.journal:
+                from myshows_journal import flush_journal
+                try:
+                    # refreshed data below includes flushed writes
+                    sent, collapsed, failed = flush_journal(self.myshows, invalidate=False)
+                    if sent or collapsed or failed:
+                        logging.info(
+                            'Daemon journal flushed: %s sent, %s collapsed, %s failed',
+                            sent, collapsed, failed
+                        )
+                except (Exception, SystemExit):  # pylint: disable=broad-except
+                    # login exits on network errors, writes are kept for the next flush
+                    logging.exception('Daemon journal flush failed')
+            try:
+                shows_data, watched_data = fetch_fresh(self.myshows)
+            except Exception:  # pylint: disable=broad-except
+                logging.exception('Daemon refresh failed')
+                continue
+            with self.lock:
+                replace_data(self.myshows, shows_data, watched_data)
+            logging.info('Daemon data refreshed')
+
+    def serve(self):
+        """ load data and serve until interrupted """
+        self.myshows.load_shows()
+        refresh_thread = threading.Thread(target=self.refresh_loop, daemon=True)
+        refresh_thread.start()
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        logging.info('Daemon is listening on %s', self.server_address)
+        try:
+            self.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stopped.set()
+            self.server_close()
+            os.remove(self.server_address)
+
+
+def remove_stale_socket(socket_path):
+    """ remove socket left by dead daemon, fail if daemon is alive """
+    if not os.path.exists(socket_path):
+        return
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(socket_path)
+        except OSError:
+            os.remove(socket_path)
+            return
+    raise OSError(f'Daemon is already running on {socket_path}')
+
+# vim: ts=4 sw=4
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+""" forwarding of command lines to the serve daemon of config """
+
+import logging
+import os
+
+from myshows_api import config_relative, read_config
+
+# daemon client is imported only if daemon socket exists
+# pylint: disable=import-outside-toplevel
+
+# commands answered by daemon, see serve command
+FORWARD_COMMANDS = ('list_alias', 'last_alias', 'next_alias', 'search_alias')
+# writes sent through daemon, so that its loaded data stays current
+WRITE_COMMANDS = ('check_alias', 'uncheck_alias', 'status_alias')
+
+
+def daemon_socket(config_name, socket_path=None):
+    """ return daemon socket path from command line or config or None """
+    if socket_path is None:
+        socket_path = read_config(config_name).get('socket')
+        if socket_path:
+            socket_path = config_relative(config_name, socket_path)
+    return socket_path
+
+
+def fast_forward(argv, config_name):
+    """ forward plain "<command> <alias>" command line to daemon without building parser,
+        return daemon reply or None if command line has other options or daemon is not running;
+        config_name is the default config
+    """
+    options = {'--config': config_name, '--socket': None}
+    args = list(argv)
+    given = set()
+    while len(args) > 2 and args[0] in options and args[0] not in given:
+        name, value = args[:2]
+        del args[:2]
+        given.add(name)
+        options[name] = value
+    if len(args) != 2 or f'{args[0]}_alias' not in FORWARD_COMMANDS or args[1].startswith('-'):
+        return None
+    try:
+        socket_path = daemon_socket(options['--config'], options['--socket'])
+    except (OSError, ValueError):
+        return None
+    if not socket_path or not os.path.exists(socket_path):
+        return None
+    from myshows_daemon import forward
+    return forward(socket_path, argv)
+
+
+def client_options(cmd_args):
+    """ return True if command line has options which daemon would not apply:
+        cache, network, parallelism, profiling and logging ones
+    """
+    return (
+        cmd_args.refresh or not cmd_args.use_cache or cmd_args.offline
+        or cmd_args.workers is not None or cmd_args.profile or cmd_args.profile_json
+        or cmd_args.debug != logging.ERROR
+    )
+
+
+def forward_command(cmd_args, socket_path, argv):
+    """ forward parsed command line to daemon, return daemon reply or None
+        if command is not served by daemon, it has client options or daemon
+        is not running
+    """
+    if not socket_path or not any(
+            name in cmd_args for name in FORWARD_COMMANDS + WRITE_COMMANDS
+    ) or client_options(cmd_args):
+        return None
+    from myshows_daemon import forward
+    return forward(socket_path, argv)
+
+
+def notify_written(cmd_args, socket_path):
+    """ ask running daemon to reload its data after write command run without it """
+    if socket_path and any(name in cmd_args for name in WRITE_COMMANDS) \
+            and os.path.exists(socket_path):
+        from myshows_daemon import forward
+        forward(socket_path, None)
+
+# vim: ts=4 sw=4
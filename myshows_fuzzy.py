@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+""" fuzzy matching of show aliases and titles by trigram index and edit distance """
+
+import json
+import logging
+import re
+import zlib
+
+RE_NON_WORD = re.compile(r'[\W_]+')
+# lowest score of a match resolved without asking
+MIN_SCORE = 0.5
+# best match must score this much more than the next title to be resolved
+MIN_MARGIN = 0.1
+# names of up to this many characters are also matched by edit distance: a typo
+# changes too large part of their few trigrams
+SHORT_NAME = 6
+
+
+def normalize(name):
+    """ return lower case name with words separated by single spaces, padded by spaces """
+    return ' ' + RE_NON_WORD.sub(' ', name.lower()).strip() + ' '
+
+
+def trigrams(name):
+    """ return set of trigrams of normalized name """
+    norm = normalize(name)
+    return {norm[pos:pos + 3] for pos in range(len(norm) - 2)}
+
+
+def edit_distance(first, second):
+    """ return optimal string alignment distance: insertions, deletions,
+        substitutions and transpositions of adjacent characters
+    """
+    before = prev = list(range(len(second) + 1))
+    for i, char in enumerate(first, 1):
+        row = [i]
+        for j, other in enumerate(second, 1):
+            row.append(min(prev[j] + 1, row[j - 1] + 1, prev[j - 1] + (char != other)))
+            if i > 1 and j > 1 and char == second[j - 2] and first[i - 2] == other:
+                row[j] = min(row[j], before[j - 2] + 1)
+        before, prev = prev, row
+    return prev[-1]
+
+
+def edit_score(first, second):
+    """ return 1 - edit distance of normalized names scaled by the longest of them """
+    first, second = normalize(first).strip(), normalize(second).strip()
+    longest = max(len(first), len(second))
+    return 1 - edit_distance(first, second) / longest if longest else 0
+
+
+def checksum(data):
+    """ return checksum of json data """
+    return zlib.crc32(json.dumps(data, sort_keys=True).encode('utf-8'))
+
+
+def source_stamp(shows_data, aliases):
+    """ return [shows checksum, aliases checksum] of data the index is built from """
+    return [
+        checksum({
+            show_id: [show['title'], show.get('ruTitle')]
+            for show_id, show in shows_data.items()
+        }),
+        checksum(aliases),
+    ]
+
+
+class TitleIndex:
+    """ trigram index of names (aliases, titles, russian titles) of shows,
+        entry i is names[i] of show titles[i] with profile id show_ids[i] or None
+    """
+    __slots__ = ('names', 'titles', 'show_ids', 'sizes', 'postings')
+
+    def __init__(self, names, titles, show_ids, postings=None, sizes=None):
+        self.names = names
+        self.titles = titles
+        self.show_ids = show_ids
+        if postings is None or sizes is None:
+            postings, sizes = {}, []
+            for entry, name in enumerate(names):
+                grams = trigrams(name)
+                sizes.append(len(grams))
+                for gram in grams:
+                    postings.setdefault(gram, []).append(entry)
+        self.sizes = sizes
+        self.postings = postings
+
+    @classmethod
+    def build(cls, shows_data, aliases):
+        """ build index of profile shows and config alias map """
+        ids_by_title = {show['title']: show_id for show_id, show in shows_data.items()}
+        names, titles, show_ids = [], [], []
+        for alias, title in aliases.items():
+            for name in (alias, title):
+                names.append(name)
+                titles.append(title)
+                show_ids.append(ids_by_title.get(title))
+        for show_id, show in shows_data.items():
+            for name in dict.fromkeys((show['title'], show.get('ruTitle') or show['title'])):
+                names.append(name)
+                titles.append(show['title'])
+                show_ids.append(show_id)
+        return cls(names, titles, show_ids)
+
+    @classmethod
+    def from_json(cls, data):
+        """ load index saved by to_json """
+        return cls(
+            data['names'], data['titles'], data['show_ids'],
+            data['postings'], data.get('sizes')
+        )
+
+    def to_json(self):
+        """ return index as json data """
+        return {
+            'names': self.names, 'titles': self.titles,
+            'show_ids': self.show_ids, 'postings': self.postings, 'sizes': self.sizes,
+        }
+
+    def search(self, query, limit=5):
+        """ return [(score, title, show id)] of best matching shows, best first;
+            score is Dice coefficient of query and name trigram sets, or edit
+            score of short query and name if it is higher
+        """
+        grams = trigrams(query)
+        common = {}
+        for gram in grams:
+            for entry in self.postings.get(gram, ()):
+                common[entry] = common.get(entry, 0) + 1
+
+        scores = {
+            entry: 2 * count / (len(grams) + self.sizes[entry])
+            for entry, count in common.items()
+        }
+        # padded name has as many trigrams as characters, less repeated ones
+        if len(grams) <= SHORT_NAME:
+            for entry, size in enumerate(self.sizes):
+                if size <= SHORT_NAME:
+                    score = edit_score(query, self.names[entry])
+                    if score > scores.get(entry, 0):
+                        scores[entry] = score
+
+        best = {}
+        for entry, score in scores.items():
+            title = self.titles[entry]
+            if title not in best or score > best[title][0]:
+                best[title] = (score, title, self.show_ids[entry])
+        return sorted(best.values(), key=lambda match: (-match[0], match[1]))[:limit]
+
+    def resolve(self, query):
+        """ return (score, title, show id) of the only good match or None """
+        matches = self.search(query, 2)
+        if not matches or matches[0][0] < MIN_SCORE:
+            return None
+        if len(matches) > 1 and matches[0][0] - matches[1][0] < MIN_MARGIN:
+            return None
+        return matches[0]
+
+
+def cached_index(cache, shows_data, aliases):
+    """ return index of shows and aliases, reuse the one persisted in disk cache
+        if it is current
+    """
+    stamp = source_stamp(shows_data, aliases)
+    if not cache:
+        return TitleIndex.build(shows_data, aliases)
+
+    entry = cache.get('index', 'titles')
+    if entry is not None and entry['stamp'] == stamp:
+        return TitleIndex.from_json(entry['data'])
+    index = TitleIndex.build(shows_data, aliases)
+    cache.put('index', 'titles', index.to_json(), stamp=stamp)
+    logging.debug('Built title index of %s names', len(index.names))
+    return index
+
+
+def persisted_index(cache, aliases):
+    """ return index persisted in disk cache if it was built with current aliases,
+        else None
+    """
+    entry = cache.get('index', 'titles') if cache else None
+    if entry is not None and entry['stamp'][1] == source_stamp({}, aliases)[1]:
+        return TitleIndex.from_json(entry['data'])
+    return None
+
+# vim: ts=4 sw=4
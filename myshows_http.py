@@ -0,0 +1,451 @@
+# -*- coding: utf-8 -*-
+""" http transport for myshows.ru api: pooled connections, rate limit, retries, compression """
+
+import concurrent.futures
+import email.utils
+import http.client
+import http.cookiejar
+import logging
+import os
+import random
+import ssl
+import threading
+import time
+import urllib.error
+import urllib.request
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DEFAULT_POOL_SIZE = 8
+DEFAULT_IDLE_TIMEOUT = 30
+DEFAULT_RATE = {'per_second': 20, 'burst': 40}
+DEFAULT_RETRY = {'count': 4, 'backoff': 0.5, 'max_backoff': 30, 'deadline': 60}
+RETRY_CODES = (429, 500, 502, 503, 504)
+# requests which may be resent when a reused connection fails after they were written
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# unread response body up to this size is read out on close to reuse connection
+DRAIN_LIMIT = 64 * 1024
+ACCEPT_ENCODING = 'gzip, deflate' + (', br' if brotli else '')
+# compressed bytes read from response per decompression step
+DECODE_CHUNK = 16 * 1024
+
+
+class DeadlineExceeded(urllib.error.URLError):
+    """ request cannot be done before its deadline: by rate limit or retry delays """
+
+
+class WrittenRequestFailed(urllib.error.URLError):
+    """ connection failed after non-idempotent request was written: server may have got
+        the request, it is not sent again
+    """
+
+
+class PooledResponse(http.client.HTTPResponse):
+    """ response which returns its connection to the pool after the body is read """
+    pool_conn = None
+    pool_release = None
+
+    def attach(self, conn, pool_release):
+        """ bind response to its pooled connection and callback returning it to pool """
+        self.pool_conn = conn
+        self.pool_release = pool_release
+
+    def release(self):
+        """ return connection to the pool, once """
+        pool_release, self.pool_release = self.pool_release, None
+        if pool_release:
+            pool_release()
+
+    def discard(self):
+        """ close connection instead of returning it to the pool """
+        self.pool_release = None
+        if self.pool_conn is not None:
+            self.pool_conn.close()
+
+    def _close_conn(self):
+        super()._close_conn()
+        self.release()
+
+    def close(self):
+        if self.fp is not None and self.pool_release:
+            if self.length is not None and self.length <= DRAIN_LIMIT:
+                # read to the end, _close_conn() releases connection
+                self.read()
+            else:
+                self.discard()
+        super().close()
+
+
+class ConnectionPool:
+    """ idle keep-alive connections per (scheme, host) """
+    def __init__(self, size=DEFAULT_POOL_SIZE, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.ssl_context = ssl.create_default_context()
+        self.lock = threading.Lock()
+        self.idle = {}
+
+    def acquire(self, scheme, host, timeout):
+        """ return (connection, reused) """
+        now = time.monotonic()
+        with self.lock:
+            idle = self.idle.get((scheme, host), [])
+            while idle:
+                conn, last_used = idle.pop()
+                if now - last_used < self.idle_timeout:
+                    logging.debug('Reuse connection to %s://%s', scheme, host)
+                    return conn, True
+                conn.close()
+
+        logging.debug('New connection to %s://%s', scheme, host)
+        if scheme == 'https':
+            conn = http.client.HTTPSConnection(
+                host, timeout=timeout, context=self.ssl_context
+            )
+        else:
+            conn = http.client.HTTPConnection(host, timeout=timeout)
+        conn.response_class = PooledResponse
+        return conn, False
+
+    def release(self, scheme, host, conn):
+        """ return connection to the pool or close it if pool is full """
+        if conn.sock is None:
+            # server asked to close connection
+            return
+        with self.lock:
+            idle = self.idle.setdefault((scheme, host), [])
+            if len(idle) < self.size:
+                idle.append((conn, time.monotonic()))
+                return
+        conn.close()
+
+    def close(self):
+        """ close all idle connections """
+        with self.lock:
+            for idle in self.idle.values():
+                for conn, _ in idle:
+                    conn.close()
+            self.idle.clear()
+
+
+class TokenBucket:
+    """ token bucket rate limiter shared by request threads """
+    def __init__(self, per_second, burst):
+        self.per_second = per_second
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self, deadline):
+        """ take a token, return 0 or time to wait for the next one;
+            raise DeadlineExceeded if it is not available before deadline
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated) * self.per_second
+            )
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            wait = (1 - self.tokens) / self.per_second
+        if now + wait > deadline:
+            raise DeadlineExceeded('rate limit wait exceeds request deadline')
+        return wait
+
+    def acquire(self, deadline):
+        """ wait for a token, raise DeadlineExceeded if none is available before deadline """
+        while True:
+            wait = self.take(deadline)
+            if not wait:
+                return
+            time.sleep(wait)
+
+
+def retry_delay(attempt, retry_after, backoff, max_backoff):
+    """ return jittered exponential backoff delay, at least Retry-After header value """
+    delay = random.uniform(0, min(max_backoff, backoff * 2 ** attempt))
+    if not retry_after:
+        return delay
+    try:
+        return max(delay, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return delay
+    return max(delay, retry_at.timestamp() - time.time())
+
+
+class DeflateDecoder:
+    """ decompressor of deflate content encoding: zlib stream or, from some servers, raw
+        deflate data
+    """
+    def __init__(self):
+        self.decoder = zlib.decompressobj()
+        self.started = False
+
+    def decompress(self, data):
+        """ return decompressed data of next chunk """
+        if not self.started:
+            self.started = True
+            try:
+                return self.decoder.decompress(data)
+            except zlib.error:
+                self.decoder = zlib.decompressobj(-zlib.MAX_WBITS)
+        return self.decoder.decompress(data)
+
+    def flush(self):
+        """ return rest of decompressed data """
+        return self.decoder.flush()
+
+
+class BrotliDecoder:
+    """ decompressor of br content encoding """
+    def __init__(self):
+        self.decoder = brotli.Decompressor()
+
+    def decompress(self, data):
+        """ return decompressed data of next chunk """
+        return self.decoder.process(data)
+
+    def flush(self):
+        """ brotli decompressor keeps no output back """
+        return b''
+
+
+def content_decoder(encoding):
+    """ return decompressor of content encoding or None for identity """
+    encoding = (encoding or 'identity').strip().lower()
+    if encoding in ('gzip', 'x-gzip'):
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if encoding == 'deflate':
+        return DeflateDecoder()
+    if encoding == 'br' and brotli:
+        return BrotliDecoder()
+    if encoding == 'identity':
+        return None
+    raise urllib.error.URLError(f'unsupported content encoding {encoding}')
+
+
+class DecodingReader:
+    """ byte stream wrapper decompressing response body incrementally,
+        counts decompressed bytes
+    """
+    def __init__(self, stream, encoding):
+        self.stream = stream
+        self.decoder = content_decoder(encoding)
+        self.buffer = bytearray()
+        self.eof = False
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        """ read decompressed data, up to size bytes if size is not negative """
+        if self.decoder is None:
+            # http response reads to connection close on read(-1)
+            data = self.stream.read() if size < 0 else self.stream.read(size)
+        else:
+            while not self.eof and (size < 0 or len(self.buffer) < size):
+                chunk = self.stream.read(DECODE_CHUNK)
+                if chunk:
+                    self.buffer += self.decoder.decompress(chunk)
+                else:
+                    self.buffer += self.decoder.flush()
+                    self.eof = True
+            if size < 0:
+                size = len(self.buffer)
+            data = bytes(self.buffer[:size])
+            del self.buffer[:size]
+        self.bytes_read += len(data)
+        return data
+
+
+def response_reader(response, stream=None):
+    """ return decompressing reader of response body, read from stream wrapping it if given """
+    return DecodingReader(
+        response if stream is None else stream, response.headers.get('Content-Encoding')
+    )
+
+
+class KeepAliveHandler(urllib.request.HTTPHandler, urllib.request.HTTPSHandler):
+    """ urllib handler sending http/https requests over pooled connections """
+    def __init__(self, pool):
+        super().__init__()
+        self.pool = pool
+
+    def http_open(self, req):
+        return self.pool_open('http', req)
+
+    def https_open(self, req):
+        return self.pool_open('https', req)
+
+    def pool_open(self, scheme, req):
+        """ send request over pooled connection, resend it if reused one was closed
+            before the request was written or if the request is idempotent
+        """
+        host = req.host
+        if not host:
+            raise urllib.error.URLError('no host given')
+
+        headers = dict(req.unredirected_hdrs)
+        headers.update({k: v for k, v in req.headers.items() if k not in headers})
+        headers['Connection'] = 'keep-alive'
+        headers.setdefault('Accept-Encoding', ACCEPT_ENCODING)
+        headers = {name.title(): val for name, val in headers.items()}
+
+        method = req.get_method()
+        reused = True
+        while reused:
+            conn, reused = self.pool.acquire(scheme, host, req.timeout)
+            if reused and conn.sock is not None:
+                conn.sock.settimeout(req.timeout)
+            written = False
+            try:
+                conn.request(method, req.selector, req.data, headers)
+                written = True
+                resp = conn.getresponse()
+                break
+            except (OSError, http.client.HTTPException) as ex:
+                conn.close()
+                if written and method not in IDEMPOTENT_METHODS:
+                    raise WrittenRequestFailed(ex) from ex
+                if not reused:
+                    raise urllib.error.URLError(ex) from ex
+                logging.debug('Reused connection to %s failed: %s', host, ex)
+
+        resp.attach(conn, lambda: self.pool.release(scheme, host, conn))
+        resp.url = req.get_full_url()
+        resp.msg = resp.reason
+        return resp
+
+
+class InflightRequests:
+    """ requests being sent by threads, a request which is already in flight
+        is waited for instead of being sent again
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.futures = {}
+
+    def run(self, key, send):
+        """ return (result of send() or of the request of key in flight, True if waited) """
+        with self.lock:
+            future = self.futures.get(key)
+            waited = future is not None
+            if not waited:
+                future = self.futures[key] = concurrent.futures.Future()
+        if waited:
+            try:
+                return future.result(), True
+            except SystemExit:
+                # sending session exited (failed login etc.), the request itself
+                # did not fail: send it in this session, which may be of other account
+                logging.debug('In-flight request %s exited, send it again', key)
+                return send(), False
+
+        try:
+            result = send()
+            future.set_result(result)
+            return result, False
+        except BaseException as ex:
+            future.set_exception(ex)
+            raise
+        finally:
+            with self.lock:
+                del self.futures[key]
+
+
+class HttpSession:
+    """ cookie session over pooled keep-alive connections with rate limit and retries;
+        connection pool, rate limit and in-flight requests of shared session are used
+        by sessions of other accounts of the same api in batch runs
+    """
+    def __init__(self, config, session_path=None, shared=None):
+        self.session_path = session_path
+        self.retry = dict(DEFAULT_RETRY, **config.get('retry', {}))
+        if shared is None:
+            pool_config = config.get('pool', {})
+            self.pool = ConnectionPool(**{
+                name: pool_config[name]
+                for name in ('size', 'idle_timeout') if name in pool_config
+            })
+            self.rate_limit = TokenBucket(**dict(DEFAULT_RATE, **config.get('rate', {})))
+            self.inflight = InflightRequests()
+        else:
+            self.pool = shared.pool
+            self.rate_limit = shared.rate_limit
+            self.inflight = shared.inflight
+
+        # saved session cookies are loaded, login may be skipped
+        self.resumed = False
+        if session_path:
+            self.cookie_jar = http.cookiejar.LWPCookieJar(session_path)
+            try:
+                self.cookie_jar.load(ignore_discard=True)
+                self.resumed = len(self.cookie_jar) > 0
+                logging.debug('Loaded session cookies: %s', len(self.cookie_jar))
+            except (OSError, http.cookiejar.LoadError) as ex:
+                logging.debug('Cannot load session: %s', ex)
+        else:
+            self.cookie_jar = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(self.cookie_jar), KeepAliveHandler(self.pool)
+        )
+
+    def save(self):
+        """ save session cookies to session file if it is set """
+        if self.session_path:
+            self.cookie_jar.save(ignore_discard=True)
+            os.chmod(self.session_path, 0o600)
+
+    def open(self, request, record):
+        """ open request within rate limit and deadline, retry transient errors;
+            record gets status, latency and number of retries
+        """
+        deadline = time.monotonic() + self.retry['deadline']
+        attempt = 0
+        while True:
+            self.rate_limit.acquire(deadline)
+            start = time.perf_counter()
+            retry_after = None
+            try:
+                handle = self.opener.open(
+                    request, timeout=max(0.1, deadline - time.monotonic())
+                )
+                record['status'] = handle.status
+                return handle
+            except urllib.error.HTTPError as ex:
+                record['status'] = ex.code
+                if ex.code not in RETRY_CODES or attempt >= self.retry['count']:
+                    raise
+                retry_after = ex.headers.get('Retry-After')
+                ex.close()
+                logging.debug('HTTP error #%s, retry %s', ex.code, request.full_url)
+            except WrittenRequestFailed as ex:
+                record['status'] = str(ex.reason)
+                raise
+            except urllib.error.URLError as ex:
+                record['status'] = str(ex.reason)
+                if attempt >= self.retry['count']:
+                    raise
+                logging.debug('URLError - %s, retry %s', ex.reason, request.full_url)
+            finally:
+                record['latency'] = record.get('latency', 0.0) + time.perf_counter() - start
+
+            delay = retry_delay(
+                attempt, retry_after, self.retry['backoff'], self.retry['max_backoff']
+            )
+            if time.monotonic() + delay > deadline:
+                raise DeadlineExceeded(f'request deadline exceeded: {request.full_url}')
+            attempt += 1
+            record['retries'] = attempt
+            time.sleep(delay)
+
+# vim: ts=4 sw=4
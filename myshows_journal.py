@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+""" durable journal of pending api writes: episode checks and show statuses """
+
+import functools
+import logging
+import sqlite3
+import sys
+import threading
+import time
+
+# http transport is imported by flush only
+# pylint: disable=import-outside-toplevel
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS pending (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    target TEXT NOT NULL,
+    show_id TEXT NOT NULL,
+    value TEXT NOT NULL,
+    prior TEXT,
+    created REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS pending_target ON pending (kind, target);
+'''
+# kind "check": target is episode id, value and prior (server state when recorded)
+# are "1" for checked, "0" for unchecked; kind "status": target is show id
+CHECKED = {True: '1', False: '0'}
+# writes replayed before the batch progress is saved
+JOURNAL_BATCH = 32
+
+
+class WriteJournal:
+    """ sqlite table of writes recorded by commands and replayed by flush """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        """ close database """
+        self.conn.close()
+
+    def add(self, kind, target, show_id, value, prior=None):
+        """ record write of value to target """
+        with self.lock, self.conn:
+            self.conn.execute(
+                'INSERT INTO pending (kind, target, show_id, value, prior, created)'
+                ' VALUES (?, ?, ?, ?, ?, ?)',
+                (kind, str(target), str(show_id), value, prior, time.time())
+            )
+
+    def add_check(self, epi_id, show_id, check, prior):
+        """ record check or uncheck of episode, prior is its watched state on server """
+        self.add('check', epi_id, show_id, CHECKED[check], CHECKED[prior])
+
+    def checks(self, show_id):
+        """ return {episode id: (checked, time recorded)} of the latest pending checks
+            of show
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT target, value, created FROM pending"
+                " WHERE kind = 'check' AND show_id = ? ORDER BY seq", (str(show_id),)
+            ).fetchall()
+        return {epi_id: (value == CHECKED[True], created) for epi_id, value, created in rows}
+
+    def show_changes(self):
+        """ return {show id: [change of watched episodes count, status or None]}
+            of the latest pending writes
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                'SELECT kind, target, show_id, value, prior FROM pending ORDER BY seq'
+            ).fetchall()
+        first_prior = {}
+        latest = {}
+        for kind, target, show_id, value, prior in rows:
+            first_prior.setdefault((kind, target), prior)
+            latest[(kind, target)] = (show_id, value)
+        changes = {}
+        for key, (show_id, value) in latest.items():
+            change = changes.setdefault(show_id, [0, None])
+            if key[0] == 'status':
+                change[1] = value
+            elif first_prior[key] != value:
+                change[0] += 1 if value == CHECKED[True] else -1
+        return changes
+
+    def count(self):
+        """ return number of pending writes """
+        with self.lock:
+            return self.conn.execute('SELECT COUNT(*) FROM pending').fetchone()[0]
+
+    def collapse(self):
+        """ keep only the latest write of every target, drop checks which restore
+            the state recorded before the first of them;
+            return ([(seq, kind, target, show id, value)] in order, number dropped)
+        """
+        with self.lock, self.conn:
+            rows = self.conn.execute(
+                'SELECT seq, kind, target, show_id, value, prior FROM pending ORDER BY seq'
+            ).fetchall()
+            first_prior = {}
+            latest = {}
+            for seq, kind, target, show_id, value, prior in rows:
+                first_prior.setdefault((kind, target), prior)
+                latest[(kind, target)] = (seq, kind, target, show_id, value)
+            writes = sorted(
+                (
+                    write for key, write in latest.items()
+                    if first_prior[key] is None or first_prior[key] != write[4]
+                ),
+                key=lambda write: write[0]
+            )
+            keep = {write[0] for write in writes}
+            dropped = [(seq,) for seq, *_ in rows if seq not in keep]
+            self.conn.executemany('DELETE FROM pending WHERE seq = ?', dropped)
+        logging.debug('Journal: %s writes, %s collapsed', len(writes), len(dropped))
+        return writes, len(dropped)
+
+    def done(self, seqs):
+        """ remove replayed writes """
+        with self.lock, self.conn:
+            self.conn.executemany(
+                'DELETE FROM pending WHERE seq = ?', ((seq,) for seq in seqs)
+            )
+
+    def failed(self, errors):
+        """ keep failed writes for the next flush, errors - {seq: error} """
+        with self.lock, self.conn:
+            self.conn.executemany(
+                'UPDATE pending SET attempts = attempts + 1, error = ? WHERE seq = ?',
+                ((error, seq) for seq, error in errors.items())
+            )
+
+
+def replay_write(api, write):
+    """ send journal write by api client, return None or (error, True if it is permanent);
+        writes set state, so retrying one which may have been applied is safe
+    """
+    import urllib.error
+    from myshows_http import RETRY_CODES
+    _, kind, target, _, value = write
+    if kind == 'check':
+        url_name = 'check_episode' if value == CHECKED[True] else 'uncheck_episode'
+        url = api.config['url'][url_name].format(target)
+    else:
+        url_name = 'status'
+        url = api.config['url']['status'].format(target, value)
+    try:
+        api.send(url_name, url)
+    except urllib.error.HTTPError as ex:
+        return str(ex), ex.code not in RETRY_CODES
+    except OSError as ex:
+        return str(ex), False
+    return None
+
+
+def replay_batch(myshows, batch, sent):
+    """ replay batch of journal writes, add sent ones to sent list and remove them
+        from journal, drop permanently failed ones; return number of failed
+    """
+    journal = myshows.local.journal
+    errors = {}
+    failed = 0
+    results = myshows.api.run_parallel(batch, functools.partial(replay_write, myshows.api))
+    for write, result in zip(batch, results):
+        if result is None:
+            sent.append(write)
+            continue
+        failed += 1
+        error, permanent = result
+        logging.debug('Journal write %s failed: %s', write, error)
+        if permanent:
+            print(f'Dropped {write[1]} {write[4]} of {write[2]}: {error}')
+        else:
+            errors[write[0]] = error
+    journal.done([write[0] for write in batch if write[0] not in errors])
+    journal.failed(errors)
+    return failed
+
+
+def flush_journal(myshows, invalidate=True):
+    """ replay journal writes of session in batches, collapsing redundant ones first,
+        return (sent, collapsed, failed); failed transient writes are kept
+    """
+    writes, collapsed = myshows.local.journal.collapse()
+    sent, failed = [], 0
+    for start in range(0, len(writes), JOURNAL_BATCH):
+        failed += replay_batch(myshows, writes[start:start + JOURNAL_BATCH], sent)
+
+    if invalidate and sent:
+        for show_id in {write[3] for write in sent if write[1] == 'check'}:
+            myshows.invalidate('watched', show_id)
+        myshows.invalidate('shows')
+    return len(sent), collapsed, failed
+
+
+def show_flush(myshows):
+    """ flush journal of session and show result """
+    if not myshows.local.journal:
+        print('Set config "journal" to queue check/uncheck/status writes')
+        sys.exit(1)
+    with myshows.api.profiler.phase('flush'):
+        sent, collapsed, failed = flush_journal(myshows)
+    print(
+        f'Sent {sent} writes, {collapsed} collapsed, {failed} failed, '
+        f'{myshows.local.journal.count()} pending'
+    )
+
+# vim: ts=4 sw=4
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+""" incremental json decoding of api responses keeping only used fields """
+
+import codecs
+import json
+
+CHUNK_SIZE = 64 * 1024
+
+SHOW_FIELDS = (
+    'showId', 'title', 'ruTitle', 'showStatus', 'watchStatus',
+    'watchedEpisodes', 'totalEpisodes', 'rating',
+)
+EPISODE_FIELDS = (
+    'id', 'title', 'shortName', 'seasonNumber', 'episodeNumber', 'sequenceNumber', 'airDate',
+)
+WATCHED_FIELDS = ('id', 'watchDate')
+
+# shape of kept data: dict - object with members by name ('*' - any member),
+# tuple - object with listed fields only, True - whole value
+SHAPES = {
+    'shows': {'*': SHOW_FIELDS},
+    'episodes': {
+        'id': True, 'title': True, 'ruTitle': True, 'status': True,
+        'started': True, 'ended': True,
+        'episodes': {'*': EPISODE_FIELDS},
+    },
+    'watched': {'*': WATCHED_FIELDS},
+}
+
+
+class JsonStream:
+    """ json reader decoding a byte stream chunk by chunk """
+    def __init__(self, stream, chunk_size=CHUNK_SIZE):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.json_decoder = json.JSONDecoder()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """ read next chunk, return False at the end of stream """
+        if self.eof:
+            return False
+        chunk = self.stream.read(self.chunk_size)
+        self.eof = not chunk
+        self.buf = self.buf[self.pos:] + self.decoder.decode(chunk, final=self.eof)
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """ skip whitespace, return next char or '' at the end """
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buf) or not self.fill():
+                return self.buf[self.pos:self.pos + 1]
+
+    def expect(self, char):
+        """ consume char """
+        if self.peek() != char:
+            raise json.JSONDecodeError(f'Expecting {char!r}', self.buf, self.pos)
+        self.pos += 1
+
+    def value(self):
+        """ decode next complete value """
+        self.peek()
+        while True:
+            try:
+                value, end = self.json_decoder.raw_decode(self.buf, self.pos)
+                # value at the very end of buffer may continue in the next chunk
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill()
+
+    def read(self, shape):
+        """ decode next value keeping data by shape """
+        if shape is True or self.peek() != '{':
+            return self.value()
+        if isinstance(shape, tuple):
+            value = self.value()
+            return {name: value[name] for name in shape if name in value}
+
+        self.expect('{')
+        result = {}
+        if self.peek() == '}':
+            self.pos += 1
+            return result
+        while True:
+            key = self.value()
+            self.expect(':')
+            member_shape = shape.get(key, shape.get('*'))
+            if member_shape is None:
+                self.value()
+            else:
+                result[key] = self.read(member_shape)
+            if self.peek() == '}':
+                self.pos += 1
+                return result
+            self.expect(',')
+
+
+def load_compact(stream, kind):
+    """ decode json from byte stream keeping only fields used for kind of data """
+    return JsonStream(stream).read(SHAPES[kind])
+
+# vim: ts=4 sw=4
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+""" local data of config: store of synced api data and journal of pending writes """
+
+import contextlib
+import datetime
+import sys
+import threading
+
+# sqlite modules are imported on first use of the store or the journal
+# pylint: disable=import-outside-toplevel
+
+
+class LocalData:
+    """ local store and write journal, opened on first use, None if not configured """
+    def __init__(self, store_path=None, journal_path=None):
+        self.store_path = store_path
+        self.journal_path = journal_path
+        self.lock = threading.Lock()
+        self.store_ = None
+        self.journal_ = None
+        # set while queuing journal writes, see queuing()
+        self.local_first = False
+
+    @property
+    def store(self):
+        """ local store opened on first use or None if it is not configured """
+        with self.lock:
+            if self.store_ is None and self.store_path:
+                from myshows_store import LocalStore
+                self.store_ = LocalStore(self.store_path)
+            return self.store_
+
+    @property
+    def journal(self):
+        """ write-behind journal opened on first use or None if it is not configured """
+        with self.lock:
+            if self.journal_ is None and self.journal_path:
+                from myshows_journal import WriteJournal
+                self.journal_ = WriteJournal(self.journal_path)
+            return self.journal_
+
+    @contextlib.contextmanager
+    def queuing(self):
+        """ context of command queuing journal writes: shows and episodes are loaded
+            from disk cache or local store regardless of their age, from api only if
+            they were never loaded
+        """
+        self.local_first = self.journal is not None
+        try:
+            yield
+        finally:
+            self.local_first = False
+
+    def api_json(self, cache, kind, key):
+        """ return api data of kind from disk cache or local store regardless of its age,
+            None if there is none
+        """
+        entry = cache.get(kind, key) if cache else None
+        if entry is not None:
+            return entry['data']
+        if not self.store:
+            return None
+        if kind == 'shows':
+            return self.store.shows() or None
+        epis = self.store.episodes(key)
+        if kind == 'episodes' or epis is None:
+            return epis
+        return self.store.watched(key)
+
+    def pending_watched(self, show_id, watched):
+        """ return watched data of show with its pending journal checks applied """
+        pending = self.journal.checks(show_id) if self.journal else {}
+        if not pending:
+            return watched
+        watched = dict(watched)
+        for epi_id, (checked, created) in pending.items():
+            if not checked:
+                watched.pop(epi_id, None)
+            elif epi_id not in watched:
+                watched[epi_id] = {
+                    'id': int(epi_id), 'rating': None,
+                    'watchDate': datetime.date.fromtimestamp(created).strftime('%d.%m.%Y'),
+                }
+        return watched
+
+    def pending_shows(self, shows_data):
+        """ return shows data with watched counts and statuses of pending journal
+            writes applied
+        """
+        changes = self.journal.show_changes() if self.journal else {}
+        if not changes:
+            return shows_data
+        shows_data = dict(shows_data)
+        for show_id, (count, status) in changes.items():
+            if show_id not in shows_data:
+                continue
+            if status == 'remove':
+                del shows_data[show_id]
+                continue
+            next_show = dict(shows_data[show_id])
+            next_show['watchedEpisodes'] = min(
+                max(next_show['watchedEpisodes'] + count, 0), next_show['totalEpisodes']
+            )
+            next_show['watchStatus'] = status or next_show['watchStatus']
+            shows_data[show_id] = next_show
+        return shows_data
+
+
+def sync_store(myshows):
+    """ load all shows data of session, revalidating cached data, and save it
+        to local store
+    """
+    store = myshows.local.store
+    if not store:
+        print('Set config "store" for sync')
+        sys.exit(1)
+    api = myshows.api
+    url = myshows.config['url']
+    with api.profiler.phase('load_shows'):
+        shows_data = api.load_json('shows', 'all', url['list_shows'], revalidate=True)
+
+    def load_show(show_id):
+        """ load episodes and watched of show """
+        with api.profiler.phase('load_episodes'):
+            epis = api.load_json(
+                'episodes', show_id, url['list_episodes'].format(show_id),
+                revalidate=True, stamp=api.sync_stamp('episodes', show_id, shows_data)
+            )
+        with api.profiler.phase('load_watched'):
+            watched = api.load_json(
+                'watched', show_id, url['list_watched'].format(show_id),
+                revalidate=True, stamp=api.sync_stamp('watched', show_id, shows_data)
+            )
+        return epis, watched
+
+    loaded = dict(zip(shows_data, api.run_parallel(shows_data, load_show)))
+    store.replace_all(
+        shows_data,
+        {show_id: epis for show_id, (epis, _) in loaded.items()},
+        {show_id: watched for show_id, (_, watched) in loaded.items()}
+    )
+    print(f'Synced {len(shows_data)} shows to {store.path}')
+
+# vim: ts=4 sw=4
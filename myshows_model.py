@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+""" compact models of show episodes and watch history built once per load """
+
+import array
+import bisect
+import collections
+import datetime
+import itertools
+import re
+import sys
+
+RE_DATE = re.compile(r'(\d{1,2})\.(\d{1,2})\.(\d{4})')
+# sXXeYY, sXX or sXXeYY-sXXeYY
+RE_EPISODE_SPEC = re.compile(r'^s(\d{1,2})(?:e(\d{1,2})(?:-s(\d{1,2})e(\d{1,2}))?)?$')
+
+
+def parse_ordinal(date_str):
+    """ return dd.mm.yyyy date as ordinal or None on bad format """
+    re_m = RE_DATE.match(date_str or '')
+    if not re_m:
+        return None
+    try:
+        return datetime.date(
+            int(re_m.group(3)), int(re_m.group(2)), int(re_m.group(1))
+        ).toordinal()
+    except ValueError:
+        return None
+
+
+def derived(cache, key, source, build):
+    """ return build(source) kept in cache dict under key until source data object
+        is replaced
+    """
+    cached = cache.get(key)
+    if cached is None or cached[0] is not source:
+        cached = (source, build(source))
+        cache[key] = cached
+    return cached[1]
+
+
+def episode_numbers(episodes):
+    """ return (season, episode) -> episode id map of episodes """
+    index = {}
+    for epi_id in episodes:
+        next_episode = episodes[epi_id]
+        index.setdefault((next_episode['seasonNumber'], next_episode['episodeNumber']), epi_id)
+    return index
+
+
+def episodes_by_spec(numbers, spec):
+    """ return sorted episode ids of episode_numbers() map for sXXeYY, sXX
+        or sXXeYY-sXXeYY, None if bad spec
+    """
+    re_m = RE_EPISODE_SPEC.match(spec.lower())
+    if not re_m:
+        return None
+
+    season = int(re_m.group(1))
+    if re_m.group(2) is None:
+        first, last = (season, 0), (season, sys.maxsize)
+    elif re_m.group(3) is None:
+        epi_id = numbers.get((season, int(re_m.group(2))))
+        return [] if epi_id is None else [epi_id]
+    else:
+        first = (season, int(re_m.group(2)))
+        last = (int(re_m.group(3)), int(re_m.group(4)))
+    return [numbers[number] for number in sorted(numbers) if first <= number <= last]
+
+
+class EpisodeList:
+    """ episode ids of a show sorted by sequence number """
+    __slots__ = ('ids', 'sequences', 'positions')
+
+    def __init__(self, epis):
+        episodes = epis['episodes']
+        # stable sort keeps api order for equal sequence numbers
+        self.ids = sorted(episodes, key=lambda epi_id: episodes[epi_id]['sequenceNumber'])
+        self.sequences = array.array(
+            'l', (episodes[epi_id]['sequenceNumber'] for epi_id in self.ids)
+        )
+        self.positions = {epi_id: pos for pos, epi_id in enumerate(self.ids)}
+
+    def last_of(self, epi_ids):
+        """ return id with the greatest positive sequence number of epi_ids or None """
+        last, last_sequence = None, 0
+        for epi_id in epi_ids:
+            pos = self.positions.get(epi_id)
+            if pos is not None and self.sequences[pos] > last_sequence:
+                last, last_sequence = pos, self.sequences[pos]
+        return None if last is None else self.ids[last]
+
+    def sequence(self, epi_id):
+        """ return sequence number of episode """
+        return self.sequences[self.positions[epi_id]]
+
+    def first_after(self, sequence):
+        """ return id of the first episode with sequence number greater than sequence """
+        pos = bisect.bisect_right(self.sequences, sequence)
+        return self.ids[pos] if pos < len(self.ids) else None
+
+    def first_unwatched(self, epi_ids):
+        """ return id of the first episode after the last watched of epi_ids or None """
+        last = self.last_of(epi_ids)
+        return self.first_after(0 if last is None else self.sequence(last))
+
+
+class WatchHistory:
+    """ watched episode ids of a show sorted by watch date ordinal """
+    __slots__ = ('ordinals', 'ids', 'bad_dates')
+
+    def __init__(self, watched):
+        dated = []
+        self.bad_dates = []
+        for epi_id in watched:
+            ordinal = parse_ordinal(watched[epi_id]['watchDate'])
+            if ordinal is None:
+                self.bad_dates.append(watched[epi_id]['watchDate'])
+            else:
+                dated.append((ordinal, epi_id))
+        dated.sort(key=lambda item: item[0])
+        self.ordinals = array.array('l', (ordinal for ordinal, _ in dated))
+        self.ids = [epi_id for _, epi_id in dated]
+
+    def between(self, first, last):
+        """ return [(episode id, ordinal)] watched from first to last ordinal inclusive """
+        start = bisect.bisect_left(self.ordinals, first)
+        end = bisect.bisect_right(self.ordinals, last)
+        return list(zip(self.ids[start:end], self.ordinals[start:end]))
+
+
+class WatchArchive:
+    """ watch date ordinals of all user shows as columns: sorted array per show
+        and merged sorted array of all, range counts are bisections and histograms
+        are built from counts per distinct day
+    """
+    __slots__ = ('show_ids', 'show_ordinals', 'ordinals')
+
+    def __init__(self, show_ordinals):
+        """ show_ordinals - {show id: sorted watch date ordinals} """
+        self.show_ids = list(show_ordinals)
+        self.show_ordinals = [show_ordinals[show_id] for show_id in self.show_ids]
+        # timsort finds the sorted runs of shows and merges them, O(n log k) for k shows;
+        # faster than heapq.merge, which has the same bound but merges in python
+        self.ordinals = array.array(
+            'l', sorted(itertools.chain.from_iterable(self.show_ordinals))
+        )
+
+    def count(self, first, last):
+        """ return number of episodes watched from first to last ordinal inclusive """
+        return (
+            bisect.bisect_right(self.ordinals, last) - bisect.bisect_left(self.ordinals, first)
+        )
+
+    def by_show(self, first, last):
+        """ return {show id: (count, first ordinal, last ordinal)} of shows watched in range
+        """
+        result = {}
+        for show_id, ordinals in zip(self.show_ids, self.show_ordinals):
+            start = bisect.bisect_left(ordinals, first)
+            end = bisect.bisect_right(ordinals, last)
+            if end > start:
+                result[show_id] = (end - start, ordinals[start], ordinals[end - 1])
+        return result
+
+    def by_day(self, first, last):
+        """ return Counter of watch date ordinals in range """
+        return collections.Counter(self.ordinals[
+            bisect.bisect_left(self.ordinals, first):bisect.bisect_right(self.ordinals, last)
+        ])
+
+
+class AirIndex:
+    """ episodes of all shows sorted by air date ordinal, entry i airs at ordinals[i]
+        and refs[i] is [show id, episode id, season, episode, title]
+    """
+    __slots__ = ('ordinals', 'refs')
+
+    def __init__(self, ordinals, refs):
+        self.ordinals = array.array('l', ordinals)
+        self.refs = refs
+
+    @classmethod
+    def build(cls, episodes_data):
+        """ build index of {show id: episodes data}, episodes without air date are left out """
+        dated = []
+        for show_id, epis in episodes_data.items():
+            for epi_id, episode in epis['episodes'].items():
+                ordinal = parse_ordinal(episode.get('airDate'))
+                if ordinal is not None:
+                    dated.append((ordinal, show_id, episode['sequenceNumber'], [
+                        show_id, epi_id, episode['seasonNumber'], episode['episodeNumber'],
+                        episode.get('title'),
+                    ]))
+        dated.sort(key=lambda item: item[:3])
+        return cls((item[0] for item in dated), [item[3] for item in dated])
+
+    @classmethod
+    def from_json(cls, data):
+        """ load index saved by to_json """
+        return cls(data['ordinals'], data['refs'])
+
+    def to_json(self):
+        """ return index as json data """
+        return {'ordinals': self.ordinals.tolist(), 'refs': self.refs}
+
+    def between(self, first, last):
+        """ return [(ordinal, ref)] of episodes airing from first to last ordinal inclusive """
+        start = bisect.bisect_left(self.ordinals, first)
+        end = bisect.bisect_right(self.ordinals, last)
+        return list(zip(self.ordinals[start:end], self.refs[start:end]))
+
+
+def by_weekday(day_counts):
+    """ return list of counts per weekday, Monday first, of Counter of ordinals """
+    weekdays = [0] * 7
+    for day, count in day_counts.items():
+        # ordinal 1 (0001-01-01) is Monday
+        weekdays[(day - 1) % 7] += count
+    return weekdays
+
+
+def by_month(day_counts):
+    """ return {(year, month): count} sorted by month of Counter of ordinals """
+    months = collections.Counter()
+    for day, count in day_counts.items():
+        date = datetime.date.fromordinal(day)
+        months[(date.year, date.month)] += count
+    return dict(sorted(months.items()))
+
+# vim: ts=4 sw=4
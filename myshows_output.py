@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+""" buffered command output as text lines, json lines or csv rows """
+
+import csv
+import json
+import sys
+import threading
+
+FORMATS = ('text', 'jsonl', 'csv')
+BUFFER_SIZE = 64 * 1024
+
+
+def tr_out(from_str):
+    """ translate unshowed symbols """
+    if sys.platform == 'win32':
+        return from_str.encode('utf-8').decode('ascii', 'ignore')
+
+    return from_str
+#    return from_str.replace(u'\u2026', '...')
+
+
+class Output:
+    """ buffered writer of listing output: records are written as their text lines
+        in text format and as data in jsonl and csv formats, where other text is dropped
+    """
+    def __init__(self, fmt='text', account=None, buffer_size=BUFFER_SIZE):
+        self.fmt = fmt
+        self.account = account
+        self.buffer_size = buffer_size
+        self.buffer = []
+        self.size = 0
+        self.csv_writer = None
+
+    def write(self, data):
+        """ add data to buffer, write buffer out if it is full """
+        self.buffer.append(data)
+        self.size += len(data)
+        if self.size >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        """ write buffer to stdout """
+        if self.buffer:
+            # stdout is looked up here, daemon redirects it per command
+            sys.stdout.write(''.join(self.buffer))
+            self.buffer = []
+            self.size = 0
+        sys.stdout.flush()
+
+    def text(self, line=''):
+        """ write human readable line, text format only """
+        if self.fmt == 'text':
+            self.write(line + '\n')
+
+    def message(self, line):
+        """ write warning line at once, after buffered output, to stderr in data formats:
+            it keeps its place among lines printed directly
+        """
+        if self.fmt == 'text':
+            self.write(line + '\n')
+            self.flush()
+        else:
+            self.flush()
+            sys.stderr.write(line + '\n')
+
+    def record(self, record, line):
+        """ write record as data or its text line """
+        if self.account is not None:
+            record = dict(account=self.account, **record)
+        if self.fmt == 'jsonl':
+            self.write(json.dumps(record, ensure_ascii=False) + '\n')
+        elif self.fmt == 'csv':
+            if self.csv_writer is None:
+                self.csv_writer = csv.DictWriter(self, fieldnames=list(record))
+                self.csv_writer.writeheader()
+            self.csv_writer.writerow(record)
+        else:
+            self.write(line + '\n')
+
+
+class ThreadStdout:
+    """ sys.stdout replacement writing to stream set for current thread or to default """
+    def __init__(self, default):
+        self.default = default
+        self.local = threading.local()
+
+    def redirect(self, stream):
+        """ set stream of current thread, None for default """
+        self.local.stream = stream
+
+    def stream(self):
+        """ return stream of current thread """
+        return getattr(self.local, 'stream', None) or self.default
+
+    def write(self, data):
+        """ write to stream of current thread """
+        return self.stream().write(data)
+
+    def flush(self):
+        """ flush stream of current thread """
+        self.stream().flush()
+
+# vim: ts=4 sw=4
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+""" request and phase timing for --profile report """
+
+import collections
+import contextlib
+import json
+import threading
+import time
+
+
+class CountingReader:
+    """ byte stream wrapper counting bytes and time spent in read() """
+    def __init__(self, stream):
+        self.stream = stream
+        self.bytes_read = 0
+        self.read_time = 0.0
+
+    def read(self, size=-1):
+        """ read from wrapped stream """
+        start = time.perf_counter()
+        # http response reads to connection close on read(-1)
+        data = self.stream.read() if size < 0 else self.stream.read(size)
+        self.read_time += time.perf_counter() - start
+        self.bytes_read += len(data)
+        return data
+
+
+class Profiler:
+    """ collect phase durations and api request records """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.phases = collections.defaultdict(list)
+        self.requests = []
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """ time with-block as phase name """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            with self.lock:
+                self.phases[name].append(duration)
+
+    def request(self, kind, **record):
+        """ add and return api request record: status, latency, bytes, decode, cache """
+        record['kind'] = kind
+        with self.lock:
+            self.requests.append(record)
+        return record
+
+    def summary(self):
+        """ return report as dict """
+        with self.lock:
+            phases = {
+                name: {'count': len(times), 'total': sum(times), 'max': max(times)}
+                for name, times in self.phases.items()
+            }
+            kinds = {}
+            for record in self.requests:
+                kind = kinds.setdefault(record['kind'], {
+                    'count': 0, 'latency': 0.0, 'max_latency': 0.0, 'bytes': 0,
+                    'wire_bytes': 0, 'decode': 0.0, 'retries': 0,
+                    'cache': collections.Counter(),
+                })
+                kind['count'] += 1
+                kind['latency'] += record.get('latency', 0.0)
+                kind['max_latency'] = max(kind['max_latency'], record.get('latency', 0.0))
+                kind['bytes'] += record.get('bytes', 0)
+                # compressed size, body size if it was sent uncompressed
+                kind['wire_bytes'] += record.get('wire_bytes', record.get('bytes', 0))
+                kind['decode'] += record.get('decode', 0.0)
+                kind['retries'] += record.get('retries', 0)
+                kind['cache'][record.get('cache', 'none')] += 1
+        return {
+            'wall': time.perf_counter() - self.started,
+            'phases': phases,
+            'requests': kinds,
+        }
+
+    def write_json(self, file_name):
+        """ write report as json """
+        with open(file_name, mode='w', encoding='utf8') as out:
+            json.dump(self.summary(), out, indent=2)
+
+    def print_table(self, out):
+        """ print report table """
+        summary = self.summary()
+        print(f'\nTotal wall time: {summary["wall"]:.3f} s', file=out)
+        print(f'\n{"phase":<24} {"count":>6} {"total, s":>9} {"max, s":>8}', file=out)
+        for name, phase in sorted(summary['phases'].items()):
+            print(
+                f'{name:<24} {phase["count"]:6d} {phase["total"]:9.3f} {phase["max"]:8.3f}',
+                file=out
+            )
+        print(
+            f'\n{"request":<12} {"count":>6} {"latency, s":>11} {"max, s":>7} '
+            f'{"KiB":>8} {"wire KiB":>9} {"decode, s":>10} {"retries":>8}  cache',
+            file=out
+        )
+        for name, kind in sorted(summary['requests'].items()):
+            cache = ', '.join(
+                f'{state} {count}' for state, count in sorted(kind['cache'].items())
+            )
+            print(
+                f'{name:<12} {kind["count"]:6d} {kind["latency"]:11.3f} '
+                f'{kind["max_latency"]:7.3f} {kind["bytes"] / 1024:8.1f} '
+                f'{kind["wire_bytes"] / 1024:9.1f} '
+                f'{kind["decode"]:10.3f} {kind["retries"]:8d}  {cache}',
+                file=out
+            )
+        print(file=out)
+
+# vim: ts=4 sw=4
@@ -0,0 +1,351 @@
+# -*- coding: utf-8 -*-
+""" reports over all user shows: watched in period, watch stats, next episodes, calendar """
+
+import datetime
+import logging
+import sys
+
+from myshows_fuzzy import checksum
+from myshows_model import AirIndex, WatchArchive, by_month, by_weekday, derived, parse_ordinal
+from myshows_output import tr_out
+
+DEFAULT_CALENDAR_DAYS = 14
+WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+# width of the longest bar of stats histograms
+BAR_WIDTH = 40
+
+
+def histogram_bar(count, max_count):
+    """ return bar of count scaled to BAR_WIDTH for max_count """
+    return '#' * round(BAR_WIDTH * count / max_count) if max_count else ''
+
+
+def period_dates(alias):
+    """ return (first, last) date of period day, week or month up to today """
+    date_to = datetime.date.today()
+    if alias == 'day':
+        date_from = date_to + datetime.timedelta(days=-1)
+    elif alias == 'week':
+        date_from = date_to + datetime.timedelta(days=-7)
+    elif alias == 'month':
+        prev_month = date_to.replace(day=1) + datetime.timedelta(days=-1)
+        date_from = date_to + datetime.timedelta(days=-prev_month.day)
+    else:
+        print(f'Unknown alias - {alias}')
+        sys.exit(1)
+    return date_from, date_to
+
+
+def show_last_watched_by_date(myshows, alias):
+    """ show last watched episode(s) for date """
+    date_from, date_to = period_dates(alias)
+    myshows.load_shows()
+    ord_from, ord_to = date_from.toordinal(), date_to.toordinal()
+    recent_ids = None
+    if myshows.api.offline:
+        recent_ids = myshows.local.store.shows_watched_between(ord_from, ord_to)
+        if myshows.local.journal:
+            # pending checks are dated by the time they were queued
+            recent_ids.update(myshows.local.journal.show_changes())
+
+    def fetch_recent(show_id):
+        history = myshows.watch_history(show_id)
+        recent = history.between(ord_from, ord_to)
+        return history, recent, myshows.load_episodes(show_id) if recent else None
+
+    out = myshows.out
+    out.text()
+    out.text(
+        f"Watched from {date_from.strftime('%Y-%m-%d')} to {date_to.strftime('%Y-%m-%d')}"
+    )
+    out.text()
+    count = 0
+    # text keeps shows order, data records are written as soon as show is loaded
+    for show_id, (history, recent, epis) in myshows.api.run_streaming(
+        [
+            show_id for show_id in myshows.shows_data
+            if myshows.shows_data[show_id]['watchedEpisodes'] > 0
+            and (recent_ids is None or show_id in recent_ids)
+        ],
+        fetch_recent, ordered=out.fmt == 'text'
+    ):
+        for bad_date in history.bad_dates:
+            out.message(f'Warning: unknown date format - {bad_date}')
+        count += len(recent)
+        if write_recent(myshows, show_id, recent, epis):
+            out.flush()
+    out.text()
+    out.text(f'Total count: {count}')
+    out.text()
+
+
+def write_recent(myshows, show_id, recent, epis):
+    """ write recently watched episodes of show sorted by watch date,
+        return number of episodes written
+    """
+    watched = myshows.load_watched(show_id)
+    last_map = {}
+    for epi_id, epi_ordinal in recent:
+        if epi_id not in epis['episodes']:
+            myshows.out.message(f'Episode not found: {epi_id}')
+            logging.debug('Episodes: %s', sorted(epis['episodes']))
+            continue
+
+        episode = epis['episodes'][epi_id]
+        date_key = epi_ordinal * 1000\
+            + episode['seasonNumber'] * 10\
+            + episode['episodeNumber']
+        last_map[date_key] = episode
+
+    with myshows.api.profiler.phase('render'):
+        for date_key in sorted(last_map.keys()):
+            episode = last_map[date_key]
+            myshows.out.record({
+                'show_id': int(show_id), 'show': epis['title'],
+                'season': episode['seasonNumber'], 'episode': episode['episodeNumber'],
+                'id': episode['id'], 'title': episode['title'],
+                'watch_date': watched[str(episode['id'])]['watchDate'],
+            }, '{0} s{1:02d}e{2:02d} "{3}" at {4}'.format(
+                tr_out(epis['title']),
+                episode['seasonNumber'], episode['episodeNumber'],
+                tr_out(episode['title']),
+                watched[str(episode['id'])]['watchDate']
+            ))
+    return len(last_map)
+
+
+def watch_archive(myshows):
+    """ return columnar archive of watch dates of all user shows """
+    myshows.load_shows()
+    if myshows.api.offline:
+        return WatchArchive(myshows.local.store.watch_ordinals())
+    show_ids = [
+        show_id for show_id in myshows.shows_data
+        if myshows.shows_data[show_id]['watchedEpisodes'] > 0
+    ]
+    myshows.api.run_parallel(show_ids, myshows.load_watched)
+    return WatchArchive({
+        show_id: myshows.watch_history(show_id).ordinals for show_id in show_ids
+    })
+
+
+def show_stats(myshows, date_from=None, date_to=None):
+    """ show watch statistics from date_from (first watch) to date_to (today):
+        per show counts with velocity and finish estimate, weekday and month histograms
+    """
+    archive = watch_archive(myshows)
+    if not archive.ordinals:
+        myshows.out.message('No watched episodes')
+        return
+
+    with myshows.api.profiler.phase('stats'):
+        first = date_from.toordinal() if date_from else archive.ordinals[0]
+        last = (date_to or datetime.date.today()).toordinal()
+        days = max(1, last - first + 1)
+        count = archive.count(first, last)
+        shows = archive.by_show(first, last)
+        day_counts = archive.by_day(first, last)
+
+    out = myshows.out
+    with myshows.api.profiler.phase('render'):
+        out.text()
+        out.record(
+            {'kind': 'total', 'key': '', 'count': count,
+             'per_week': round(7 * count / days, 2), 'eta_days': None},
+            'Watched from {0} to {1}: {2} episodes in {3} days, {4:.1f} per week'.format(
+                datetime.date.fromordinal(first), datetime.date.fromordinal(last),
+                count, days, 7 * count / days
+            )
+        )
+        write_show_stats(out, myshows.shows_data, shows)
+        write_histograms(out, day_counts)
+
+
+def write_show_stats(out, shows_data, shows):
+    """ write per show counts of archive.by_show() with velocity and finish estimate """
+    out.text()
+    out.text('By show:')
+    titles = {show_id: shows_data[show_id]['title'] for show_id in shows}
+    for show_id, (show_count, show_first, show_last) in sorted(
+        shows.items(), key=lambda item: (-item[1][0], titles[item[0]])
+    ):
+        next_show = shows_data[show_id]
+        # velocity over the watching span, at least a week
+        per_day = show_count / max(7, show_last - show_first + 1)
+        left = next_show['totalEpisodes'] - next_show['watchedEpisodes']
+        eta_days = round(left / per_day) if left > 0 else None
+        out.record(
+            {'kind': 'show', 'key': next_show['title'], 'count': show_count,
+             'per_week': round(7 * per_day, 2), 'eta_days': eta_days},
+            '  {0}: {1}, {2:.1f} per week{3}'.format(
+                tr_out(next_show['title']), show_count, 7 * per_day,
+                f', {left} left ~ {eta_days} days' if eta_days is not None else ''
+            )
+        )
+
+
+def write_histograms(out, day_counts):
+    """ write weekday and month histograms of Counter of watch date ordinals """
+    out.text()
+    out.text('By weekday:')
+    weekdays = by_weekday(day_counts)
+    for name, day_count in zip(WEEKDAYS, weekdays):
+        out.record(
+            {'kind': 'weekday', 'key': name, 'count': day_count,
+             'per_week': None, 'eta_days': None},
+            f'  {name} {day_count:6d} {histogram_bar(day_count, max(weekdays))}'
+        )
+
+    out.text()
+    out.text('By month:')
+    months = by_month(day_counts)
+    for (year, month), month_count in months.items():
+        out.record(
+            {'kind': 'month', 'key': f'{year}-{month:02d}', 'count': month_count,
+             'per_week': None, 'eta_days': None},
+            f'  {year}-{month:02d} {month_count:6d} '
+            f'{histogram_bar(month_count, max(months.values()))}'
+        )
+    out.text()
+
+
+def show_next_all(myshows):
+    """ show next episode for watch of every watching show: aired episodes first,
+        most recently watched shows first
+    """
+    myshows.load_shows()
+    today = datetime.date.today().toordinal()
+
+    def fetch_next(show_id):
+        epis = myshows.load_episodes(show_id)
+        history = myshows.watch_history(show_id)
+        episode_id = myshows.get_first_unwatched(show_id)
+        if episode_id is None:
+            return None
+        episode = epis['episodes'][episode_id]
+        aired = parse_ordinal(episode['airDate'])
+        last_watched = history.ordinals[-1] if history.ordinals else None
+        return (
+            (aired is None or aired > today, -(last_watched or 0), epis['title']),
+            {
+                'show_id': int(show_id), 'show': epis['title'],
+                'season': episode['seasonNumber'], 'episode': episode['episodeNumber'],
+                'id': episode['id'], 'title': episode['title'],
+                'air_date': episode['airDate'],
+                'last_watched': datetime.date.fromordinal(last_watched).isoformat()
+                if last_watched else None,
+            }
+        )
+
+    def next_line(record):
+        return '{0} s{1:02d}e{2:02d} "{3}", aired {4}, last watched {5}'.format(
+            tr_out(record['show']), record['season'], record['episode'],
+            tr_out(record['title']), record['air_date'] or '-',
+            record['last_watched'] or '-'
+        )
+
+    shows_data = myshows.local.pending_shows(myshows.shows_data)
+    show_ids = [
+        show_id for show_id, next_show in shows_data.items()
+        if next_show['watchStatus'] == 'watching'
+    ]
+    out = myshows.out
+    ranked = []
+    out.text()
+    # data records are written as soon as show is loaded, text is ranked at the end
+    for show_id, result in myshows.api.run_streaming(show_ids, fetch_next, ordered=False):
+        if result is None:
+            out.message(
+                f"Cannot find first watch for {tr_out(shows_data[show_id]['title'])}"
+            )
+        elif out.fmt == 'text':
+            ranked.append(result)
+        else:
+            out.record(result[1], '')
+            out.flush()
+
+    with myshows.api.profiler.phase('render'):
+        for _, record in sorted(ranked, key=lambda item: item[0]):
+            out.record(record, next_line(record))
+        out.text()
+
+
+def air_index(myshows):
+    """ return air date index of episodes of all user shows """
+    myshows.load_shows()
+    return derived(
+        myshows.derived_data, 'airdates', myshows.shows_data,
+        lambda shows_data: build_air_index(myshows, shows_data)
+    )
+
+
+def build_air_index(myshows, shows_data):
+    """ return air date index of episodes of shows, reuse persisted one while episode
+        counts of shows are the same and it is younger than episodes ttl
+    """
+    cache = myshows.api.cache
+    stamp = checksum({
+        show_id: next_show['totalEpisodes'] for show_id, next_show in shows_data.items()
+    })
+    if cache:
+        entry = cache.get('index', 'airdates')
+        if entry is not None and entry['stamp'] == stamp and cache.fresh('episodes', entry):
+            return AirIndex.from_json(entry['data'])
+
+    with myshows.api.profiler.phase('build_air_index'):
+        episodes = myshows.api.run_parallel(shows_data, myshows.load_episodes)
+        index = AirIndex.build(dict(zip(shows_data, episodes)))
+    if cache:
+        cache.put('index', 'airdates', index.to_json(), stamp=stamp)
+    logging.debug('Built air date index of %s episodes', len(index.refs))
+    return index
+
+
+def show_calendar(myshows, days=DEFAULT_CALENDAR_DAYS):
+    """ show unwatched episodes of user shows airing in days from today """
+    myshows.load_shows()
+    shows_data = myshows.shows_data
+    date_from = datetime.date.today()
+    date_to = date_from + datetime.timedelta(days=max(1, days) - 1)
+    if myshows.api.offline:
+        airing = myshows.local.store.episodes_airing(
+            date_from.toordinal(), date_to.toordinal()
+        )
+    else:
+        airing = air_index(myshows).between(date_from.toordinal(), date_to.toordinal())
+
+    show_ids = sorted({
+        ref[0] for _, ref in airing
+        if ref[0] in shows_data and shows_data[ref[0]]['watchedEpisodes'] > 0
+    })
+    watched = dict(zip(show_ids, myshows.api.run_parallel(show_ids, myshows.load_watched)))
+
+    with myshows.api.profiler.phase('render'):
+        myshows.out.text()
+        myshows.out.text(f'Airing from {date_from.isoformat()} to {date_to.isoformat()}')
+        write_airing(myshows.out, shows_data, airing, watched)
+
+
+def write_airing(out, shows_data, airing, watched):
+    """ write airing episodes of shows which are not watched by days """
+    day, count = None, 0
+    for ordinal, (show_id, epi_id, season, episode, title) in airing:
+        if show_id not in shows_data or epi_id in watched.get(show_id, ()):
+            continue
+        if ordinal != day:
+            day = ordinal
+            out.text()
+            out.text(datetime.date.fromordinal(ordinal).strftime('%Y-%m-%d %a'))
+        count += 1
+        out.record({
+            'air_date': datetime.date.fromordinal(ordinal).isoformat(),
+            'show_id': int(show_id), 'show': shows_data[show_id]['title'],
+            'season': season, 'episode': episode, 'id': int(epi_id), 'title': title,
+        }, '  {0} s{1:02d}e{2:02d} "{3}"'.format(
+            tr_out(shows_data[show_id]['title']), season, episode, tr_out(title or '')
+        ))
+    out.text()
+    out.text(f'Total count: {count}')
+    out.text()
+
+# vim: ts=4 sw=4
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+""" search result cache and catalog of shows seen in search results and profile """
+
+import collections
+import threading
+import time
+
+from myshows_fuzzy import normalize
+
+DEFAULT_SEARCH = {'size': 256, 'ttl': 24 * 3600}
+
+
+def query_key(query):
+    """ return normalized search query """
+    return normalize(query).strip()
+
+
+class SearchCache:
+    """ LRU cache of search results by normalized query with ttl,
+        results are kept as show ids of the catalog of every seen show;
+        kept in disk cache (kinds "search" and "catalog") if it is given
+    """
+    def __init__(
+            self, disk_cache=None, size=DEFAULT_SEARCH['size'], ttl=DEFAULT_SEARCH['ttl']
+    ):
+        self.disk_cache = disk_cache
+        self.size = size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        # query -> [stored, show ids], least recently used first
+        self.queries = None
+        # show id -> show data of search result or profile
+        self.catalog = None
+
+    def load_(self):
+        """ load queries and catalog from disk cache once, lock must be held """
+        if self.queries is not None:
+            return
+        self.queries = collections.OrderedDict()
+        self.catalog = {}
+        if self.disk_cache:
+            entry = self.disk_cache.get('search', 'queries')
+            if entry:
+                self.queries.update(entry['data'])
+            entry = self.disk_cache.get('catalog', 'shows')
+            if entry:
+                self.catalog = entry['data']
+
+    def save_(self, catalog=False):
+        """ store queries and, if asked, catalog to disk cache, lock must be held """
+        if self.disk_cache:
+            self.disk_cache.put('search', 'queries', self.queries)
+            if catalog:
+                self.disk_cache.put('catalog', 'shows', self.catalog)
+
+    def get(self, query):
+        """ return search result or None if query has to be sent to server """
+        key = query_key(query)
+        with self.lock:
+            self.load_()
+            cached = self.queries.get(key)
+            if cached is None or time.time() - cached[0] >= self.ttl:
+                return None
+            if next(reversed(self.queries)) != key:
+                self.touch_(key)
+                self.save_()
+            return {show_id: self.catalog[show_id] for show_id in cached[1]}
+
+    def touch_(self, key):
+        """ mark query as most recently used, evict least recently used ones """
+        self.queries.move_to_end(key)
+        while len(self.queries) > self.size:
+            self.queries.popitem(last=False)
+
+    def put(self, query, result):
+        """ cache search result, add its shows to catalog """
+        with self.lock:
+            self.load_()
+            for show_id, show in result.items():
+                self.catalog[show_id] = dict(self.catalog.get(show_id, {}), **show)
+            key = query_key(query)
+            self.queries[key] = [time.time(), list(result)]
+            self.touch_(key)
+            self.save_(catalog=True)
+
+    def add_profile(self, shows_data):
+        """ add or update shows of user profile listing in catalog """
+        with self.lock:
+            self.load_()
+            changed = False
+            for show_id, next_show in shows_data.items():
+                show = self.catalog.get(show_id, {})
+                update = {
+                    'id': next_show['showId'], 'title': next_show['title'],
+                    'ruTitle': next_show.get('ruTitle'),
+                }
+                if any(show.get(name) != value for name, value in update.items()):
+                    self.catalog[show_id] = dict(show, **update)
+                    changed = True
+            if changed and self.disk_cache:
+                self.disk_cache.put('catalog', 'shows', self.catalog)
+
+# vim: ts=4 sw=4
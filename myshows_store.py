@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+""" local sqlite mirror of shows, episodes and watch history """
+
+import array
+import itertools
+import json
+import logging
+import sqlite3
+import threading
+
+from myshows_model import parse_ordinal
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS shows (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    profile TEXT NOT NULL,
+    info TEXT
+);
+CREATE INDEX IF NOT EXISTS shows_title ON shows (title);
+CREATE TABLE IF NOT EXISTS episodes (
+    id TEXT PRIMARY KEY,
+    show_id TEXT NOT NULL,
+    season INTEGER NOT NULL,
+    episode INTEGER NOT NULL,
+    sequence INTEGER NOT NULL,
+    title TEXT,
+    short_name TEXT,
+    air_date TEXT,
+    air_ordinal INTEGER
+);
+CREATE INDEX IF NOT EXISTS episodes_show_number ON episodes (show_id, season, episode);
+CREATE INDEX IF NOT EXISTS episodes_show_sequence ON episodes (show_id, sequence);
+CREATE INDEX IF NOT EXISTS episodes_air ON episodes (air_ordinal);
+CREATE TABLE IF NOT EXISTS watched (
+    episode_id TEXT PRIMARY KEY,
+    show_id TEXT NOT NULL,
+    watch_date TEXT,
+    watch_ordinal INTEGER
+);
+CREATE INDEX IF NOT EXISTS watched_show ON watched (show_id);
+CREATE INDEX IF NOT EXISTS watched_ordinal ON watched (watch_ordinal, show_id);
+'''
+
+
+class LocalStore:
+    """ sqlite database with the synced copy of user data """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        """ close database """
+        self.conn.close()
+
+    def replace_all(self, shows_data, episodes_data, watched_data):
+        """ replace stored data by loaded one """
+        with self.lock, self.conn:
+            self.conn.execute('DELETE FROM shows')
+            self.conn.execute('DELETE FROM episodes')
+            self.conn.execute('DELETE FROM watched')
+            for show_id, next_show in shows_data.items():
+                epis = episodes_data.get(show_id)
+                info = None
+                if epis is not None:
+                    info = {name: value for name, value in epis.items() if name != 'episodes'}
+                self.conn.execute(
+                    'INSERT INTO shows VALUES (?, ?, ?, ?)',
+                    (show_id, next_show['title'], json.dumps(next_show),
+                     None if info is None else json.dumps(info))
+                )
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO episodes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (
+                    (epi_id, show_id, episode['seasonNumber'], episode['episodeNumber'],
+                     episode['sequenceNumber'], episode.get('title'), episode.get('shortName'),
+                     episode.get('airDate'), parse_ordinal(episode.get('airDate')))
+                    for show_id, epis in episodes_data.items()
+                    for epi_id, episode in epis['episodes'].items()
+                )
+            )
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO watched VALUES (?, ?, ?, ?)',
+                (
+                    (epi_id, show_id, watch['watchDate'], parse_ordinal(watch['watchDate']))
+                    for show_id, watched in watched_data.items()
+                    # api returns empty list for show without watched episodes
+                    if isinstance(watched, dict)
+                    for epi_id, watch in watched.items()
+                )
+            )
+        logging.debug('Stored %s shows to %s', len(shows_data), self.path)
+
+    def query(self, sql, params=()):
+        """ return all rows of query """
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def shows(self):
+        """ return profile shows data ordered by title """
+        return {
+            show_id: json.loads(profile) for show_id, profile in self.query(
+                'SELECT id, profile FROM shows ORDER BY title'
+            )
+        }
+
+    def episodes(self, show_id):
+        """ return episodes data of show ordered by season and episode or None """
+        rows = self.query('SELECT info FROM shows WHERE id = ?', (show_id,))
+        if not rows or rows[0][0] is None:
+            return None
+        epis = json.loads(rows[0][0])
+        epis['episodes'] = {
+            epi_id: {
+                'id': int(epi_id), 'title': title, 'shortName': short_name,
+                'seasonNumber': season, 'episodeNumber': episode,
+                'sequenceNumber': sequence, 'airDate': air_date,
+            }
+            for epi_id, season, episode, sequence, title, short_name, air_date in self.query(
+                'SELECT id, season, episode, sequence, title, short_name, air_date'
+                ' FROM episodes WHERE show_id = ? ORDER BY season, episode',
+                (show_id,)
+            )
+        }
+        return epis
+
+    def watched(self, show_id):
+        """ return watched data of show """
+        return {
+            epi_id: {'id': int(epi_id), 'watchDate': watch_date}
+            for epi_id, watch_date in self.query(
+                'SELECT episode_id, watch_date FROM watched WHERE show_id = ?', (show_id,)
+            )
+        }
+
+    def shows_watched_between(self, first, last):
+        """ return set of show ids with episodes watched from first to last ordinal """
+        return {
+            show_id for show_id, in self.query(
+                'SELECT DISTINCT show_id FROM watched'
+                ' WHERE watch_ordinal BETWEEN ? AND ?',
+                (first, last)
+            )
+        }
+
+    def watch_ordinals(self):
+        """ return {show id: sorted array of watch date ordinals} """
+        return {
+            show_id: array.array('l', (ordinal for _, ordinal in rows))
+            for show_id, rows in itertools.groupby(
+                self.query(
+                    'SELECT show_id, watch_ordinal FROM watched'
+                    ' WHERE watch_ordinal IS NOT NULL ORDER BY show_id, watch_ordinal'
+                ),
+                key=lambda row: row[0]
+            )
+        }
+
+    def episodes_airing(self, first, last):
+        """ return [(ordinal, [show id, episode id, season, episode, title])] of episodes
+            airing from first to last ordinal, ordered as AirIndex.between
+        """
+        return [
+            (ordinal, [show_id, epi_id, season, episode, title])
+            for ordinal, show_id, epi_id, season, episode, title in self.query(
+                'SELECT air_ordinal, show_id, id, season, episode, title FROM episodes'
+                ' WHERE air_ordinal BETWEEN ? AND ? ORDER BY air_ordinal, show_id, sequence',
+                (first, last)
+            )
+        ]
+
+    def first_unwatched(self, show_id):
+        """ return id of the first episode after the last watched one or None """
+        rows = self.query(
+            'SELECT id FROM episodes WHERE show_id = ? AND sequence > ('
+            ' SELECT COALESCE(MAX(episodes.sequence), 0) FROM watched'
+            ' JOIN episodes ON episodes.id = watched.episode_id'
+            ' WHERE watched.show_id = ?'
+            ') ORDER BY sequence LIMIT 1',
+            (show_id, show_id)
+        )
+        return rows[0][0] if rows else None
+
+# vim: ts=4 sw=4
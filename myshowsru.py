@@ -3,128 +3,132 @@
 """ myshows.ru utility """
 
 import datetime
-import json
 import logging
 import re
 import sys
-import urllib
 
 import argparse
-import http.cookiejar
-
-
-def tr_out(from_str):
-    """ translate unshowed symbols """
-    if sys.platform == 'win32':
-        return from_str.encode('utf-8').decode('ascii', 'ignore')
-
-    return from_str
-#    return from_str.replace(u'\u2026', '...')
+import os
+
+from myshows_api import DEFAULT_WORKERS, ApiClient, config_relative
+from myshows_forward import (
+    FORWARD_COMMANDS, WRITE_COMMANDS, daemon_socket, fast_forward, forward_command,
+    notify_written
+)
+from myshows_fuzzy import TitleIndex, cached_index, normalize, persisted_index
+from myshows_local import LocalData, sync_store
+from myshows_model import (
+    EpisodeList, WatchHistory, derived, episode_numbers, episodes_by_spec
+)
+from myshows_output import FORMATS, Output, tr_out
+from myshows_reports import (
+    DEFAULT_CALENDAR_DAYS, show_calendar, show_last_watched_by_date, show_next_all,
+    show_stats
+)
+
+# journal replay, batch and daemon modules are imported on first use: commands
+# answered from the cache, the local store or the daemon should not pay for them
+# pylint: disable=import-outside-toplevel
+
+DEFAULT_CONFIG = 'myshows.cfg'
+DEFAULT_REFRESH_INTERVAL = 300
 
 
 class MyShowsRu:
     """ work with api.myshows.ru """
-    def __init__(self, config_name_name):
-        with open(config_name_name, mode='r', encoding='utf8') as cfg_file:
-            self.config = json.load(cfg_file)
-            logging.debug('Parsed config file %s result: %s', config_name_name, self.config)
-
-        self.cookie_jar = http.cookiejar.CookieJar()
-        self.opener = urllib.request.build_opener(
-            urllib.request.HTTPCookieProcessor(self.cookie_jar)
-        )
-        self.logged_ = False
+    def __init__(self, config_name_name, workers=None, use_cache=True, offline=False):
+        self.config_name = config_name_name
+        self.api = ApiClient(config_name_name, workers, use_cache, offline)
+        self.config = self.api.config
+        self.local = LocalData(*(
+            config_relative(config_name_name, self.config[name])
+            if name in self.config else None
+            for name in ('store', 'journal')
+        ))
+
         self.list_loaded_ = False
-        self.api_url = 'https://' + self.config['api_domain']
+        self.out = Output()
         self.shows_data = {}
         self.episodes_data = {}
         self.watched_data = {}
-
-    def do_login(self):
-        """ authorization """
-        if self.logged_:
-            return
-        try:
-            req_data = urllib.parse.urlencode({
-                'login': self.config['login']['name'],
-                'password': self.config['login']['md5pass']
-            })
-            logging.debug(
-                'Login, url: %s%s, data: %s',
-                self.api_url, self.config['url']['login'], req_data
-            )
-            request = urllib.request.Request(
-                self.api_url + self.config['url']['login'], req_data.encode('utf-8')
-            )
-            handle = self.opener.open(request)
-            logging.debug('Login result: %s/%s', handle.headers, handle.read().decode('utf-8'))
-            self.cookie_jar.clear(
-                self.config['api_domain'], '/', 'SiteUser[login]'
-            )
-            self.cookie_jar.clear(
-                self.config['api_domain'], '/', 'SiteUser[password]'
-            )
-        except urllib.error.HTTPError as ex:
-            if ex.code == 403:
-                sys.stderr.write('Bad login name or password!\n')
-            else:
-                sys.stderr.write('Login error!\n')
-            logging.debug('HTTP error #%s: %s\n', ex.code, ex.read())
-            sys.exit(1)
-        except urllib.error.URLError as ex:
-            sys.stderr.write('Login error!\n')
-            logging.debug('URLError - %s\n', ex.reason)
+        # (source data, derived data) pairs, rebuilt when source data is replaced
+        self.derived_data = {}
+        if offline and not self.local.store_path:
+            print('Offline mode needs local store, set config "store" and run sync')
             sys.exit(1)
 
-        self.logged_ = True
+    def invalidate(self, kind, show_id=None):
+        """ forget cached data of kind for show id (or all) """
+        data = {
+            'shows': None, 'episodes': self.episodes_data, 'watched': self.watched_data
+        }[kind]
+        if kind == 'shows':
+            self.list_loaded_ = False
+        elif show_id is None:
+            data.clear()
+        else:
+            data.pop(str(show_id), None)
+        if self.api.cache:
+            if kind == 'shows':
+                show_id = 'all'
+            self.api.cache.invalidate(kind, None if show_id is None else str(show_id))
 
     def load_shows(self):
         """ load user shows """
         if self.list_loaded_:
             return
-        if not self.logged_:
-            self.do_login()
-        logging.debug('Login: %s%s', self.api_url, self.config['url']['list_shows'])
-        request = urllib.request.Request(
-            self.api_url + self.config['url']['list_shows']
-        )
-        handle = self.opener.open(request)
-        self.shows_data = json.loads(handle.read().decode('utf-8'))
+        with self.api.profiler.phase('load_shows'):
+            if self.api.offline:
+                self.shows_data = self.local.store.shows()
+            else:
+                shows_data = None
+                if self.local.local_first:
+                    shows_data = self.local.api_json(self.api.cache, 'shows', 'all')
+                self.shows_data = shows_data or self.api.load_json(
+                    'shows', 'all', self.config['url']['list_shows']
+                )
         self.list_loaded_ = True
 
     def list_all_shows(self):
         """ list all user shows """
         self.load_shows()
-        print()
-        for show_id in sorted(
-            self.shows_data, key=lambda show_id: self.shows_data[show_id]['title']
-        ):
-            next_show = self.shows_data[show_id]
-            if next_show['watchedEpisodes'] <= 0:
-                show_sign = '-'
-            elif next_show['watchedEpisodes'] < next_show['totalEpisodes']:
-                show_sign = '+'
-            else:
-                show_sign = ' '
-
-            alias = self.alias_by_title(next_show['title'])
-            if not alias:
-                alias = '-'
-
-            print('{0}{1}({7}): {2}/{3} ({4}%), rating = {5}({6})'.format(
-                show_sign,
-                tr_out(next_show['title']),
-                # next_show['ruTitle'],
-                next_show['watchedEpisodes'], next_show['totalEpisodes'],
-                100 * (
-                    next_show['watchedEpisodes'] / next_show['totalEpisodes']
-                        if next_show['totalEpisodes'] > 0 else 0
-                ),
-                next_show['rating'],
-                next_show['watchStatus'][0],
-                alias
-            ))
-        print()
+        shows_data = self.local.pending_shows(self.shows_data)
+        with self.api.profiler.phase('render'):
+            self.out.text()
+            for show_id in sorted(
+                shows_data, key=lambda show_id: shows_data[show_id]['title']
+            ):
+                next_show = shows_data[show_id]
+                if next_show['watchedEpisodes'] <= 0:
+                    show_sign = '-'
+                elif next_show['watchedEpisodes'] < next_show['totalEpisodes']:
+                    show_sign = '+'
+                else:
+                    show_sign = ' '
+
+                alias = self.alias_by_title(next_show['title'])
+                if not alias:
+                    alias = '-'
+
+                self.out.record({
+                    'id': int(show_id), 'title': next_show['title'], 'alias': alias,
+                    'watched': next_show['watchedEpisodes'],
+                    'total': next_show['totalEpisodes'],
+                    'rating': next_show['rating'], 'status': next_show['watchStatus'],
+                }, '{0}{1}({7}): {2}/{3} ({4}%), rating = {5}({6})'.format(
+                    show_sign,
+                    tr_out(next_show['title']),
+                    # next_show['ruTitle'],
+                    next_show['watchedEpisodes'], next_show['totalEpisodes'],
+                    100 * (
+                        next_show['watchedEpisodes'] / next_show['totalEpisodes']
+                            if next_show['totalEpisodes'] > 0 else 0
+                    ),
+                    next_show['rating'],
+                    next_show['watchStatus'][0],
+                    alias
+                ))
+            self.out.text()
 
     def list_show(self, alias):
         """ list user show by alias """
@@ -139,10 +143,8 @@ class MyShowsRu:
             self.title_by_alias(re_m.group(1), no_exit=True)
         )
         epis = self.load_episodes(show_id)
-        episodes = epis['episodes']
         list_map = {}
-        for epi_id in episodes:
-            next_episode = episodes[epi_id]
+        for next_episode in epis['episodes'].values():
             if season in [-1, next_episode['seasonNumber']]:
                 list_map[
                     next_episode['seasonNumber'] * 1000 +
@@ -150,23 +152,31 @@ class MyShowsRu:
                 ] = next_episode
 
         watched = self.load_watched(show_id)
-        current_season = -1
-        for epi_num in sorted(list_map.keys()):
-            next_episode = list_map[epi_num]
-            next_season = next_episode['seasonNumber']
-            if current_season != next_season:
-                current_season = next_season
-                print(f"{tr_out(epis['title'])} Season {current_season}:")
-            comment = ''
-            epi_id = str(next_episode['id'])
-            if epi_id in watched:
-                comment = 'watched ' + watched[epi_id]['watchDate']
-            print('  "{0}" (s{1:02d}e{2:02d}) {3}'.format(
-                tr_out(next_episode['title']),
-                next_episode['seasonNumber'],
-                next_episode['episodeNumber'],
-                comment
-            ))
+        with self.api.profiler.phase('render'):
+            current_season = -1
+            for epi_num in sorted(list_map.keys()):
+                next_episode = list_map[epi_num]
+                next_season = next_episode['seasonNumber']
+                if current_season != next_season:
+                    current_season = next_season
+                    self.out.text(f"{tr_out(epis['title'])} Season {current_season}:")
+                comment = ''
+                epi_id = str(next_episode['id'])
+                watch_date = None
+                if epi_id in watched:
+                    watch_date = watched[epi_id]['watchDate']
+                    comment = 'watched ' + watch_date
+                self.out.record({
+                    'show_id': int(show_id), 'show': epis['title'],
+                    'season': next_season, 'episode': next_episode['episodeNumber'],
+                    'id': next_episode['id'], 'title': next_episode['title'],
+                    'watch_date': watch_date,
+                }, '  "{0}" (s{1:02d}e{2:02d}) {3}'.format(
+                    tr_out(next_episode['title']),
+                    next_episode['seasonNumber'],
+                    next_episode['episodeNumber'],
+                    comment
+                ))
 
     def list_shows(self, alias):
         """ list user shows """
@@ -175,107 +185,161 @@ class MyShowsRu:
         else:
             self.list_show(alias)
 
-    def title_by_alias(self, query, no_exit=False):
-        """ return show id by alias """
+    def title_by_alias(self, query, no_exit=False, fuzzy=True):
+        """ return show title by alias, unknown alias is matched by fuzzy title index
+            if fuzzy: writes do not guess the show unless asked to
+        """
         logging.debug('title_by_alias(%s)', query)
         alias = query.lower()
         if alias in self.config['alias']:
             logging.debug('title_by_alias(%s) = %s', query, self.config['alias'][alias])
             return self.config['alias'][alias]
 
+        match = None
+        if fuzzy:
+            if not self.list_loaded_:
+                self.load_shows()
+            match = self.title_index().resolve(query)
+        if match is not None:
+            title = match[1]
+            logging.debug('title_by_alias(%s) ~ %s (%.2f)', query, title, match[0])
+            if normalize(title) != normalize(query):
+                self.out.message(f'Unknown alias "{query}", using "{tr_out(title)}"')
+            return title
+
         logging.debug('Unknown alias - "%s"', alias)
         if no_exit:
-            print(f'Cannot find alias "{query}", will try it as title!')
+            self.out.message(f'Cannot find alias "{query}", will try it as title!')
             return query
 
+        self.out.flush()
         print(f'Unknown alias - {query}')
         sys.exit(1)
 
+    def title_index(self):
+        """ return fuzzy index of show names: built from loaded shows and aliases
+            and persisted in cache, else the persisted one or the one of aliases only
+        """
+        aliases = self.config['alias']
+        if self.list_loaded_:
+            return derived(
+                self.derived_data, 'fuzzy', self.shows_data,
+                lambda shows_data: cached_index(self.api.cache, shows_data, aliases)
+            )
+
+        index = persisted_index(self.api.cache, aliases)
+        if index is not None:
+            return index
+        return derived(
+            self.derived_data, 'fuzzy', aliases, lambda aliases: TitleIndex.build({}, aliases)
+        )
+
     def alias_by_title(self, title):
         """ return show alias by title """
         logging.debug('alias_by_title(%s)', title)
-        for alias, a_title in self.config['alias'].items():
-            if a_title == title:
-                return alias
 
-        return ''
+        def build_index(aliases):
+            index = {}
+            for alias, a_title in aliases.items():
+                index.setdefault(a_title, alias)
+            return index
 
-    def id_by_title(self, title):
-        """ return show id by title """
+        return derived(
+            self.derived_data, 'aliases', self.config['alias'], build_index
+        ).get(title, '')
+
+    def id_by_title(self, title, no_exit=False):
+        """ return show id by title, None for unknown title if no_exit """
         logging.debug('id_by_title(%s)', title)
         if not self.list_loaded_:
             self.load_shows()
 
-        for show_id in self.shows_data:
-            next_show = self.shows_data[show_id]
-            logging.debug('id_by_title(%s) = %s', next_show['title'], show_id)
-            if next_show['title'] == title:
-                logging.debug('Found id_by_title(%s) = %s', title, show_id)
-                return show_id
+        def build_index(shows_data):
+            index = {}
+            for show_id in shows_data:
+                index.setdefault(shows_data[show_id]['title'], show_id)
+            return index
 
+        index = derived(self.derived_data, 'titles', self.shows_data, build_index)
+        if title in index:
+            logging.debug('Found id_by_title(%s) = %s', title, index[title])
+            return index[title]
+        if no_exit:
+            return None
+
+        self.out.flush()
         print(f'Unknown title - {title}')
         sys.exit(1)
 
     def load_episodes(self, show_id):
         """ load episode data by show id """
-        if not self.logged_:
-            self.do_login()
-        if show_id not in self.episodes_data:
-            logging.debug(
-                'Load episodes: %s%s',
-                self.api_url, self.config['url']['list_episodes'].format(show_id)
-            )
-            request = urllib.request.Request(
-                self.api_url + self.config['url']['list_episodes'].format(show_id)
-            )
-            handle = self.opener.open(request)
-            self.episodes_data[show_id] = episodes = json.loads(handle.read().decode('utf-8'))
-            logging.debug('Loaded episodes: %s', episodes)
+        show_id = str(show_id)
+        if show_id in self.episodes_data:
+            return self.episodes_data[show_id]
+
+        with self.api.profiler.phase('load_episodes'):
+            if self.api.offline:
+                epis = self.local.store.episodes(show_id)
+                if epis is None:
+                    self.out.flush()
+                    print(f'Episodes of show {show_id} are not synced, run sync')
+                    sys.exit(1)
+            else:
+                epis = None
+                if self.local.local_first:
+                    epis = self.local.api_json(self.api.cache, 'episodes', show_id)
+                epis = epis or self.api.load_json(
+                    'episodes', show_id, self.config['url']['list_episodes'].format(show_id),
+                    stamp=self.api.sync_stamp(
+                        'episodes', show_id, self.shows_data if self.list_loaded_ else {}
+                    )
+                )
+        self.episodes_data[show_id] = epis
+        logging.debug('Loaded %s episodes of show %s', len(epis['episodes']), show_id)
 
-        return self.episodes_data[show_id]
+        return epis
 
     def load_watched(self, show_id):
-        """ load watched data by show id """
-        if not self.logged_:
-            self.do_login()
-        if show_id not in self.watched_data:
-            logging.debug(
-                'Load watched: %s%s',
-                self.api_url, self.config['url']['list_watched'].format(show_id)
-            )
-            request = urllib.request.Request(
-                self.api_url + self.config['url']['list_watched'].format(show_id)
-            )
-            handle = self.opener.open(request)
-            self.watched_data[show_id] = watched = json.loads(handle.read().decode('utf-8'))
-            logging.debug('Loaded watched: %s', watched)
-
-        return self.watched_data[show_id]
+        """ load watched data by show id, pending journal checks applied """
+        show_id = str(show_id)
+        if show_id in self.watched_data:
+            return self.watched_data[show_id]
+
+        with self.api.profiler.phase('load_watched'):
+            if self.api.offline:
+                watched = self.local.store.watched(show_id)
+            else:
+                watched = None
+                if self.local.local_first:
+                    watched = self.local.api_json(self.api.cache, 'watched', show_id)
+                if watched is None:
+                    watched = self.api.load_json(
+                        'watched', show_id, self.config['url']['list_watched'].format(show_id),
+                        stamp=self.api.sync_stamp(
+                            'watched', show_id, self.shows_data if self.list_loaded_ else {}
+                        )
+                    )
+        watched = self.local.pending_watched(show_id, watched)
+        self.watched_data[show_id] = watched
+        logging.debug('Loaded %s watched of show %s', len(watched), show_id)
+
+        return watched
+
+    def watch_history(self, show_id):
+        """ return watched episodes of show id sorted by watch date """
+        return derived(
+            self.derived_data, ('history', str(show_id)), self.load_watched(show_id),
+            WatchHistory
+        )
 
     def get_last_watched(self, show_id):
         """ return last watched episode id for show id """
         logging.debug('Searching last watched for show %s', show_id)
-        episodes = self.load_episodes(show_id)['episodes']
-        watched = self.load_watched(show_id)
-
-        last_number = 0
-        episode_id = None
-        for epi_id in watched:
-            logging.debug('Next watched id: %s', epi_id)
-            next_episode = episodes[epi_id]
-            logging.debug(
-                'Trying next episode: %s - %s (id: %s/seq: %s)',
-                next_episode['shortName'], next_episode['title'],
-                next_episode['id'], next_episode['sequenceNumber']
-            )
-            if last_number < next_episode['sequenceNumber']:
-                last_number = next_episode['sequenceNumber']
-                episode_id = epi_id
-                logging.debug(
-                    'Saved next last episode: %s - %s (id: %s)',
-                    next_episode['shortName'], next_episode['title'], episode_id
-                )
-
+        episode_list = derived(
+            self.derived_data, ('sequence', str(show_id)), self.load_episodes(show_id),
+            EpisodeList
+        )
+        episode_id = episode_list.last_of(self.load_watched(show_id))
         logging.debug('Found last watched %s', episode_id)
 
         return episode_id
@@ -286,261 +350,233 @@ class MyShowsRu:
         epis = self.load_episodes(show_id)
         watched = self.load_watched(show_id)
         episode_id = self.get_last_watched(show_id)
-        print()
+        self.out.text()
         if episode_id is None:
-            print(f"{tr_out(epis['title'])} is unwatched")
+            self.out.message(f"{tr_out(epis['title'])} is unwatched")
         else:
             episode = epis['episodes'][episode_id]
-            print('Last for {0} is s{1:02d}e{2:02d} ("{3}") at {4}'.format(
+            self.out.record({
+                'show_id': int(show_id), 'show': epis['title'],
+                'season': episode['seasonNumber'], 'episode': episode['episodeNumber'],
+                'id': episode['id'], 'title': episode['title'],
+                'watch_date': watched[episode_id]['watchDate'],
+            }, 'Last for {0} is s{1:02d}e{2:02d} ("{3}") at {4}'.format(
                 tr_out(epis['title']),
                 episode['seasonNumber'], episode['episodeNumber'],
                 tr_out(episode['title']),
                 watched[episode_id]['watchDate']
             ))
-        print()
-
-    def show_last_watched_by_date(self, alias):
-        """ show last watched episode(s) for date """
-        date_to = datetime.date.today()
-        if alias == 'day':
-            date_from = date_to + datetime.timedelta(days=-1)
-        elif alias == 'week':
-            date_from = date_to + datetime.timedelta(days=-7)
-        elif alias == 'month':
-            prev_month = date_to.replace(day=1) + datetime.timedelta(days=-1)
-            date_from = date_to + datetime.timedelta(days=-prev_month.day)
-        else:
-            print(f'Unknown alias - {alias}')
-            sys.exit(1)
-
-        self.load_shows()
-        print(f"\nWatched from {date_from.strftime('%Y-%m-%d')} to {date_to.strftime('%Y-%m-%d')}\n")
-        re_c = re.compile(r'(\d{1,2})\.(\d{1,2})\.(\d{4})')
-        count = 0
-        for show_id in self.shows_data:
-            next_show = self.shows_data[show_id]
-            if next_show['watchedEpisodes'] <= 0:
-                continue
-            watched = self.load_watched(next_show['showId'])
-            epis = None
-            last_map = {}
-            for epi_id in watched:
-                next_episode = watched[epi_id]
-                re_m = re_c.match(next_episode['watchDate'])
-                if not re_m:
-                    print(f"Warning: unknown date format - {next_episode['watchDate']}")
-                    continue
-                dtv = [int(s) for s in re_m.group(3, 2, 1)]
-                epi_date = datetime.date(dtv[0], dtv[1], dtv[2])
-                if date_from <= epi_date <= date_to:
-                    if not epis:
-                        epis = self.load_episodes(show_id)
-                    count += 1
-                    if epi_id not in epis['episodes']:
-                        print(f'Episode not found: {epi_id}')
-                        logging.debug('Episodes:')
-                        logging.debug(epis)
-                        continue
-
-                    episode = epis['episodes'][epi_id]
-                    date_key = epi_date.toordinal() * 1000\
-                        + episode['seasonNumber'] * 10\
-                        + episode['episodeNumber']
-                    last_map[date_key] = episode
-
-            for date_key in sorted(last_map.keys()):
-                episode = last_map[date_key]
-                print('{0} s{1:02d}e{2:02d} "{3}" at {4}'.format(
-                    tr_out(epis['title']),
-                    episode['seasonNumber'], episode['episodeNumber'],
-                    tr_out(episode['title']),
-                    watched[str(episode['id'])]['watchDate']
-                ))
-        print()
-        print(f'Total count: {count}')
-        print()
+        self.out.text()
 
     def show_last_watched(self, query):
         """ show last watched episode(s) """
         alias = query.lower()
         if alias in ['day', 'week', 'month']:
-            self.show_last_watched_by_date(alias)
+            show_last_watched_by_date(self, alias)
         else:
             self.show_last_watched_by_alias(query)
 
     def get_first_unwatched(self, show_id):
         """ return first unwathced episode for show id """
         logging.debug('Searching first unwatched for show %s', show_id)
-        episodes = self.load_episodes(show_id)['episodes']
-        last_watched = self.get_last_watched(show_id)
-        if last_watched is None:
-            last_watched = 0
-        else:
-            logging.debug(
-                'Last watched is: %s - %s (%s)',
-                episodes[last_watched]['shortName'], episodes[last_watched]['title'],
-                episodes[last_watched]['sequenceNumber']
-            )
-            last_watched = episodes[last_watched]['sequenceNumber']
-
-        logging.debug('Last watched: %s', last_watched)
-
-        episode_id = None
-        first_unwatched = None
-        for epi_id in episodes:
-            next_episode = episodes[epi_id]
-            logging.debug(
-                'Trying next episode: %s - %s (%s)',
-                next_episode['shortName'], next_episode['title'],
-                next_episode['sequenceNumber']
-            )
-            if (
-                (not first_unwatched or
-                 first_unwatched > next_episode['sequenceNumber']) and
-                last_watched < next_episode['sequenceNumber']
-            ):
-                #
-                first_unwatched = next_episode['sequenceNumber']
-                episode_id = epi_id
-                logging.debug(
-                    'Saved next last unwatched: %s - %s (%s)',
-                    next_episode['shortName'], next_episode['title'],
-                    next_episode['sequenceNumber']
-                )
+        journal = self.local.journal
+        if self.api.offline and not (journal and journal.checks(show_id)):
+            return self.local.store.first_unwatched(str(show_id))
+
+        episode_list = derived(
+            self.derived_data, ('sequence', str(show_id)), self.load_episodes(show_id),
+            EpisodeList
+        )
+        episode_id = episode_list.first_unwatched(self.load_watched(show_id))
+        logging.debug('First unwatched: %s', episode_id)
 
         return episode_id
 
     def show_next_for_watch(self, alias):
-        """ show next episode for watch for alias """
+        """ show next episode for watch for alias or for all watching shows """
+        if alias.lower() == 'all':
+            show_next_all(self)
+            return
+
         show_id = self.id_by_title(self.title_by_alias(alias, no_exit=True))
         epis = self.load_episodes(show_id)
         episode_id = self.get_first_unwatched(show_id)
+        self.out.text()
         if episode_id is None:
-            print(f"\nCannot find first watch for {tr_out(epis['title'])}\n")
+            self.out.message(f"Cannot find first watch for {tr_out(epis['title'])}")
         else:
             episode = epis['episodes'][episode_id]
-            print('\nFirst watch for {0} is s{1:02d}e{2:02d} ("{3}")\n'.format(
+            self.out.record({
+                'show_id': int(show_id), 'show': epis['title'],
+                'season': episode['seasonNumber'], 'episode': episode['episodeNumber'],
+                'id': episode['id'], 'title': episode['title'],
+                'air_date': episode['airDate'],
+            }, 'First watch for {0} is s{1:02d}e{2:02d} ("{3}")'.format(
                 tr_out(epis['title']),
                 episode['seasonNumber'], episode['episodeNumber'],
                 tr_out(episode['title']),
             ))
+        self.out.text()
 
-    def set_episode_check(self, alias, epi, check):
-        """ set epi episode as watched """
-        re_m = re.match(r's(\d{1,2})e(\d{1,2})', epi.lower())
-        if not re_m:
-            print(f'Bad format for check - "{epi}"')
-        else:
-            season = int(re_m.group(1))
-            episode = int(re_m.group(2))
-            show_id = self.id_by_title(self.title_by_alias(alias, no_exit=True))
+    def set_episode_check(self, alias, specs, check):
+        """ set episodes by specs as watched/unwatched """
+        with self.local.queuing():
+            show_id = self.id_by_title(self.title_by_alias(alias, no_exit=True, fuzzy=False))
             epis = self.load_episodes(show_id)
+            # pending journal checks are applied over the server state
             watched = self.load_watched(show_id)
-            episodes = epis['episodes']
-            for epi_id in episodes:
-                next_episode = episodes[epi_id]
-                if (
-                    next_episode['seasonNumber'] == season and
-                    next_episode['episodeNumber'] == episode
-                ):
-                    valid_op = False
-                    old_date = ''
-                    if check:
-                        msg = 'checked'
-                        if epi_id in watched:
-                            old_date = watched[epi_id]['watchDate']
-                        else:
-                            url = self.config['url']['check_episode'].format(epi_id)
-                            valid_op = True
-                    else:
-                        msg = 'unchecked'
-                        if epi_id in watched:
-                            url = self.config['url']['uncheck_episode'].format(epi_id)
-                            valid_op = True
-
-                    if not valid_op:
-                        print()
-                        print('Episode "{0}" (s{1:02d}e{2:02d}) of "{3}" already {4} {5}'
-                              .format(
-                                 tr_out(next_episode['title']),
-                                 next_episode['seasonNumber'],
-                                 next_episode['episodeNumber'],
-                                 tr_out(epis['title']),
-                                 msg,
-                                 old_date
-                              ))
-                    else:
-                        logging.debug('Set checked: %s%s', self.api_url, url)
-                        request = urllib.request.Request(self.api_url + url)
-                        self.opener.open(request)
-                        print()
-                        print(
-                            'Episode "{0}" (s{1:02d}e{2:02d}) of "{3}" set {4}'
-                            .format(
-                                tr_out(next_episode['title']),
-                                next_episode['seasonNumber'],
-                                next_episode['episodeNumber'],
-                                tr_out(epis['title']),
-                                msg
-                            ))
-                    break
-
-    def search_show(self, query):
-        """ search show """
-        if not self.logged_:
-            self.do_login()
-        req_data = urllib.parse.urlencode({
-            'q': query,
-        })
-        logging.debug(
-            'Search url/data: %s%s%s',
-            self.api_url, self.config['url']['search'], req_data
-        )
-        request = urllib.request.Request(
-            self.api_url + self.config['url']['search'], req_data.encode('utf-8')
+        msg = 'checked' if check else 'unchecked'
+        epi_ids = select_episodes(
+            derived(
+                self.derived_data, ('numbers', show_id), epis['episodes'], episode_numbers
+            ),
+            specs
         )
-        handle = self.opener.open(request)
-        search_result = json.loads(handle.read().decode('utf-8'))
-        logging.debug('Search result: %s', search_result)
-        return search_result
+        results = send_checks(self, show_id, epi_ids, watched, check)
+        done_msg = 'queued to be ' + msg if self.local.journal else msg
+
+        for epi_id in epi_ids:
+            next_episode = epis['episodes'][epi_id]
+            if epi_id not in results:
+                status = 'already {0} {1}'.format(
+                    msg, watched[epi_id]['watchDate'] if check and epi_id in watched else ''
+                )
+            elif results[epi_id]:
+                status = done_msg if self.local.journal else 'set ' + msg
+            else:
+                status = 'failed to set ' + msg
+            print()
+            print('Episode "{0}" (s{1:02d}e{2:02d}) of "{3}" {4}'.format(
+                tr_out(next_episode['title']),
+                next_episode['seasonNumber'],
+                next_episode['episodeNumber'],
+                tr_out(epis['title']),
+                status
+            ))
+
+        if len(epi_ids) > 1:
+            failed = len(results) - sum(results.values())
+            print(
+                f'\nTotal {len(epi_ids)}: {len(results) - failed} {done_msg}, '
+                f'{len(epi_ids) - len(results)} already {msg}, {failed} failed'
+            )
 
     def show_search_result(self, query):
         """ show search result """
-        search_result = self.search_show(query)
-        print()
+        search_result = self.api.search(query)
+        self.out.text()
         if len(search_result) == 0:
-            print ("Nothing!\n")
+            self.out.message('Nothing!\n')
             sys.exit(1)
 
         for show_id in search_result:
             show = search_result[show_id]
-            print(f"\"{tr_out(show['title'])}\", started: {show['started']} (id={show_id})")
-        print()
+            self.out.record(
+                {'id': int(show_id), 'title': show['title'], 'started': show['started']},
+                f"\"{tr_out(show['title'])}\", started: {show['started']} (id={show_id})"
+            )
+        self.out.text()
 
     def set_show_status(self, alias, status, accurate):
-        """ set show status """
-        title = self.title_by_alias(alias, no_exit=True)
-
-        search_result = self.search_show(title)
-
-        if len(search_result) > 1 and accurate is None:
-            print('Search returned more than one show, use --accurate or --fuzzy!')
-            sys.exit(1)
+        """ set show status, accurate -1 is fuzzy match of user show without search;
+            status queued to journal is set by id of user show without search too
+        """
+        with self.local.queuing():
+            targets = status_targets(self, alias, accurate)
+
+        journal = self.local.journal
+        for show_id, title in targets:
+            if journal:
+                journal.add('status', show_id, show_id, status)
+                print(f'Show "{tr_out(title)}" status queued to be set to {status}\n')
+                continue
+            self.api.send('status', self.config['url']['status'].format(show_id, status))
+            self.invalidate('shows')
+            print(f'Show "{tr_out(title)}" status set to {status}\n')
+
+
+def select_episodes(numbers, specs):
+    """ return unique episode ids of episode_numbers() map for specs in order,
+        report bad and not found specs
+    """
+    epi_ids = []
+    for spec in specs:
+        spec_ids = episodes_by_spec(numbers, spec)
+        if spec_ids is None:
+            print(f'Bad format for check - "{spec}"')
+        elif not spec_ids:
+            print(f'Episode(s) not found - "{spec}"')
+        epi_ids.extend(
+            epi_id for epi_id in spec_ids or [] if epi_id not in epi_ids
+        )
+    return epi_ids
+
+
+def send_checks(myshows, show_id, epi_ids, watched, check):
+    """ set or queue check of episodes of show which are not in that state yet,
+        return {episode id: True if it is set or queued}
+    """
+    changed = [epi_id for epi_id in epi_ids if (epi_id in watched) != check]
+    journal = myshows.local.journal
+    if journal:
+        # prior state is kept for the first pending check of episode only,
+        # when watched is still the server state
+        for epi_id in changed:
+            journal.add_check(epi_id, show_id, check, epi_id in watched)
+        # watched is loaded again with the new checks applied
+        myshows.watched_data.pop(show_id, None)
+        return dict.fromkeys(changed, True)
+
+    url_name = 'check_episode' if check else 'uncheck_episode'
+
+    def set_check(epi_id):
+        try:
+            myshows.api.send(url_name, myshows.config['url'][url_name].format(epi_id))
+        except OSError as ex:
+            logging.debug('Set %s %s failed: %s', url_name, epi_id, ex)
+            return False
+        return True
+
+    results = dict(zip(changed, myshows.api.run_parallel(changed, set_check)))
+    if changed:
+        myshows.invalidate('watched', show_id)
+        myshows.invalidate('shows')
+    return results
+
+
+def status_targets(myshows, alias, accurate):
+    """ return [(show id, title)] of shows to set status of by alias, see set_show_status """
+    if accurate == -1:
+        match = myshows.title_index().resolve(alias)
+        if (match is None or match[2] is None) and not myshows.list_loaded_:
+            # persisted index is missing or outdated
+            myshows.load_shows()
+            match = myshows.title_index().resolve(alias)
+        if match is not None and match[2] is not None:
+            logging.debug('Fuzzy status match %s (%.2f)', match[1], match[0])
+            return [(match[2], match[1])]
+
+    title = myshows.title_by_alias(alias, no_exit=True, fuzzy=accurate == -1)
+    show_id = myshows.id_by_title(title, no_exit=True) if myshows.local.local_first else None
+    if show_id is not None and (
+            accurate is None or title == alias and accurate in (-1, 0, int(show_id))
+    ):
+        return [(show_id, title)]
+
+    search_result = myshows.api.search(title)
+    if len(search_result) > 1 and accurate is None:
+        print('Search returned more than one show, use --accurate or --fuzzy!')
+        sys.exit(1)
 
-        for show_id in search_result:
-            show = search_result[show_id]
-            if accurate is not None:
-                if accurate > 0 and show['id'] != accurate or show['title'] != alias:
-                    continue
-            url = self.config['url']['status'].format(show['id'], status)
-            logging.debug('Set show status: %s%s', self.api_url, url)
-            request = urllib.request.Request(self.api_url + url)
-            self.opener.open(request)
-            print(f'Show "{tr_out(show["title"])}" status set to {status}\n')
+    return [
+        (show['id'], show['title']) for show in search_result.values()
+        if accurate is None
+        or not (accurate > 0 and show['id'] != accurate or show['title'] != alias)
+    ]
 
 
-def main():
-    """ main subroutine """
+def build_parser():
+    """ build command line parser """
     parser = argparse.ArgumentParser()
 
     subparsers = parser.add_subparsers(help='commands')
@@ -558,7 +594,17 @@ def main():
     )
 
     next_parser = subparsers.add_parser('next', help='show next to watch')
-    next_parser.add_argument('next_alias', action='store', help='next alias')
+    next_parser.add_argument(
+        'next_alias', action='store', help='show alias or all for every watching show'
+    )
+
+    calendar_parser = subparsers.add_parser(
+        'calendar', help='show unwatched episodes airing in the next days'
+    )
+    calendar_parser.add_argument(
+        'calendar_days', action='store', type=int, nargs='?', default=DEFAULT_CALENDAR_DAYS,
+        help='number of days from today (default: %(default)s)'
+    )
 
     check_parser = subparsers.add_parser(
         'check', help='check episode as watched, gaS01E02 for example'
@@ -567,7 +613,8 @@ def main():
         'check_alias', action='store', help='show alias'
     )
     check_parser.add_argument(
-        'episode', action='store', help='episode'
+        'episode', action='store', nargs='+',
+        help='episode(s): s01e02, whole season s01 or range s01e01-s02e05'
     )
     uncheck_parser = subparsers.add_parser(
         'uncheck', help='uncheck episode as watched, tgS01E02 for example'
@@ -576,7 +623,8 @@ def main():
         'uncheck_alias', action='store', help='show alias'
     )
     uncheck_parser.add_argument(
-        'episode', action='store', help='episode'
+        'episode', action='store', nargs='+',
+        help='episode(s): s01e02, whole season s01 or range s01e01-s02e05'
     )
     search_parser = subparsers.add_parser(
         'search', help='search show'
@@ -603,7 +651,36 @@ def main():
     status_group.add_argument(
         '--fuzzy', action='store_const',
         const=True, default=False,
-        help='Fuzzy search by name'
+        help='Fuzzy match of user show name by local index, search if not found'
+    )
+    stats_parser = subparsers.add_parser(
+        'stats', help='watch statistics: per show, weekday and month, velocity'
+    )
+    stats_parser.add_argument(
+        '--from', action='store', dest='stats_from', type=datetime.date.fromisoformat,
+        default=None, metavar='YYYY-MM-DD', help='first day (default: first watched)'
+    )
+    stats_parser.add_argument(
+        '--to', action='store', dest='stats_to', type=datetime.date.fromisoformat,
+        default=None, metavar='YYYY-MM-DD', help='last day (default: today)'
+    )
+    flush_parser = subparsers.add_parser(
+        'flush', help='send check/uncheck/status writes queued in journal (config "journal")'
+    )
+    flush_parser.set_defaults(flush_journal=True)
+    sync_parser = subparsers.add_parser(
+        'sync', help='save all shows data to local store for --offline use'
+    )
+    sync_parser.set_defaults(sync_store=True)
+    serve_parser = subparsers.add_parser(
+        'serve',
+        help='run daemon answering list/last/next/search and sending check/uncheck/status'
+        ' on unix socket'
+    )
+    serve_parser.add_argument(
+        '--refresh-interval', action='store', type=int, dest='serve_refresh',
+        default=DEFAULT_REFRESH_INTERVAL,
+        help='data refresh interval in seconds (default: %(default)s)'
     )
 
     parser.add_argument(
@@ -612,31 +689,71 @@ def main():
         help='debug output'
     )
     parser.add_argument(
-        '--config', action='store', default='myshows.cfg',
-        help='config file'
+        '--config', action='append', default=None,
+        help='config file (default: {0}), several ones run command for each account'
+        .format(DEFAULT_CONFIG)
+    )
+    parser.add_argument(
+        '--workers', action='store', type=int, default=None,
+        help='number of parallel requests (default: config "workers" or {0})'
+        .format(DEFAULT_WORKERS)
+    )
+    parser.add_argument(
+        '--refresh', action='store_true',
+        help='revalidate all cached data with the server'
+    )
+    parser.add_argument(
+        '--no-cache', action='store_false', dest='use_cache',
+        help='do not use the on-disk cache'
+    )
+    parser.add_argument(
+        '--profile', action='store_true',
+        help='print request and phase timing at exit'
+    )
+    parser.add_argument(
+        '--profile-json', action='store', default=None, metavar='FILE',
+        help='write request and phase timing to json FILE at exit, keyed by config'
+        ' for several configs'
+    )
+    parser.add_argument(
+        '--format', action='store', choices=FORMATS, default='text',
+        help='output of list, last, next and search: text, json lines or csv (default: text)'
+    )
+    parser.add_argument(
+        '--offline', action='store_true',
+        help='use local store only (see sync command)'
+    )
+    parser.add_argument(
+        '--socket', action='store', default=None,
+        help='daemon socket (default: config "socket"), commands are sent to daemon if it runs'
     )
     parser.add_argument(
         '--info', action='store_const', dest='debug',
         const=logging.INFO, default=logging.ERROR,
         help='info output'
     )
-    cmd_args = parser.parse_args()
+    return parser
 
-    logging.basicConfig(
-        level=cmd_args.debug,
-        format='%(asctime)s %(levelname)s: %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
-    logging.debug('Parsed command line args: %s', cmd_args)
 
-    myshows = MyShowsRu(cmd_args.config)
+def run_command(myshows, cmd_args, account=None):
+    """ run parsed command, return False if there is no command """
+    myshows.out = Output(cmd_args.format, account)
+    try:
+        return run_output_command(myshows, cmd_args)
+    finally:
+        myshows.out.flush()
+
 
+def run_output_command(myshows, cmd_args):
+    """ run parsed command writing to myshows.out, return False if there is no command """
     if 'list_alias' in cmd_args:
         myshows.list_shows(cmd_args.list_alias)
     elif 'last_alias' in cmd_args:
         myshows.show_last_watched(cmd_args.last_alias)
     elif 'next_alias' in cmd_args:
         myshows.show_next_for_watch(cmd_args.next_alias)
+    elif 'calendar_days' in cmd_args:
+        show_calendar(myshows, cmd_args.calendar_days)
     elif 'check_alias' in cmd_args:
         myshows.set_episode_check(cmd_args.check_alias, cmd_args.episode, True)
     elif 'uncheck_alias' in cmd_args:
@@ -650,8 +767,103 @@ def main():
             cmd_args.status_alias, cmd_args.status_value,
             cmd_args.accurate if not cmd_args.fuzzy else -1
         )
+    elif 'stats_from' in cmd_args:
+        show_stats(myshows, cmd_args.stats_from, cmd_args.stats_to)
+    elif 'flush_journal' in cmd_args:
+        from myshows_journal import show_flush
+        show_flush(myshows)
+    elif 'sync_store' in cmd_args:
+        sync_store(myshows)
     else:
-        parser.print_usage()
+        return False
+
+    return True
+
+
+def run_argv(myshows, argv):
+    """ run command line forwarded to daemon """
+    cmd_args = build_parser().parse_args(argv)
+    if not any(name in cmd_args for name in FORWARD_COMMANDS + WRITE_COMMANDS):
+        print('Command is not served by daemon')
+        sys.exit(1)
+    run_command(myshows, cmd_args)
+
+
+def new_session(cmd_args, config_name):
+    """ return session of config with command line options applied """
+    myshows = MyShowsRu(config_name, cmd_args.workers, cmd_args.use_cache, cmd_args.offline)
+    if myshows.api.cache and cmd_args.refresh:
+        myshows.api.cache.revalidate_all = True
+    return myshows
+
+
+def exit_reply(reply):
+    """ write daemon reply and exit with its code """
+    sys.stdout.write(reply[1])
+    sys.exit(reply[0])
+
+
+def main():
+    """ main subroutine """
+    # shell prompt integrations run "next <alias>" often, answer it from daemon at once
+    reply = fast_forward(sys.argv[1:], DEFAULT_CONFIG)
+    if reply is not None:
+        exit_reply(reply)
+
+    parser = build_parser()
+    cmd_args = parser.parse_args()
+
+    logging.basicConfig(
+        level=cmd_args.debug,
+        format='%(asctime)s %(levelname)s: %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    logging.debug('Parsed command line args: %s', cmd_args)
+
+    configs = cmd_args.config or [DEFAULT_CONFIG]
+    if len(configs) > 1:
+        if 'serve_refresh' in cmd_args:
+            print('Daemon serves one config')
+            sys.exit(1)
+        from myshows_batch import run_batch
+        try:
+            sys.exit(run_batch(
+                cmd_args, [new_session(cmd_args, config_name) for config_name in configs],
+                run_command
+            ))
+        except BrokenPipeError:
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+            sys.exit(1)
+    cmd_args.config = configs[0]
+
+    socket_path = daemon_socket(cmd_args.config, cmd_args.socket)
+    reply = forward_command(cmd_args, socket_path, sys.argv[1:])
+    if reply is not None:
+        exit_reply(reply)
+
+    myshows = new_session(cmd_args, cmd_args.config)
+    if 'serve_refresh' in cmd_args:
+        if not socket_path:
+            print('Set daemon socket with --socket or config "socket"')
+            sys.exit(1)
+        from myshows_daemon import Daemon
+        Daemon(socket_path, myshows, run_argv, cmd_args.serve_refresh).serve()
+        sys.exit(0)
+
+    try:
+        with myshows.api.profiler.phase('command'):
+            if not run_command(myshows, cmd_args):
+                parser.print_usage()
+        notify_written(cmd_args, socket_path)
+    except BrokenPipeError:
+        # output reader (head etc.) exited, stop writing to it up to the exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(1)
+    finally:
+        if cmd_args.profile:
+            myshows.api.profiler.print_table(sys.stderr)
+        if cmd_args.profile_json:
+            myshows.api.profiler.write_json(cmd_args.profile_json)
 
     sys.exit(0)
 
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+""" tests of asyncio api client against local http server """
+
+import asyncio
+import gzip
+import json
+import unittest
+
+from myshows_async import ApiError, AsyncMyShowsRu, body_chunks, read_response
+
+WATCHED = {'1': {'id': 1, 'watchDate': '01.01.2020'}}
+
+
+def http_response(status=200, body=b'', headers=None):
+    """ return http/1.1 response with Content-Length """
+    head = [f'HTTP/1.1 {status} Status'] + [
+        f'{name}: {value}' for name, value in dict(
+            {'Content-Length': len(body)}, **(headers or {})
+        ).items()
+    ]
+    return ('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body
+
+
+def stream_reader(data):
+    """ return stream reader of data followed by eof """
+    reader = asyncio.StreamReader()
+    reader.feed_data(data)
+    reader.feed_eof()
+    return reader
+
+
+class FakeApi:
+    """ keep-alive api server: login sets session cookie, profile urls need it,
+        other requests get json; requests lists (method, path) got
+    """
+    def __init__(self):
+        self.server = None
+        # (handler task, writer) of connections
+        self.connections = []
+        self.requests = []
+        self.session = 'session=1'
+        # {(method, path): status} answered instead of data
+        self.errors = {}
+        # close connection after response to these paths
+        self.closing = set()
+        # close connection without response once request of these methods is read
+        self.dropping = set()
+        # requests are answered when it is set
+        self.answering = asyncio.Event()
+        self.answering.set()
+
+    async def start(self):
+        """ start server, return its address """
+        self.server = await asyncio.start_server(self.handle, '127.0.0.1', 0)
+        return f'127.0.0.1:{self.server.sockets[0].getsockname()[1]}'
+
+    async def stop(self):
+        """ stop server, close connections """
+        self.server.close()
+        for _, writer in self.connections:
+            writer.close()
+        await asyncio.gather(*(task for task, _ in self.connections))
+        await self.server.wait_closed()
+
+    def respond(self, method, path, headers):
+        """ return response to request """
+        self.requests.append((method, path))
+        if (method, path) in self.errors:
+            return http_response(self.errors.pop((method, path)))
+        if path == '/login':
+            return http_response(headers={'Set-Cookie': f'{self.session}; Path=/'})
+        if path.startswith('/profile') and headers.get('cookie') != self.session:
+            return http_response(401)
+        return http_response(body=json.dumps(WATCHED).encode())
+
+    async def handle(self, reader, writer):
+        """ answer requests of connection """
+        self.connections.append((asyncio.current_task(), writer))
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    return
+                headers = {}
+                line = await reader.readline()
+                while line.strip():
+                    name, value = line.decode('latin-1').split(':', 1)
+                    headers[name.lower()] = value.strip()
+                    line = await reader.readline()
+                await reader.readexactly(int(headers.get('content-length', 0)))
+                method, path = request_line.decode('latin-1').split()[:2]
+                if method in self.dropping:
+                    self.requests.append((method, path))
+                    return
+                await self.answering.wait()
+                writer.write(self.respond(method, path, headers))
+                await writer.drain()
+                if path in self.closing:
+                    return
+        finally:
+            writer.close()
+
+
+class BodyTest(unittest.IsolatedAsyncioTestCase):
+    """ response body framing and keep-alive """
+    async def read(self, data, method='GET'):
+        """ return (status, body, keep alive) of response data """
+        response, keep_alive = await read_response(stream_reader(data), method)
+        return response.status, response.body, keep_alive
+
+    async def test_chunks(self):
+        """ chunked body with extensions and trailer, Content-Length body, body to eof """
+        headers = {'Transfer-Encoding': 'chunked'}
+        reader = stream_reader(b'3;ext=1\r\nabc\r\n2\r\nde\r\n0\r\nX-Trailer: 1\r\n\r\nrest')
+        self.assertEqual([chunk async for chunk in body_chunks(reader, headers)], [
+            b'abc', b'de',
+        ])
+        self.assertEqual(await reader.read(), b'rest')
+        reader = stream_reader(b'abcdefgh')
+        self.assertEqual(
+            b''.join([chunk async for chunk in body_chunks(reader, {'Content-Length': '5'})]),
+            b'abcde'
+        )
+        reader = stream_reader(b'abcdefgh')
+        self.assertEqual(
+            b''.join([chunk async for chunk in body_chunks(reader, {})]), b'abcdefgh'
+        )
+
+    async def test_short_body(self):
+        """ body shorter than Content-Length is an error """
+        with self.assertRaises(asyncio.IncompleteReadError):
+            await self.read(b'HTTP/1.1 200 OK\r\nContent-Length: 5\r\n\r\nabc')
+
+    async def test_keep_alive(self):
+        """ connection is reused after http/1.1 response of known length only """
+        for data, expected in (
+                (http_response(body=b'{}'), (200, b'{}', True)),
+                (http_response(body=b'{}', headers={'Connection': 'close'}),
+                 (200, b'{}', False)),
+                (b'HTTP/1.0 200 OK\r\nContent-Length: 2\r\n\r\n{}', (200, b'{}', False)),
+                (b'HTTP/1.1 200 OK\r\n\r\n{}', (200, b'{}', False)),
+                (b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n2\r\n{}\r\n0\r\n\r\n',
+                 (200, b'{}', True)),
+                (b'HTTP/1.1 304 Not Modified\r\n\r\n', (304, b'', True)),
+        ):
+            self.assertEqual(await self.read(data), expected, data)
+        self.assertEqual(
+            await self.read(b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\n', 'HEAD'),
+            (200, b'', True)
+        )
+
+    async def test_interim(self):
+        """ 1xx responses are skipped, the final one is returned """
+        self.assertEqual(await self.read(
+            b'HTTP/1.1 100 Continue\r\n\r\nHTTP/1.1 102 Processing\r\n\r\n'
+            + http_response(201, b'{}')
+        ), (201, b'{}', True))
+
+    async def test_gzip(self):
+        """ body is decompressed """
+        self.assertEqual(await self.read(http_response(
+            body=gzip.compress(b'{"1": 2}'), headers={'Content-Encoding': 'gzip'}
+        )), (200, b'{"1": 2}', True))
+
+    async def test_closed(self):
+        """ closed connection without response is a connection error """
+        with self.assertRaises(ConnectionError):
+            await self.read(b'')
+
+
+class ClientTest(unittest.IsolatedAsyncioTestCase):
+    """ requests of AsyncMyShowsRu over pooled connections """
+    def setUp(self):
+        self.api = FakeApi()
+        self.client = None
+
+    async def asyncSetUp(self):
+        self.client = AsyncMyShowsRu('test.cfg', {
+            'api_domain': await self.api.start(), 'api_scheme': 'http',
+            'login': {'name': 'demo', 'md5pass': 'x'},
+            'url': {
+                'login': '/login', 'list_watched': '/profile/shows/{0}/',
+                'list_episodes': '/shows/{0}', 'search': '/search',
+            },
+            'retry': {'backoff': 0.01},
+        })
+        self.addAsyncCleanup(self.api.stop)
+        self.addCleanup(self.client.close)
+
+    async def test_login_reuse(self):
+        """ login goes first, requests share one connection """
+        self.assertEqual(await self.client.load_watched(10), WATCHED)
+        self.assertEqual(await self.client.load_watched(20), WATCHED)
+        self.assertEqual(self.api.requests, [
+            ('POST', '/login'), ('GET', '/profile/shows/10/'), ('GET', '/profile/shows/20/'),
+        ])
+        self.assertEqual(len(self.api.connections), 1)
+
+    async def test_relogin(self):
+        """ expired session is renewed by login once """
+        await self.client.load_watched(10)
+        self.api.session = 'session=2'
+        await self.client.load_watched(20)
+        self.assertEqual(self.api.requests[1:], [
+            ('GET', '/profile/shows/10/'), ('GET', '/profile/shows/20/'),
+            ('POST', '/login'), ('GET', '/profile/shows/20/'),
+        ])
+        self.assertEqual(self.client.login_gen_, 2)
+
+    async def test_login_error(self):
+        """ rejected login is LoginError """
+        self.api.errors[('POST', '/login')] = 403
+        with self.assertRaises(ApiError) as error:
+            await self.client.load_watched(10)
+        self.assertEqual(error.exception.status, 403)
+        self.assertEqual(type(error.exception).__name__, 'LoginError')
+
+    async def test_retry(self):
+        """ server error is retried, not found is not """
+        self.api.errors[('GET', '/shows/10')] = 503
+        self.assertEqual(await self.client.load_json('watched', '/shows/10'), WATCHED)
+        self.api.errors[('GET', '/shows/20')] = 404
+        with self.assertRaises(ApiError) as error:
+            await self.client.load_json('watched', '/shows/20')
+        self.assertEqual(error.exception.status, 404)
+        self.assertEqual(self.api.requests.count(('GET', '/shows/10')), 2)
+
+    async def test_resend(self):
+        """ GET is resent on new connection after reused one was closed """
+        self.api.closing.add('/shows/10')
+        await self.client.load_json('watched', '/shows/10')
+        # let the client see eof of the closed connection
+        await asyncio.sleep(0.05)
+        await self.client.load_json('watched', '/shows/20')
+        self.assertEqual(self.api.requests[1:], [('GET', '/shows/10'), ('GET', '/shows/20')])
+        self.assertEqual(len(self.api.connections), 2)
+
+    async def test_post_once(self):
+        """ POST written to reused connection is not sent again """
+        await self.client.load_json('watched', '/shows/10')
+        self.api.dropping.add('POST')
+        with self.assertRaises(ApiError):
+            await self.client.search_show('bench')
+        self.assertEqual(self.api.requests[1:], [('GET', '/shows/10'), ('POST', '/search')])
+
+    async def test_inflight(self):
+        """ concurrent loads of the same url share one request """
+        self.api.answering.clear()
+        loads = [
+            asyncio.ensure_future(self.client.load_episodes(10)),
+            asyncio.ensure_future(self.client.load_json('episodes', '/shows/10')),
+        ]
+        await asyncio.sleep(0.05)
+        self.api.answering.set()
+        first, second = await asyncio.gather(*loads)
+        self.assertIs(first, second)
+        self.assertEqual(self.api.requests[1:], [('GET', '/shows/10')])
+        self.assertEqual(self.client.inflight_, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# vim: ts=4 sw=4
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+""" tests of one command run for accounts of several configs """
+
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import types
+import unittest
+
+from myshows_batch import run_batch
+from myshows_output import Output
+from myshowsru import MyShowsRu
+
+
+def run_command(myshows, cmd_args, account):
+    """ command of test batch: rows of account, exit by config "exit" """
+    myshows.out = Output(cmd_args.format)
+    myshows.out.record({'n': 1}, f'{account} one')
+    myshows.out.record({'n': 2}, f'{account} two')
+    myshows.out.flush()
+    if 'exit' in myshows.config:
+        sys.exit(myshows.config['exit'])
+
+
+class RunBatchTest(unittest.TestCase):
+    """ run_batch output, exit codes and profiles """
+    def setUp(self):
+        self.config_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.config_dir, True)
+
+    def sessions(self, *exits):
+        """ return sessions of configs exiting with exits, None for no exit """
+        sessions = []
+        for num, code in enumerate(exits):
+            config = {
+                'api_domain': 'localhost', 'login': {'name': f'user{num}', 'md5pass': 'x'},
+                'url': {}, 'alias': {},
+            }
+            if code is not None:
+                config['exit'] = code
+            config_name = os.path.join(self.config_dir, f'acc{num}.cfg')
+            with open(config_name, mode='w', encoding='utf8') as cfg_file:
+                json.dump(config, cfg_file)
+            sessions.append(MyShowsRu(config_name))
+        return sessions
+
+    def run_batch(self, sessions, fmt='text', profile_json=None):
+        """ return (exit code, stdout, stderr) of batch run """
+        cmd_args = types.SimpleNamespace(format=fmt, profile=False, profile_json=profile_json)
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            code = run_batch(cmd_args, sessions, run_command)
+        return code, stdout.getvalue(), stderr.getvalue()
+
+    def test_text(self):
+        """ output of every account under its config, in configs order """
+        sessions = self.sessions(None, None)
+        code, stdout, stderr = self.run_batch(sessions)
+        self.assertEqual(code, 0)
+        self.assertEqual(stdout, ''.join(
+            f'[{myshows.config_name}]\n{myshows.config_name} one\n'
+            f'{myshows.config_name} two\n\n'
+            for myshows in sessions
+        ))
+        self.assertEqual(stderr, '')
+
+    def test_csv(self):
+        """ one csv header for all accounts """
+        code, stdout, _ = self.run_batch(self.sessions(None, None), 'csv')
+        self.assertEqual(code, 0)
+        self.assertEqual(stdout.splitlines(), ['n', '1', '2', '1', '2'])
+
+    def test_exit(self):
+        """ exit of one account ends its command only, the worst code is returned """
+        sessions = self.sessions(2, None, 'No shows', 0)
+        code, stdout, stderr = self.run_batch(sessions)
+        self.assertEqual(code, 2)
+        for myshows in sessions:
+            self.assertIn(f'{myshows.config_name} two\n', stdout)
+        self.assertEqual(stderr.splitlines(), [
+            f'[{sessions[0].config_name}] exit code 2',
+            f'[{sessions[2].config_name}] exit code 1: No shows',
+        ])
+
+    def test_profile_json(self):
+        """ profiles of all accounts are written even if one exits """
+        sessions = self.sessions(1, None)
+        profile_json = os.path.join(self.config_dir, 'profile.json')
+        code, _, _ = self.run_batch(sessions, profile_json=profile_json)
+        self.assertEqual(code, 1)
+        with open(profile_json, encoding='utf8') as profile_file:
+            profiles = json.load(profile_file)
+        self.assertEqual(sorted(profiles), sorted(myshows.config_name for myshows in sessions))
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# vim: ts=4 sw=4
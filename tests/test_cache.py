@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+""" tests of on-disk api data cache """
+
+import shutil
+import tempfile
+import time
+import unittest
+
+from myshows_cache import DiskCache
+
+
+class DiskCacheTest(unittest.TestCase):
+    """ DiskCache entries, ttl and validators """
+    def setUp(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir, True)
+        self.cache = DiskCache(cache_dir, {'watched': 60})
+
+    def aged(self, kind, key, seconds):
+        """ return entry of key as if it was stored seconds ago """
+        entry = self.cache.get(kind, key)
+        entry['stored'] = time.time() - seconds
+        return entry
+
+    def test_put_get(self):
+        """ entry keeps data and validators """
+        data = {'1': {'id': 1, 'watchDate': '01.02.2020'}}
+        self.assertEqual(
+            self.cache.put('watched', '10', data, ('"etag"', 'Mon, 01 Jan 2024')), data
+        )
+        entry = self.cache.get('watched', '10')
+        self.assertEqual(entry['data'], data)
+        self.assertEqual(entry['etag'], '"etag"')
+        self.assertEqual(entry['modified'], 'Mon, 01 Jan 2024')
+        self.assertIsNone(self.cache.get('watched', '11'))
+
+    def test_ttl(self):
+        """ entry is fresh for ttl of its kind """
+        self.cache.put('watched', '10', {})
+        self.assertTrue(self.cache.fresh('watched', self.aged('watched', '10', 30)))
+        self.assertFalse(self.cache.fresh('watched', self.aged('watched', '10', 90)))
+
+    def test_ended_show_episodes(self):
+        """ episodes of ended show are fresh for ended ttl """
+        self.cache.put('episodes', '10', {'status': 'Ended', 'episodes': {}})
+        self.cache.put('episodes', '11', {'status': 'Returning Series', 'episodes': {}})
+        two_days = 2 * 24 * 3600
+        self.assertTrue(self.cache.fresh('episodes', self.aged('episodes', '10', two_days)))
+        self.assertFalse(self.cache.fresh('episodes', self.aged('episodes', '11', two_days)))
+
+    def test_stamp(self):
+        """ entry with the same stamp is fresh regardless of age, revalidation
+            skips ttl but not stamp
+        """
+        self.cache.put('watched', '10', {}, stamp=[5, 10])
+        entry = self.aged('watched', '10', 3600)
+        self.assertTrue(self.cache.fresh('watched', entry, [5, 10]))
+        self.assertFalse(self.cache.fresh('watched', entry, [6, 10]))
+        self.assertTrue(self.cache.fresh('watched', entry, [5, 10], revalidate=True))
+        self.assertFalse(
+            self.cache.fresh('watched', self.cache.get('watched', '10'), revalidate=True)
+        )
+
+    def test_revalidate_all(self):
+        """ --refresh makes every entry stale """
+        self.cache.put('watched', '10', {}, stamp=[5, 10])
+        self.cache.revalidate_all = True
+        self.assertFalse(self.cache.fresh('watched', self.cache.get('watched', '10'), [5, 10]))
+
+    def test_invalidate(self):
+        """ key, kind and whole cache are dropped """
+        for kind, key in (('watched', '10'), ('watched', '11'), ('shows', 'all')):
+            self.cache.put(kind, key, {})
+        self.cache.invalidate('watched', '10')
+        self.assertIsNone(self.cache.get('watched', '10'))
+        self.assertIsNotNone(self.cache.get('watched', '11'))
+        self.cache.invalidate('watched')
+        self.assertIsNone(self.cache.get('watched', '11'))
+        self.assertIsNotNone(self.cache.get('shows', 'all'))
+        self.cache.invalidate()
+        self.assertIsNone(self.cache.get('shows', 'all'))
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# vim: ts=4 sw=4
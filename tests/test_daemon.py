@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+""" tests of serve daemon: forwarded commands, reload, data refresh """
+
+import json
+import logging
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import types
+import unittest
+from unittest import mock
+
+from myshows_daemon import Daemon, forward, remove_stale_socket, replace_data
+from myshows_forward import fast_forward
+from myshows_local import LocalData
+
+
+def run_argv(myshows, argv):
+    """ command line runner of test daemon: echo, exit or fail """
+    myshows.commands.append(argv)
+    if argv[0] == 'exit':
+        print('bye')
+        raise SystemExit(int(argv[1]))
+    if argv[0] == 'fail':
+        raise ValueError(argv[1])
+    print(' '.join(argv))
+
+
+class DaemonTest(unittest.TestCase):
+    """ Daemon serving commands on unix socket """
+    def setUp(self):
+        self.socket_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.socket_dir, True)
+        self.socket_path = os.path.join(self.socket_dir, 'daemon.sock')
+        self.myshows = mock.Mock(commands=[])
+        daemon = Daemon(self.socket_path, self.myshows, run_argv, 300)
+        thread = threading.Thread(target=daemon.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(daemon.server_close)
+        self.addCleanup(daemon.shutdown)
+
+    def test_forward(self):
+        """ command output and exit code are sent back """
+        self.assertEqual(forward(self.socket_path, ['list', 'bench']), (0, 'list bench\n'))
+        self.assertEqual(forward(self.socket_path, ['exit', '2']), (2, 'bye\n'))
+        with self.assertLogs(level=logging.ERROR):
+            self.assertEqual(forward(self.socket_path, ['fail', 'bug']), (1, ''))
+        self.assertEqual(self.myshows.commands, [
+            ['list', 'bench'], ['exit', '2'], ['fail', 'bug'],
+        ])
+
+    def test_reload(self):
+        """ reload drops loaded shows and watched data """
+        self.assertEqual(forward(self.socket_path, None), (0, ''))
+        self.assertEqual(self.myshows.invalidate.call_args_list, [
+            mock.call('shows'), mock.call('watched'),
+        ])
+        self.assertEqual(self.myshows.commands, [])
+
+    def test_no_daemon(self):
+        """ forward to socket without daemon is None """
+        self.assertIsNone(forward(os.path.join(self.socket_dir, 'none.sock'), ['list', 'a']))
+
+    def test_stale_socket(self):
+        """ socket of running daemon is kept, socket of dead one is removed """
+        with self.assertRaises(OSError):
+            remove_stale_socket(self.socket_path)
+        stale_path = os.path.join(self.socket_dir, 'stale.sock')
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.bind(stale_path)
+        remove_stale_socket(stale_path)
+        self.assertFalse(os.path.exists(stale_path))
+
+    def test_fast_forward(self):
+        """ plain read command lines are forwarded to daemon of config """
+        config_name = os.path.join(self.socket_dir, 'myshows.cfg')
+        with open(config_name, mode='w', encoding='utf8') as cfg_file:
+            json.dump({'socket': 'daemon.sock'}, cfg_file)
+        self.assertEqual(fast_forward(['next', 'bench'], config_name), (0, 'next bench\n'))
+        self.assertEqual(
+            fast_forward(['--socket', self.socket_path, 'last', 'week'], 'none.cfg'),
+            (0, '--socket ' + self.socket_path + ' last week\n')
+        )
+        for argv in (
+                ['check', 'bench', 's01e01'], ['next', '--format', 'csv'],
+                ['--offline', 'next', 'bench'], ['stats'],
+        ):
+            self.assertIsNone(fast_forward(argv, config_name), argv)
+        self.assertEqual(len(self.myshows.commands), 2)
+
+
+class ReplaceDataTest(unittest.TestCase):
+    """ data refreshed by daemon """
+    def test_replace(self):
+        """ episodes of shows with new episodes are dropped, watched is replaced """
+        myshows = types.SimpleNamespace(
+            shows_data={
+                '10': {'totalEpisodes': 5}, '20': {'totalEpisodes': 3},
+            },
+            episodes_data={'10': 'episodes 10', '20': 'episodes 20'},
+            watched_data={'10': {}}, list_loaded_=False, local=LocalData(),
+        )
+        watched = {'1': {'id': 1, 'watchDate': '01.01.2020'}}
+        replace_data(myshows, {
+            '10': {'totalEpisodes': 6}, '20': {'totalEpisodes': 3}, '30': {'totalEpisodes': 1},
+        }, {'10': watched})
+        self.assertEqual(myshows.episodes_data, {'20': 'episodes 20'})
+        self.assertEqual(sorted(myshows.shows_data), ['10', '20', '30'])
+        self.assertTrue(myshows.list_loaded_)
+        self.assertEqual(myshows.watched_data, {'10': watched})
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# vim: ts=4 sw=4
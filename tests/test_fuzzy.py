@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+""" tests of fuzzy alias and title matching """
+
+import json
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from myshows_cache import DiskCache
+from myshows_fuzzy import (
+    TitleIndex, cached_index, edit_distance, normalize, persisted_index, trigrams
+)
+
+SHOWS = {
+    '1': {'title': 'Breaking Bad', 'ruTitle': 'Во все тяжкие'},
+    '2': {'title': 'Better Call Saul', 'ruTitle': 'Лучше звоните Солу'},
+    '3': {'title': 'The Bench', 'ruTitle': None},
+    '4': {'title': 'Bones', 'ruTitle': 'Кости'},
+}
+ALIASES = {'bb': 'Breaking Bad', 'bench': 'The Bench', 'got': 'Game of Thrones'}
+
+
+class EditDistanceTest(unittest.TestCase):
+    """ optimal string alignment distance """
+    def test_distance(self):
+        """ insertions, deletions, substitutions and adjacent transpositions """
+        for typo, name, distance in (
+                ('bench', 'bench', 0), ('benh', 'bench', 1), ('bnech', 'bench', 1),
+                ('bemch', 'bench', 1), ('benchh', 'bench', 1), ('', 'abc', 3),
+                ('ca', 'abc', 3),
+        ):
+            self.assertEqual(edit_distance(typo, name), distance, (typo, name))
+            self.assertEqual(edit_distance(name, typo), distance, (name, typo))
+
+    def test_normalize(self):
+        """ case, punctuation and spaces """
+        self.assertEqual(normalize('  The_Office (US)! '), ' the office us ')
+        self.assertEqual(trigrams('ab'), {' ab', 'ab '})
+
+
+class TitleIndexTest(unittest.TestCase):
+    """ resolving aliases and titles by trigram and edit scores """
+    def setUp(self):
+        self.index = TitleIndex.build(SHOWS, ALIASES)
+
+    def test_resolve(self):
+        """ typos of titles, russian titles and aliases """
+        for query, title in (
+                ('breaking bda', 'Breaking Bad'), ('better call soul', 'Better Call Saul'),
+                ('лучше звоните солу', 'Better Call Saul'), ('benh', 'The Bench'),
+                ('bnech', 'The Bench'), ('game of throne', 'Game of Thrones'),
+        ):
+            match = self.index.resolve(query)
+            self.assertIsNotNone(match, query)
+            self.assertEqual(match[1], title, query)
+
+    def test_show_ids(self):
+        """ titles of profile shows have ids, alias only titles do not """
+        self.assertEqual(self.index.resolve('breaking bad')[2], '1')
+        self.assertIsNone(self.index.resolve('game of thrones')[2])
+
+    def test_unknown(self):
+        """ no match and ambiguous match are not resolved """
+        self.assertIsNone(self.index.resolve('zzzzzz'))
+        self.assertEqual(self.index.search('zzzzzz'), [])
+        index = TitleIndex.build({}, {'one': 'Show One', 'two': 'Show Two'})
+        self.assertEqual(len(index.search('show')), 2)
+        self.assertIsNone(index.resolve('show'))
+
+    def test_from_json(self):
+        """ loaded index matches as the built one without recounting trigrams """
+        data = json.loads(json.dumps(self.index.to_json()))
+        with mock.patch('myshows_fuzzy.trigrams', side_effect=AssertionError):
+            index = TitleIndex.from_json(data)
+        self.assertEqual(index.sizes, self.index.sizes)
+        for query in ('benh', 'breaking bda', 'кости'):
+            self.assertEqual(index.search(query), self.index.search(query), query)
+
+
+class PersistedIndexTest(unittest.TestCase):
+    """ index kept in disk cache """
+    def setUp(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir, True)
+        self.cache = DiskCache(cache_dir)
+
+    def test_reuse(self):
+        """ index is built once for the same shows and aliases """
+        cached_index(self.cache, SHOWS, ALIASES)
+        with mock.patch.object(TitleIndex, 'build', side_effect=AssertionError):
+            index = cached_index(self.cache, SHOWS, ALIASES)
+            self.assertIsNotNone(persisted_index(self.cache, ALIASES))
+        self.assertEqual(index.resolve('benh')[1], 'The Bench')
+
+    def test_outdated(self):
+        """ changed shows rebuild index, changed aliases make persisted one unusable """
+        cached_index(self.cache, SHOWS, ALIASES)
+        shows = dict(SHOWS, **{'5': {'title': 'Benched', 'ruTitle': None}})
+        self.assertIn('Benched', cached_index(self.cache, shows, ALIASES).titles)
+        self.assertIsNone(persisted_index(self.cache, {'bb': 'Breaking Bad'}))
+        self.assertIsNone(persisted_index(None, ALIASES))
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# vim: ts=4 sw=4
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+""" tests of http transport: backoff, rate limit, request coalescing, decompression,
+    resending over pooled connections
+"""
+
+import email.utils
+import gzip
+import io
+import socketserver
+import sys
+import threading
+import time
+import unittest
+import urllib.error
+import urllib.request
+import zlib
+from unittest import mock
+
+from myshows_http import (
+    DECODE_CHUNK, DeadlineExceeded, DecodingReader, HttpSession, InflightRequests,
+    TokenBucket, WrittenRequestFailed, content_decoder, retry_delay
+)
+
+# body of several decompression steps
+BODY = b''.join(b'{"%d": "episode %d"}' % (num, num * num) for num in range(10000))
+
+
+class RetryDelayTest(unittest.TestCase):
+    """ jittered exponential backoff and Retry-After """
+    def test_backoff(self):
+        """ delay is within the doubled backoff of attempt, capped by max_backoff """
+        for attempt, limit in ((0, 0.5), (1, 1.0), (3, 4.0), (10, 30)):
+            for _ in range(50):
+                delay = retry_delay(attempt, None, 0.5, 30)
+                self.assertTrue(0 <= delay <= limit, (attempt, delay))
+
+    def test_retry_after(self):
+        """ Retry-After seconds or http date is waited at least, bad value is ignored """
+        self.assertGreaterEqual(retry_delay(0, '7', 0.5, 30), 7)
+        retry_at = email.utils.formatdate(time.time() + 20, usegmt=True)
+        self.assertGreater(retry_delay(0, retry_at, 0.5, 30), 18)
+        self.assertLessEqual(retry_delay(0, 'soon', 0.5, 30), 0.5)
+
+
+class TokenBucketTest(unittest.TestCase):
+    """ rate limiter """
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch('myshows_http.time.monotonic', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_burst(self):
+        """ burst is taken at once, then tokens come at rate """
+        bucket = TokenBucket(per_second=10, burst=3)
+        for _ in range(3):
+            self.assertEqual(bucket.take(self.now + 60), 0)
+        self.assertAlmostEqual(bucket.take(self.now + 60), 0.1)
+        self.now += 0.1
+        self.assertEqual(bucket.take(self.now + 60), 0)
+
+    def test_refill_limit(self):
+        """ idle time refills up to burst only """
+        bucket = TokenBucket(per_second=10, burst=2)
+        self.now += 3600
+        for _ in range(2):
+            self.assertEqual(bucket.take(self.now + 60), 0)
+        self.assertGreater(bucket.take(self.now + 60), 0)
+
+    def test_deadline(self):
+        """ wait past deadline is a URLError """
+        bucket = TokenBucket(per_second=1, burst=1)
+        bucket.take(self.now + 60)
+        with self.assertRaises(DeadlineExceeded) as raised:
+            bucket.take(self.now + 0.5)
+        self.assertIsInstance(raised.exception, urllib.error.URLError)
+
+
+class InflightRequestsTest(unittest.TestCase):
+    """ coalescing of the same requests sent by threads """
+    def run_two(self, first_send, second_send):
+        """ run sends of the same key, the second one while the first is in flight;
+            return {thread: result or exception}
+        """
+        inflight = InflightRequests()
+        sending = threading.Event()
+        results = {}
+
+        def slow_send():
+            sending.set()
+            time.sleep(0.1)
+            return first_send()
+
+        def run(name, send):
+            try:
+                results[name] = inflight.run('key', send)
+            except BaseException as ex:  # pylint: disable=broad-except
+                results[name] = ex
+
+        first = threading.Thread(target=run, args=('first', slow_send))
+        first.start()
+        sending.wait()
+        run('second', second_send)
+        first.join()
+        self.assertEqual(inflight.futures, {})
+        return results
+
+    def test_coalesced(self):
+        """ the second request waits for the result of the first """
+        results = self.run_two(lambda: 'data', lambda: 'other')
+        self.assertEqual(results, {'first': ('data', False), 'second': ('data', True)})
+
+    def test_error(self):
+        """ error of the request is raised in every waiter """
+        def fail():
+            raise urllib.error.URLError('down')
+        results = self.run_two(fail, lambda: 'other')
+        self.assertIsInstance(results['first'], urllib.error.URLError)
+        self.assertIs(results['second'], results['first'])
+
+    def test_exit(self):
+        """ exit of the sending session is not shared, waiter sends request itself """
+        results = self.run_two(lambda: sys.exit(1), lambda: 'other')
+        self.assertIsInstance(results['first'], SystemExit)
+        self.assertEqual(results['second'], ('other', False))
+
+
+class DecodingReaderTest(unittest.TestCase):
+    """ incremental decompression of response body """
+    def read_all(self, data, encoding, size):
+        """ return body of compressed data read by size bytes """
+        reader = DecodingReader(io.BytesIO(data), encoding)
+        chunks = []
+        while True:
+            chunk = reader.read(size)
+            if not chunk:
+                break
+            self.assertLessEqual(len(chunk), size)
+            chunks.append(chunk)
+        self.assertEqual(reader.bytes_read, len(BODY))
+        return b''.join(chunks)
+
+    def test_encodings(self):
+        """ body is the same whatever encoding and read size """
+        raw = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+        for encoding, data in (
+                ('gzip', gzip.compress(BODY)),
+                (' X-Gzip ', gzip.compress(BODY)),
+                ('deflate', zlib.compress(BODY)),
+                ('deflate', raw.compress(BODY) + raw.flush()),
+                ('identity', BODY),
+                (None, BODY),
+        ):
+            for size in (1000, DECODE_CHUNK + 1):
+                self.assertEqual(self.read_all(data, encoding, size), BODY, (encoding, size))
+            reader = DecodingReader(io.BytesIO(data), encoding)
+            self.assertEqual(reader.read(), BODY, encoding)
+            self.assertEqual(reader.read(), b'', encoding)
+
+    def test_unsupported(self):
+        """ unknown encoding is an error of the request """
+        with self.assertRaises(urllib.error.URLError):
+            content_decoder('compress')
+        self.assertIsNone(content_decoder('identity'))
+
+
+class DroppingHandler(socketserver.StreamRequestHandler):
+    """ keep-alive http server answering GET, connection is closed after GET /close
+        and on any other request once it was read; server.methods lists requests got
+    """
+    def handle(self):
+        while True:
+            lines = []
+            line = self.rfile.readline()
+            while line not in (b'', b'\r\n'):
+                lines.append(line.decode('latin-1').strip())
+                line = self.rfile.readline()
+            if not lines:
+                return
+            headers = dict(header.lower().split(': ', 1) for header in lines[1:])
+            self.rfile.read(int(headers.get('content-length', 0)))
+            method, path = lines[0].split()[:2]
+            self.server.methods.append(method)
+            if method != 'GET':
+                return
+            self.wfile.write(b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\n{}')
+            if path == '/close':
+                return
+
+
+class PooledResendTest(unittest.TestCase):
+    """ requests failed on reused connections """
+    def setUp(self):
+        server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), DroppingHandler)
+        server.daemon_threads = True
+        server.methods = []
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.server = server
+        self.url = f'http://127.0.0.1:{server.server_address[1]}/'
+        self.session = HttpSession({'retry': {'backoff': 0.01}})
+
+    def test_get(self):
+        """ GET is resent on new connection after reused one was closed """
+        for path in ('close', '', ''):
+            record = {}
+            request = urllib.request.Request(self.url + path)
+            with self.session.open(request, record) as handle:
+                self.assertEqual(handle.read(), b'{}')
+            self.assertEqual(record['status'], 200)
+            self.assertNotIn('retries', record)
+        self.assertEqual(self.server.methods, ['GET'] * 3)
+
+    def test_post_once(self):
+        """ POST written to reused connection is not sent again, even by retries """
+        self.session.open(urllib.request.Request(self.url), {}).read()
+        record = {}
+        with self.assertRaises(WrittenRequestFailed):
+            self.session.open(urllib.request.Request(self.url, b'q=bench'), record)
+        self.assertEqual(self.server.methods, ['GET', 'POST'])
+        self.assertNotIn('retries', record)
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# vim: ts=4 sw=4
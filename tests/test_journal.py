@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+""" tests of write journal and its pending writes applied to loaded data """
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from myshows_journal import WriteJournal
+from myshows_local import LocalData
+
+
+class WriteJournalTest(unittest.TestCase):
+    """ WriteJournal records, collapse and replay results """
+    def setUp(self):
+        journal_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, journal_dir, True)
+        self.path = os.path.join(journal_dir, 'journal.db')
+        self.journal = WriteJournal(self.path)
+        self.addCleanup(self.journal.close)
+
+    def test_checks(self):
+        """ the latest check of every episode of show """
+        self.journal.add_check(1, 10, True, False)
+        self.journal.add_check(2, 10, True, False)
+        self.journal.add_check(1, 10, False, False)
+        self.journal.add_check(3, 20, True, False)
+        checks = self.journal.checks(10)
+        self.assertEqual({epi_id: checked for epi_id, (checked, _) in checks.items()}, {
+            '1': False, '2': True,
+        })
+        self.assertEqual(self.journal.checks(30), {})
+        self.assertEqual(self.journal.count(), 4)
+
+    def test_show_changes(self):
+        """ watched count changes against server state and the latest status """
+        self.journal.add_check(1, 10, True, False)
+        self.journal.add_check(2, 10, True, True)
+        self.journal.add_check(3, 10, False, True)
+        self.journal.add_check(4, 20, True, False)
+        self.journal.add_check(4, 20, False, True)
+        self.journal.add('status', 20, 20, 'watching')
+        self.journal.add('status', 20, 20, 'finished')
+        self.assertEqual(self.journal.show_changes(), {
+            '10': [0, None], '20': [0, 'finished'],
+        })
+        self.journal.add_check(5, 10, True, False)
+        self.assertEqual(self.journal.show_changes()['10'], [1, None])
+
+    def test_collapse(self):
+        """ only the latest write of target is kept, restoring checks are dropped """
+        self.journal.add_check(1, 10, True, False)
+        self.journal.add('status', 10, 10, 'watching')
+        self.journal.add_check(2, 10, True, False)
+        self.journal.add_check(1, 10, False, True)
+        self.journal.add('status', 10, 10, 'finished')
+        writes, dropped = self.journal.collapse()
+        self.assertEqual(
+            [write[1:] for write in writes],
+            [('check', '2', '10', '1'), ('status', '10', '10', 'finished')]
+        )
+        self.assertEqual(dropped, 3)
+        self.assertEqual(self.journal.count(), 2)
+        self.assertEqual(self.journal.collapse(), (writes, 0))
+
+    def test_done_failed(self):
+        """ replayed writes are removed, failed ones are kept with their errors """
+        self.journal.add_check(1, 10, True, False)
+        self.journal.add_check(2, 10, True, False)
+        (first, *_), (second, *_) = self.journal.collapse()[0]
+        self.journal.done([first])
+        self.journal.failed({second: 'HTTP error 500'})
+        self.journal.failed({second: 'HTTP error 502'})
+        self.assertEqual(self.journal.conn.execute(
+            'SELECT target, attempts, error FROM pending'
+        ).fetchall(), [('2', 2, 'HTTP error 502')])
+
+    def test_durable(self):
+        """ writes are kept by journal opened again """
+        self.journal.add('status', 10, 10, 'remove')
+        journal = WriteJournal(self.path)
+        self.addCleanup(journal.close)
+        self.assertEqual(journal.show_changes(), {'10': [0, 'remove']})
+
+
+class PendingWritesTest(unittest.TestCase):
+    """ LocalData overlay of pending journal writes """
+    def setUp(self):
+        journal_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, journal_dir, True)
+        self.local = LocalData(journal_path=os.path.join(journal_dir, 'journal.db'))
+        self.addCleanup(self.local.journal.close)
+
+    def test_no_journal(self):
+        """ data is returned as is without journal or pending writes """
+        watched = {'1': {'id': 1, 'rating': 5, 'watchDate': '01.01.2020'}}
+        self.assertIs(LocalData().pending_watched('10', watched), watched)
+        self.assertIs(self.local.pending_watched('10', watched), watched)
+        shows_data = {'10': {'watchedEpisodes': 1, 'totalEpisodes': 2, 'watchStatus': 'later'}}
+        self.assertIs(self.local.pending_shows(shows_data), shows_data)
+
+    def test_pending_watched(self):
+        """ checked episodes are added with the date recorded, unchecked are removed """
+        watched = {
+            '1': {'id': 1, 'rating': 5, 'watchDate': '01.01.2020'},
+            '2': {'id': 2, 'rating': None, 'watchDate': '02.01.2020'},
+        }
+        self.local.journal.add_check(2, 10, False, True)
+        self.local.journal.add_check(3, 10, True, False)
+        self.local.journal.add_check(1, 10, True, True)
+        pending = self.local.pending_watched('10', watched)
+        self.assertEqual(sorted(pending), ['1', '3'])
+        self.assertIs(pending['1'], watched['1'])
+        self.assertEqual(pending['3']['id'], 3)
+        self.assertRegex(pending['3']['watchDate'], r'^\d\d\.\d\d\.\d{4}$')
+        self.assertEqual(len(watched), 2)
+
+    def test_pending_shows(self):
+        """ watched counts within episodes total, statuses, removed shows """
+        shows_data = {
+            '10': {'watchedEpisodes': 9, 'totalEpisodes': 10, 'watchStatus': 'watching'},
+            '20': {'watchedEpisodes': 1, 'totalEpisodes': 5, 'watchStatus': 'watching'},
+            '30': {'watchedEpisodes': 0, 'totalEpisodes': 5, 'watchStatus': 'later'},
+        }
+        for epi_id in (1, 2):
+            self.local.journal.add_check(epi_id, 10, True, False)
+        self.local.journal.add_check(3, 20, False, True)
+        self.local.journal.add('status', 20, 20, 'cancelled')
+        self.local.journal.add('status', 30, 30, 'remove')
+        self.local.journal.add('status', 40, 40, 'finished')
+        pending = self.local.pending_shows(shows_data)
+        self.assertEqual(sorted(pending), ['10', '20'])
+        self.assertEqual(pending['10']['watchedEpisodes'], 10)
+        self.assertEqual(pending['10']['watchStatus'], 'watching')
+        self.assertEqual(pending['20']['watchedEpisodes'], 0)
+        self.assertEqual(pending['20']['watchStatus'], 'cancelled')
+        self.assertEqual(shows_data['10']['watchedEpisodes'], 9)
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# vim: ts=4 sw=4
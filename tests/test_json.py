@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+""" tests of incremental json decoding """
+
+import io
+import json
+import unittest
+
+from myshows_json import JsonStream, load_compact
+
+
+def stream(data):
+    """ return byte stream of data as json """
+    return io.BytesIO(json.dumps(data, ensure_ascii=False).encode('utf-8'))
+
+
+class JsonStreamTest(unittest.TestCase):
+    """ JsonStream decoding across chunk boundaries """
+    def test_chunks(self):
+        """ values, strings and multibyte characters split by every chunk size """
+        data = {'a': [1, 2.5, None, True], 'title': 'Сериал «1»', 'n': 1234567890}
+        raw = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        for chunk_size in range(1, 12):
+            self.assertEqual(
+                JsonStream(io.BytesIO(raw), chunk_size).read(True), data, chunk_size
+            )
+
+    def test_shape(self):
+        """ members not in shape are skipped, tuple shape keeps listed fields """
+        data = {
+            'keep': {'x': 1, 'y': 2, 'z': {'deep': [1]}}, 'drop': {'x': [1, {'y': 2}]},
+            'any': {'1': {'x': 1, 'y': 2}, '2': {'y': 3}},
+        }
+        shape = {'keep': ('x', 'z'), 'any': {'*': ('y',)}}
+        for chunk_size in (1, 3, 1024):
+            self.assertEqual(JsonStream(stream(data), chunk_size).read(shape), {
+                'keep': {'x': 1, 'z': {'deep': [1]}}, 'any': {'1': {'y': 2}, '2': {'y': 3}},
+            })
+
+    def test_empty(self):
+        """ empty object and api empty list instead of object """
+        self.assertEqual(load_compact(stream({}), 'watched'), {})
+        self.assertEqual(load_compact(stream([]), 'watched'), [])
+
+    def test_bad_json(self):
+        """ truncated json is an error """
+        with self.assertRaises(json.JSONDecodeError):
+            JsonStream(io.BytesIO(b'{"a": [1, 2'), 4).read(True)
+
+    def test_episodes(self):
+        """ episodes data keeps show fields and used episode fields """
+        data = {
+            'id': 1, 'title': 'Show', 'status': 'Ended', 'image': 'x.jpg',
+            'episodes': {'10': {
+                'id': 10, 'title': 'Ep', 'seasonNumber': 1, 'episodeNumber': 2,
+                'sequenceNumber': 2, 'airDate': '01.02.2020', 'image': 'y.jpg',
+                'shortName': 's01e02', 'commentsCount': 5,
+            }},
+        }
+        compact = load_compact(stream(data), 'episodes')
+        self.assertNotIn('image', compact)
+        self.assertEqual(compact['status'], 'Ended')
+        self.assertEqual(set(compact['episodes']['10']), {
+            'id', 'title', 'shortName', 'seasonNumber', 'episodeNumber', 'sequenceNumber',
+            'airDate',
+        })
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# vim: ts=4 sw=4
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+""" tests of compact show models """
+
+import datetime
+import json
+import unittest
+
+from myshows_model import (
+    AirIndex, EpisodeList, WatchArchive, WatchHistory, by_month, by_weekday, episode_numbers,
+    episodes_by_spec, parse_ordinal
+)
+
+
+def episodes_data(seasons, per_season):
+    """ return episodes data of show with seasons of per_season episodes, ids 100, 101... """
+    episodes = {}
+    for season in range(1, seasons + 1):
+        for episode in range(1, per_season + 1):
+            sequence = (season - 1) * per_season + episode
+            episodes[str(99 + sequence)] = {
+                'id': 99 + sequence, 'title': f'Ep {sequence}',
+                'seasonNumber': season, 'episodeNumber': episode,
+                'sequenceNumber': sequence, 'airDate': None,
+            }
+    return {'title': 'Show', 'episodes': episodes}
+
+
+class EpisodesBySpecTest(unittest.TestCase):
+    """ check/uncheck episode specs """
+    def setUp(self):
+        self.numbers = episode_numbers(episodes_data(3, 4)['episodes'])
+
+    def test_episode(self):
+        """ one episode, missing one """
+        self.assertEqual(episodes_by_spec(self.numbers, 'S02E03'), ['106'])
+        self.assertEqual(episodes_by_spec(self.numbers, 's02e09'), [])
+
+    def test_season(self):
+        """ whole season """
+        self.assertEqual(episodes_by_spec(self.numbers, 's03'), ['108', '109', '110', '111'])
+        self.assertEqual(episodes_by_spec(self.numbers, 's04'), [])
+
+    def test_range(self):
+        """ range across seasons, in episode order """
+        self.assertEqual(
+            episodes_by_spec(self.numbers, 's01e03-s02e02'), ['102', '103', '104', '105']
+        )
+        self.assertEqual(episodes_by_spec(self.numbers, 's02e02-s01e03'), [])
+
+    def test_bad_spec(self):
+        """ bad format """
+        for spec in ('e01', 's01e', 's1e2-', 's001e01', 'all'):
+            self.assertIsNone(episodes_by_spec(self.numbers, spec), spec)
+
+
+class EpisodeListTest(unittest.TestCase):
+    """ last watched and first unwatched by sequence number """
+    def setUp(self):
+        epis = episodes_data(2, 3)
+        # specials have sequence number 0
+        epis['episodes']['200'] = dict(
+            epis['episodes']['100'], id=200, seasonNumber=0, sequenceNumber=0
+        )
+        self.episodes = EpisodeList(epis)
+
+    def test_order(self):
+        """ ids are sorted by sequence number """
+        self.assertEqual(self.episodes.ids, ['200', '100', '101', '102', '103', '104', '105'])
+
+    def test_last_of(self):
+        """ the latest watched, specials and unknown ids are ignored """
+        self.assertEqual(self.episodes.last_of(['101', '103', '100']), '103')
+        self.assertIsNone(self.episodes.last_of(['200', '999']))
+        self.assertIsNone(self.episodes.last_of([]))
+
+    def test_first_unwatched(self):
+        """ episode after the latest watched, not the first gap """
+        self.assertEqual(self.episodes.first_unwatched([]), '100')
+        self.assertEqual(self.episodes.first_unwatched(['100', '102']), '103')
+        self.assertIsNone(self.episodes.first_unwatched(['105']))
+
+
+class WatchHistoryTest(unittest.TestCase):
+    """ watched episodes by watch date """
+    def test_between(self):
+        """ date range is inclusive, bad dates are kept aside """
+        history = WatchHistory({
+            '1': {'id': 1, 'watchDate': '03.01.2020'},
+            '2': {'id': 2, 'watchDate': '01.01.2020'},
+            '3': {'id': 3, 'watchDate': '02.01.2020'},
+            '4': {'id': 4, 'watchDate': 'yesterday'},
+        })
+        self.assertEqual(history.ids, ['2', '3', '1'])
+        self.assertEqual(history.bad_dates, ['yesterday'])
+        first = parse_ordinal('02.01.2020')
+        self.assertEqual(
+            history.between(first, first + 1), [('3', first), ('1', first + 1)]
+        )
+        self.assertEqual(history.between(first + 2, first + 9), [])
+
+    def test_parse_ordinal(self):
+        """ dd.mm.yyyy dates only """
+        self.assertEqual(parse_ordinal('29.02.2020'), 737484)
+        for date_str in ('30.02.2020', '2020-02-01', '', None):
+            self.assertIsNone(parse_ordinal(date_str), date_str)
+
+
+class WatchArchiveTest(unittest.TestCase):
+    """ watch date counts of all shows """
+    def setUp(self):
+        # 2020-01-06 is Monday
+        self.monday = datetime.date(2020, 1, 6).toordinal()
+        day = self.monday
+        self.archive = WatchArchive({
+            '10': [day, day, day + 1, day + 30],
+            '20': [day - 1, day + 1],
+            '30': [],
+        })
+
+    def test_count(self):
+        """ range is inclusive at both ends """
+        day = self.monday
+        self.assertEqual(self.archive.count(day, day + 1), 4)
+        self.assertEqual(self.archive.count(day - 9, day + 99), 6)
+        self.assertEqual(self.archive.count(day + 2, day + 29), 0)
+
+    def test_by_show(self):
+        """ shows watched in range with their counts and first and last dates """
+        day = self.monday
+        self.assertEqual(self.archive.by_show(day, day + 30), {
+            '10': (4, day, day + 30), '20': (1, day + 1, day + 1),
+        })
+        self.assertEqual(self.archive.by_show(day + 2, day + 29), {})
+
+    def test_histograms(self):
+        """ counts per day, weekday and month """
+        day = self.monday
+        days = self.archive.by_day(day - 1, day + 30)
+        self.assertEqual(days, {day - 1: 1, day: 2, day + 1: 2, day + 30: 1})
+        self.assertEqual(by_weekday(days), [2, 2, 1, 0, 0, 0, 1])
+        self.assertEqual(by_month(days), {(2020, 1): 5, (2020, 2): 1})
+
+
+class AirIndexTest(unittest.TestCase):
+    """ episodes of all shows by air date """
+    def setUp(self):
+        first = episodes_data(1, 3)
+        for epi_id, air_date in (('100', '01.02.2020'), ('101', '08.02.2020')):
+            first['episodes'][epi_id]['airDate'] = air_date
+        second = episodes_data(2, 1)
+        for epi_id, air_date in (('100', '08.02.2020'), ('101', 'soon')):
+            second['episodes'][epi_id]['airDate'] = air_date
+        self.index = AirIndex.build({'20': second, '10': first})
+        self.day = parse_ordinal('08.02.2020')
+
+    def test_build(self):
+        """ episodes are ordered by air date, show and number, undated are left out """
+        self.assertEqual(self.index.ordinals.tolist(), [self.day - 7, self.day, self.day])
+        self.assertEqual(self.index.refs, [
+            ['10', '100', 1, 1, 'Ep 1'], ['10', '101', 1, 2, 'Ep 2'],
+            ['20', '100', 1, 1, 'Ep 1'],
+        ])
+
+    def test_between(self):
+        """ air date range is inclusive """
+        self.assertEqual(
+            [ref[:2] for _, ref in self.index.between(self.day, self.day)],
+            [['10', '101'], ['20', '100']]
+        )
+        self.assertEqual(self.index.between(self.day - 7, self.day - 1), [
+            (self.day - 7, ['10', '100', 1, 1, 'Ep 1']),
+        ])
+        self.assertEqual(self.index.between(self.day + 1, self.day + 99), [])
+
+    def test_json(self):
+        """ index loaded from json answers the same """
+        index = AirIndex.from_json(json.loads(json.dumps(self.index.to_json())))
+        self.assertEqual(
+            index.between(self.day - 99, self.day + 99),
+            self.index.between(self.day - 99, self.day + 99)
+        )
+        self.assertEqual(AirIndex.build({}).between(0, self.day), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# vim: ts=4 sw=4
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+""" tests of session commands on loaded data, without requests to api """
+
+import contextlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from myshowsru import MyShowsRu, status_targets
+
+SHOWS = {
+    '10': {
+        'showId': 10, 'title': 'The Office', 'ruTitle': 'Офис',
+        'watchStatus': 'watching', 'watchedEpisodes': 1, 'totalEpisodes': 2,
+    },
+    '20': {
+        'showId': 20, 'title': 'Breaking Bad: El Camino', 'ruTitle': None,
+        'watchStatus': 'later', 'watchedEpisodes': 0, 'totalEpisodes': 1,
+    },
+}
+
+
+def new_session(config=None):
+    """ return session of temporary config with shows loaded """
+    config_dir = tempfile.mkdtemp()
+    config_name = os.path.join(config_dir, 'myshows.cfg')
+    with open(config_name, mode='w', encoding='utf8') as cfg_file:
+        json.dump(dict({
+            'api_domain': 'localhost', 'login': {'name': 'demo', 'md5pass': 'x'},
+            'url': {}, 'alias': {'bb': 'Breaking Bad: El Camino'},
+        }, **(config or {})), cfg_file)
+    myshows = MyShowsRu(config_name)
+    myshows.shows_data = SHOWS
+    myshows.list_loaded_ = True
+    return myshows, config_dir
+
+
+class TitleByAliasTest(unittest.TestCase):
+    """ aliases, fuzzy matching of read commands and exact titles of writes """
+    def setUp(self):
+        self.myshows, config_dir = new_session()
+        self.addCleanup(shutil.rmtree, config_dir, True)
+
+    def test_alias(self):
+        """ alias is case insensitive """
+        self.assertEqual(self.myshows.title_by_alias('BB'), 'Breaking Bad: El Camino')
+
+    def test_fuzzy(self):
+        """ unknown alias of read command is matched to user show """
+        self.assertEqual(self.myshows.title_by_alias('The Offic'), 'The Office')
+
+    def test_not_fuzzy(self):
+        """ unknown alias of write command is tried as title """
+        self.assertEqual(
+            self.myshows.title_by_alias('The Offer', no_exit=True, fuzzy=False), 'The Offer'
+        )
+
+    def test_status_search(self):
+        """ status without --fuzzy searches the given title """
+        with mock.patch.object(self.myshows.api, 'search', return_value={}) as search:
+            self.assertEqual(status_targets(self.myshows, 'The Offer', None), [])
+        search.assert_called_once_with('The Offer')
+
+    def test_status_fuzzy(self):
+        """ status with --fuzzy takes user show without search """
+        with mock.patch.object(self.myshows.api, 'search') as search:
+            self.assertEqual(
+                status_targets(self.myshows, 'the ofice', -1), [('10', 'The Office')]
+            )
+        search.assert_not_called()
+
+
+class OutputOrderTest(unittest.TestCase):
+    """ warnings keep their place among lines printed directly """
+    def setUp(self):
+        self.myshows, config_dir = new_session()
+        self.addCleanup(shutil.rmtree, config_dir, True)
+
+    def test_unknown_list(self):
+        """ unknown alias warning comes before unknown title error """
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout), self.assertRaises(SystemExit):
+            try:
+                self.myshows.list_shows('nosuch')
+            finally:
+                self.myshows.out.flush()
+        self.assertEqual(stdout.getvalue(), (
+            'Cannot find alias "nosuch", will try it as title!\nUnknown title - nosuch\n'
+        ))
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# vim: ts=4 sw=4
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+""" tests of buffered command output in text, json lines and csv formats """
+
+import contextlib
+import io
+import json
+import threading
+import unittest
+
+from myshows_output import Output, ThreadStdout
+
+RECORD = {'show': 'The Bench', 'season': 1, 'episode': 2}
+
+
+class OutputTest(unittest.TestCase):
+    """ Output formats, buffering and warnings """
+    def run_output(self, fmt, account=None):
+        """ write lines of every kind, return (stdout, stderr) """
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            out = Output(fmt, account)
+            out.text('Shows:')
+            out.record(RECORD, 'The Bench s01e02')
+            out.message('Unknown alias')
+            out.record(dict(RECORD, episode=3), 'The Bench s01e03')
+            out.flush()
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_text(self):
+        """ text lines and warnings in order """
+        self.assertEqual(
+            self.run_output('text'),
+            ('Shows:\nThe Bench s01e02\nUnknown alias\nThe Bench s01e03\n', '')
+        )
+
+    def test_jsonl(self):
+        """ records as json lines with account, warnings to stderr """
+        stdout, stderr = self.run_output('jsonl', 'a.cfg')
+        self.assertEqual(
+            [json.loads(line) for line in stdout.splitlines()],
+            [{'account': 'a.cfg', **RECORD}, {'account': 'a.cfg', **RECORD, 'episode': 3}]
+        )
+        self.assertEqual(stderr, 'Unknown alias\n')
+
+    def test_csv(self):
+        """ records as csv rows under one header """
+        stdout, stderr = self.run_output('csv')
+        self.assertEqual(
+            stdout.splitlines(), ['show,season,episode', 'The Bench,1,2', 'The Bench,1,3']
+        )
+        self.assertEqual(stderr, 'Unknown alias\n')
+
+    def test_buffered(self):
+        """ lines are kept until buffer is full or flushed """
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            out = Output(buffer_size=20)
+            out.text('first line')
+            self.assertEqual(stdout.getvalue(), '')
+            out.text('second line')
+            self.assertEqual(stdout.getvalue(), 'first line\nsecond line\n')
+
+    def test_message_order(self):
+        """ warning is written at once, before lines printed directly after it """
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            out = Output()
+            out.text('Shows:')
+            out.message('Cannot find alias "nosuch"')
+            print('Unknown title - nosuch')
+            out.flush()
+        self.assertEqual(
+            stdout.getvalue(), 'Shows:\nCannot find alias "nosuch"\nUnknown title - nosuch\n'
+        )
+
+
+class ThreadStdoutTest(unittest.TestCase):
+    """ per thread stdout of batch runs """
+    def test_redirect(self):
+        """ thread writes to its stream, others to default one """
+        default, own = io.StringIO(), io.StringIO()
+        stdout = ThreadStdout(default)
+
+        def write():
+            stdout.redirect(own)
+            stdout.write('thread\n')
+            stdout.redirect(None)
+            stdout.write('default\n')
+        thread = threading.Thread(target=write)
+        thread.start()
+        thread.join()
+        stdout.write('main\n')
+        self.assertEqual(own.getvalue(), 'thread\n')
+        self.assertEqual(default.getvalue(), 'default\nmain\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# vim: ts=4 sw=4
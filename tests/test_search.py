@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+""" tests of search result cache and shows catalog """
+
+import shutil
+import tempfile
+import time
+import unittest
+
+from myshows_cache import DiskCache
+from myshows_search import SearchCache
+
+BENCH = {'100': {'id': 100, 'title': 'The Bench', 'ruTitle': 'Скамейка', 'year': 2010}}
+BAD = {'200': {'id': 200, 'title': 'Breaking Bad', 'ruTitle': None, 'year': 2008}}
+
+
+class SearchCacheTest(unittest.TestCase):
+    """ SearchCache lookups, LRU eviction and ttl """
+    def test_normalized_query(self):
+        """ query differing in case, spaces and punctuation is the same query """
+        search = SearchCache()
+        search.put('The Bench', BENCH)
+        self.assertEqual(search.get('  the   bench!'), BENCH)
+        self.assertIsNone(search.get('the'))
+
+    def test_empty_result(self):
+        """ empty search result is cached too """
+        search = SearchCache()
+        search.put('nothing', {})
+        self.assertEqual(search.get('nothing'), {})
+
+    def test_lru(self):
+        """ least recently used query is evicted """
+        search = SearchCache(size=2)
+        search.put('bench', BENCH)
+        search.put('bad', BAD)
+        self.assertEqual(search.get('bench'), BENCH)
+        search.put('none', {})
+        self.assertEqual(search.get('bench'), BENCH)
+        self.assertIsNone(search.get('bad'))
+        self.assertEqual(search.get('none'), {})
+
+    def test_ttl(self):
+        """ result older than ttl is not used """
+        search = SearchCache(ttl=60)
+        search.put('bench', BENCH)
+        search.queries['bench'][0] = time.time() - 30
+        self.assertEqual(search.get('bench'), BENCH)
+        search.queries['bench'][0] = time.time() - 60
+        self.assertIsNone(search.get('bench'))
+
+    def test_catalog(self):
+        """ shows of results are kept once, later results update them """
+        search = SearchCache()
+        search.put('bench', BENCH)
+        search.put('the bench', {'100': {'year': 2011}})
+        self.assertEqual(search.get('bench')['100']['year'], 2011)
+        self.assertEqual(search.get('bench')['100']['title'], 'The Bench')
+
+
+class SearchCatalogTest(unittest.TestCase):
+    """ SearchCache kept in disk cache, profile shows in catalog """
+    def setUp(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir, True)
+        self.disk_cache = DiskCache(cache_dir)
+
+    def test_persisted(self):
+        """ new cache over the same disk cache answers stored queries """
+        SearchCache(self.disk_cache).put('bench', BENCH)
+        self.assertEqual(SearchCache(self.disk_cache).get('bench'), BENCH)
+
+    def test_add_profile(self):
+        """ profile listing updates titles of catalog shows, keeps other fields """
+        search = SearchCache(self.disk_cache)
+        search.put('bench', BENCH)
+        search.add_profile({'100': {
+            'showId': 100, 'title': 'Bench', 'ruTitle': 'Скамейка',
+            'watchStatus': 'watching',
+        }})
+        show = SearchCache(self.disk_cache).get('bench')['100']
+        self.assertEqual(show['title'], 'Bench')
+        self.assertEqual(show['year'], 2010)
+        self.assertNotIn('watchStatus', show)
+
+    def test_add_profile_unchanged(self):
+        """ catalog is not stored again if profile changed nothing """
+        search = SearchCache(self.disk_cache)
+        search.add_profile({'200': {'showId': 200, 'title': 'Breaking Bad'}})
+        stored = self.disk_cache.get('catalog', 'shows')['stored']
+        search.add_profile({'200': {'showId': 200, 'title': 'Breaking Bad'}})
+        self.assertEqual(self.disk_cache.get('catalog', 'shows')['stored'], stored)
+        self.assertEqual(search.catalog['200']['id'], 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# vim: ts=4 sw=4
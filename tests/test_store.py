@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+""" tests of local sqlite store: queries of --offline match in-memory models """
+
+import datetime
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from myshows_model import AirIndex, EpisodeList, WatchArchive, WatchHistory
+from myshows_store import LocalStore
+
+FIRST_DAY = datetime.date(2020, 1, 1).toordinal()
+
+
+def user_data(shows=6, seed=7):
+    """ return random (shows data, episodes data, watched data): shows of a few
+        seasons with specials, undated episodes, bad watch dates and no watched
+    """
+    rnd = random.Random(seed)
+    shows_data, episodes_data, watched_data = {}, {}, {}
+    epi_id = 1000
+    for show in range(1, shows + 1):
+        show_id = str(show)
+        episodes = {}
+        for sequence in range(rnd.randint(0, 1) - 1, rnd.randint(5, 25)):
+            epi_id += 1
+            air_ordinal = FIRST_DAY + rnd.randint(0, 90)
+            episodes[str(epi_id)] = {
+                'id': epi_id, 'title': f'Ep {sequence}',
+                'shortName': f's01e{sequence:02d}',
+                'seasonNumber': 0 if sequence < 1 else sequence // 10 + 1,
+                'episodeNumber': sequence % 10, 'sequenceNumber': max(sequence, 0),
+                'airDate': None if rnd.random() < 0.1 else
+                datetime.date.fromordinal(air_ordinal).strftime('%d.%m.%Y'),
+            }
+        watched = {}
+        for watched_id in rnd.sample(sorted(episodes), rnd.randint(0, len(episodes))):
+            watch_date = datetime.date.fromordinal(FIRST_DAY + rnd.randint(0, 90))
+            watched[watched_id] = {
+                'id': int(watched_id),
+                'watchDate': 'yesterday' if rnd.random() < 0.05 else
+                watch_date.strftime('%d.%m.%Y'),
+            }
+        shows_data[show_id] = {
+            'showId': show, 'title': f'Show {shows - show}', 'ruTitle': None,
+            'watchStatus': 'watching', 'watchedEpisodes': len(watched),
+            'totalEpisodes': len(episodes),
+        }
+        episodes_data[show_id] = {'id': show, 'title': f'Show {show}', 'episodes': episodes}
+        # api returns empty list for show without watched episodes
+        watched_data[show_id] = watched or []
+    return shows_data, episodes_data, watched_data
+
+
+class LocalStoreTest(unittest.TestCase):
+    """ LocalStore data and queries """
+    def setUp(self):
+        store_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, store_dir, True)
+        self.store = LocalStore(os.path.join(store_dir, 'store.db'))
+        self.addCleanup(self.store.close)
+        self.shows_data, self.episodes_data, self.watched_data = user_data()
+        self.store.replace_all(self.shows_data, self.episodes_data, self.watched_data)
+
+    def ranges(self):
+        """ yield (first, last) ordinals of ranges within and around data """
+        for first in range(FIRST_DAY - 5, FIRST_DAY + 100, 13):
+            for days in (0, 1, 7, 40):
+                yield first, first + days
+
+    def test_round_trip(self):
+        """ stored data is loaded back the same """
+        self.assertEqual(self.store.shows(), self.shows_data)
+        self.assertEqual(
+            [show['showId'] for show in self.store.shows().values()], [6, 5, 4, 3, 2, 1]
+        )
+        for show_id, epis in self.episodes_data.items():
+            self.assertEqual(self.store.episodes(show_id), epis)
+            self.assertEqual(self.store.watched(show_id), self.watched_data[show_id] or {})
+        self.assertIsNone(self.store.episodes('7'))
+
+    def test_replace(self):
+        """ data of the next sync replaces the stored one """
+        shows_data, episodes_data, watched_data = user_data(2, seed=8)
+        self.store.replace_all(shows_data, episodes_data, watched_data)
+        self.assertEqual(self.store.shows(), shows_data)
+        self.assertEqual(self.store.episodes('2'), episodes_data['2'])
+        self.assertIsNone(self.store.episodes('3'))
+        self.assertEqual(self.store.watched('3'), {})
+
+    def test_first_unwatched(self):
+        """ the same episode as EpisodeList.first_unwatched """
+        for show_id, epis in self.episodes_data.items():
+            self.assertEqual(
+                self.store.first_unwatched(show_id),
+                EpisodeList(epis).first_unwatched(self.watched_data[show_id]), show_id
+            )
+
+    def test_shows_watched_between(self):
+        """ the same shows as WatchHistory.between """
+        histories = {
+            show_id: WatchHistory(watched or {})
+            for show_id, watched in self.watched_data.items()
+        }
+        for first, last in self.ranges():
+            self.assertEqual(self.store.shows_watched_between(first, last), {
+                show_id for show_id, history in histories.items()
+                if history.between(first, last)
+            }, (first, last))
+
+    def test_watch_ordinals(self):
+        """ the same archive as of WatchHistory ordinals """
+        archive = WatchArchive(self.store.watch_ordinals())
+        expected = WatchArchive({
+            show_id: WatchHistory(watched).ordinals
+            for show_id, watched in sorted(self.watched_data.items()) if watched
+        })
+        for first, last in self.ranges():
+            self.assertEqual(
+                archive.by_show(first, last), expected.by_show(first, last), (first, last)
+            )
+            self.assertEqual(archive.by_day(first, last), expected.by_day(first, last))
+
+    def test_episodes_airing(self):
+        """ the same episodes in the same order as AirIndex.between """
+        index = AirIndex.build(self.episodes_data)
+        for first, last in self.ranges():
+            self.assertEqual(
+                self.store.episodes_airing(first, last), index.between(first, last),
+                (first, last)
+            )
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# vim: ts=4 sw=4